@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Deterministic generator of synthetic _NewData.zip archives in the layout collect.py produces
+
+Each archive holds one or more pull directories (named %y%m%d%H%M%S) with jenkins, ins, vic, vic_status and cq
+subdirectories, plus a CQ_Data.csv at its root. Consecutive pulls overlap so processing exercises deduplication.
+The same seed and parameters always produce byte-identical archives.
+
+Usage: python -m benchmarks.archive_gen OUT_DIR [--archives N] [--pulls N] [--builds N] ...
+"""
+
+import io
+import csv
+import sys
+import json
+import random
+import zipfile
+import argparse
+import datetime
+from pathlib import Path
+
+JENKINS_STAGES = ['Pipeline', 'Build', 'UnitTest', 'FunctionalTest', 'Deploy']
+RESULTS = ['SUCCESS'] * 8 + ['FAILURE', 'UNSTABLE']
+STEP_RESULTS = ['passed'] * 18 + ['failed', 'skipped']
+CAUSES = ['Started by timer (nightly)', 'Started by user admin', 'Self service deploy', 'Weekly full build']
+CQ_STATES = ['Submitted', 'Assigned', 'Opened', 'Resolved', 'Closed']
+CQ_FIELDS = ['headline', 'state', 'severity', 'owner', 'ci']
+
+DEFAULTS = {
+    'archives': 2,
+    'pulls': 2,
+    'cis': 4,
+    'builds': 50,
+    'overlap': 0.25,
+    'ft_reports': 2,
+    'ft_features': 5,
+    'ft_scenarios': 10,
+    'ft_steps': 5,
+    'ins_pipelines': 3,
+    'ins_stages': 8,
+    'vic_builds': 20,
+    'vic_cis': 10,
+    'drs': 500,
+    'dr_changes': 0.2,
+    'changed_files': 3,
+    'seed': 0,
+    'start': '19-01-07T00-00-00'
+}
+
+ZIP_DATE_TIME = (2019, 1, 1, 0, 0, 0)
+
+
+class ArchiveGenerator:
+    """
+    Generates synthetic new data archives. Parameters not passed use DEFAULTS.
+    """
+    def __init__(self, **params):
+        unknown = set(params) - set(DEFAULTS)
+        if unknown:
+            raise ValueError('Unknown archive parameters: {0}'.format(', '.join(sorted(unknown))))
+
+        self.params = dict(DEFAULTS)
+        self.params.update(params)
+
+        self.rng = random.Random(self.params['seed'])
+        self.start = datetime.datetime.strptime(self.params['start'], '%y-%m-%dT%H-%M-%S')
+        self.start = self.start.replace(tzinfo=datetime.timezone.utc)
+
+        self.cis = ['ci{0}'.format(i) for i in range(self.params['cis'])]
+        self.pull_index = 0
+        self.dr_versions = {}
+
+        # number of raw events written per source, for computing throughput
+        self.counts = {'jenkins': 0, 'ins': 0, 'vic': 0, 'vic_status': 0, 'cq': 0, 'cq_old': 0}
+
+    def generate(self, out_dir, first_archive=0, num_archives=None):
+        """
+        Write archives to a directory.
+        :param out_dir: Path to the directory to write archives to (usually util.collected_dir)
+        :param first_archive: index of the first archive, so several batches can continue one timeline
+        :param num_archives: number of archives to write; defaults to the archives parameter
+        :return: list of archive paths
+        """
+        if num_archives is None:
+            num_archives = self.params['archives']
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        paths = []
+        for i in range(first_archive, first_archive + num_archives):
+            archive_time = self.start + datetime.timedelta(days=i)
+            path = out_dir / '{0}_NewData.zip'.format(archive_time.strftime('%y-%m-%dT%H-%M-%S'))
+            self.write_archive(path, archive_time)
+            paths.append(path)
+
+        return paths
+
+    def write_archive(self, path, archive_time):
+        """
+        Write a single archive.
+        :param path: path to the zip file
+        :param archive_time: datetime the archive was collected
+        """
+        with zipfile.ZipFile(str(path), 'w', zipfile.ZIP_DEFLATED) as archive:
+            for pull in range(self.params['pulls']):
+                pull_time = archive_time + datetime.timedelta(hours=pull)
+                pull_dir = pull_time.strftime('%y%m%d%H%M%S')
+
+                for name, content in self.gen_pull(pull_time):
+                    self._write(archive, '{0}/{1}'.format(pull_dir, name), content)
+
+                self.pull_index += 1
+
+            self._write(archive, 'CQ_Data.csv', self.gen_cq_data(archive_time))
+
+    @staticmethod
+    def _write(archive, name, content):
+        info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        archive.writestr(info, content)
+
+    def _build_range(self, builds):
+        """
+        Get the build numbers included in the current pull. Each pull repeats the last builds of the previous one.
+        :param builds: number of builds per pull
+        :return: range of build numbers
+        """
+        overlap = int(builds * self.params['overlap'])
+        first = self.pull_index * (builds - overlap) + 1
+        return range(first, first + builds)
+
+    def _build_time(self, number):
+        return int((self.start + datetime.timedelta(minutes=10 * number)).timestamp() * 1000)
+
+    def gen_pull(self, pull_time):
+        """
+        Generate the files of one pull directory.
+        :param pull_time: datetime of the pull
+        :return: list of (relative path, content) pairs
+        """
+        files = []
+
+        for ci in self.cis:
+            for stage in JENKINS_STAGES:
+                events = [self.gen_jenkins_event(ci, stage, number) for number in self._build_range(self.params['builds'])]
+                files.append(('jenkins/Production_{0}_{1}.json'.format(ci, stage), self._json_lines(events)))
+                self.counts['jenkins'] += len(events)
+
+        for i in range(self.params['ins_pipelines']):
+            pipeline = 'pipeline{0}'.format(i)
+            events = [self.gen_ins_event(pipeline, number) for number in self._build_range(self.params['builds'])]
+            files.append(('ins/{0}_develop.json'.format(pipeline), self._json_lines(events)))
+            self.counts['ins'] += len(events)
+
+        events = [self.gen_vic_event(number) for number in self._build_range(self.params['vic_builds'])]
+        files.append(('vic/Production_AWS-VIC-Manager.json', self._json_lines(events)))
+        self.counts['vic'] += len(events)
+
+        statuses = self.gen_vic_status(pull_time)
+        files.append(('vic_status/vic_status.json', json.dumps(statuses) + '\n'))
+        self.counts['vic_status'] += len(statuses)
+
+        files.append(('cq/added_modified.csv', self.gen_cq_added_modified(pull_time)))
+
+        return files
+
+    @staticmethod
+    def _json_lines(events):
+        return ''.join(json.dumps(event) + '\n' for event in events)
+
+    @staticmethod
+    def _parameters_action(parameters):
+        return {
+            '_class': 'hudson.model.ParametersAction',
+            'parameters': [{'name': name, 'value': value} for name, value in parameters.items()]
+        }
+
+    def gen_jenkins_event(self, ci, stage, number):
+        """
+        Generate a raw Jenkins build as written by export_jenkins.py.
+        :param ci: CI name
+        :param stage: pipeline stage
+        :param number: build number
+        :return: the event
+        """
+        rng = random.Random('{0}:{1}:{2}:{3}'.format(self.params['seed'], ci, stage, number))
+        release = '1.{0}.{1}.0'.format(number // 100, number // 10 % 10)
+        job = '{0}_{1}'.format(ci, stage)
+
+        event = {
+            'id': str(number),
+            'ci': ci,
+            'ss': 'ss{0}'.format(self.cis.index(ci) % 3),
+            'duration': rng.randint(1000, 3600000),
+            'result': rng.choice(RESULTS),
+            'number': number,
+            'timestamp': self._build_time(number),
+            'stage': stage,
+            'instance': 'Production',
+            'url': 'https://jenkins.example.com/job/{0}/{1}/'.format(job, number),
+            'fullDisplayName': '{0} #{1}'.format(job, number),
+            'cause': rng.choice(CAUSES),
+            'building': False,
+            'actions': [
+                self._parameters_action({'BASELINE_VERSION': release, 'TARGET_ENV': 'aws'}),
+                {'_class': 'hudson.model.CauseAction', 'causes': [{'_class': 'hudson.model.Cause$UserIdCause'}]}
+            ]
+        }
+
+        if stage == 'UnitTest':
+            fail_count = rng.randint(0, 5)
+            skip_count = rng.randint(0, 10)
+            event['report'] = {'failCount': fail_count, 'skipCount': skip_count, 'passCount': rng.randint(100, 1000)}
+        elif stage == 'FunctionalTest':
+            event['reports'] = self.gen_ft_reports(rng)
+
+        return event
+
+    def gen_ft_reports(self, rng):
+        """
+        Generate the cucumber JSON reports of a functional test build.
+        :param rng: random generator seeded for the build
+        :return: reports keyed by artifact path
+        """
+        reports = {}
+
+        for r in range(self.params['ft_reports']):
+            features = []
+
+            for f in range(self.params['ft_features']):
+                elements = [{'type': 'background', 'name': 'setup', 'steps': [{'result': {'status': 'passed'}}]}]
+
+                for s in range(self.params['ft_scenarios']):
+                    elements.append({
+                        'type': 'scenario',
+                        'id': 'feature-{0};scenario-{1}'.format(f, s),
+                        'name': 'Scenario {0}'.format(s),
+                        'tags': [{'name': '@tag{0}'.format(s % 4)}],
+                        'steps': [{'name': 'step', 'result': {'status': rng.choice(STEP_RESULTS), 'duration': 1000}}
+                                  for _ in range(self.params['ft_steps'])]
+                    })
+
+                features.append({
+                    'id': 'report-{0}-feature-{1}'.format(r, f),
+                    'name': 'Feature {0}'.format(f),
+                    'tags': ['@feature{0}'.format(f % 3)],
+                    'elements': elements
+                })
+
+            reports['artifact/target/cucumber{0}.json'.format(r)] = features
+
+        return reports
+
+    def gen_ins_event(self, pipeline, number):
+        """
+        Generate a raw INS pipeline run.
+        :param pipeline: pipeline name
+        :param number: run number
+        :return: the event
+        """
+        rng = random.Random('{0}:{1}:{2}'.format(self.params['seed'], pipeline, number))
+
+        stages = []
+        for i in range(self.params['ins_stages']):
+            stages.append({
+                'id': str(i),
+                'name': 'stage{0}'.format(i),
+                'status': rng.choice(RESULTS),
+                'durationMillis': rng.randint(1000, 600000),
+                'stageFlowNodes': [{'id': str(j), 'name': 'step{0}'.format(j)} for j in range(3)]
+            })
+
+        return {
+            'id': str(number),
+            'pipeline': pipeline,
+            'branch': 'develop',
+            'timestamp': self._build_time(number),
+            'status': rng.choice(RESULTS),
+            'durationMillis': sum(stage['durationMillis'] for stage in stages),
+            'stages': stages
+        }
+
+    def gen_vic_event(self, number):
+        """
+        Generate a raw AWS-VIC-Manager build.
+        :param number: build number
+        :return: the event
+        """
+        rng = random.Random('{0}:vic:{1}'.format(self.params['seed'], number))
+        vic_ci = rng.choice(self.cis)
+
+        return {
+            'id': str(number),
+            'number': number,
+            'timestamp': self._build_time(number),
+            'result': rng.choice(RESULTS),
+            'duration': rng.randint(1000, 600000),
+            'building': False,
+            'vic_number': rng.randint(1, self.params['vic_cis']),
+            'vic_ci': vic_ci,
+            'artifacts': [],
+            'actions': [self._parameters_action({'ASSIGNED_CI': vic_ci, 'ACTION': 'allocate'})]
+        }
+
+    def gen_vic_status(self, pull_time):
+        """
+        Generate the VIC allocation status snapshot of a pull.
+        :param pull_time: datetime of the pull
+        :return: list of allocations
+        """
+        timestamp = pull_time.timestamp()
+        return [{'ci_allocation': 'vic{0}:{1}'.format(i, self.rng.choice(self.cis)), 'timestamp': timestamp}
+                for i in range(self.params['vic_cis'])]
+
+    def _gen_dr(self, dr_id):
+        version = self.dr_versions.get(dr_id, 0)
+        rng = random.Random('{0}:{1}:{2}'.format(self.params['seed'], dr_id, version))
+        return {
+            'id': dr_id,
+            'headline': 'Problem {0} revision {1}'.format(dr_id, version),
+            'state': CQ_STATES[min(version, len(CQ_STATES) - 1)],
+            'severity': str(rng.randint(1, 4)),
+            'owner': 'user{0}'.format(rng.randint(0, 20)),
+            'ci': rng.choice(self.cis)
+        }
+
+    def _changed_drs(self):
+        """
+        Pick the DRs that change in this pull: new DRs until the configured count is reached, then modifications.
+        :return: list of DR IDs
+        """
+        num_changes = max(1, int(self.params['drs'] * self.params['dr_changes']))
+        dr_ids = []
+
+        for _ in range(num_changes):
+            if len(self.dr_versions) < self.params['drs']:
+                dr_id = 'DR{0:08d}'.format(len(self.dr_versions))
+                self.dr_versions[dr_id] = 0
+            else:
+                dr_id = 'DR{0:08d}'.format(self.rng.randrange(self.params['drs']))
+                self.dr_versions[dr_id] += 1
+
+            dr_ids.append(dr_id)
+
+        return dr_ids
+
+    def gen_cq_added_modified(self, pull_time):
+        """
+        Generate the added_modified.csv of a pull.
+        :param pull_time: datetime of the pull
+        :return: CSV content
+        """
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=['id'] + CQ_FIELDS + ['history.action_timestamp'],
+                                lineterminator='\n')
+        writer.writeheader()
+
+        for dr_id in self._changed_drs():
+            row = self._gen_dr(dr_id)
+            row['history.action_timestamp'] = pull_time.strftime('%Y-%m-%d %H:%M:%S')
+            writer.writerow(row)
+            self.counts['cq'] += 1
+
+        return output.getvalue()
+
+    def gen_cq_data(self, archive_time):
+        """
+        Generate the full CQ_Data.csv export of an archive, one row per (DR, changed file).
+        :param archive_time: datetime the archive was collected
+        :return: CSV content
+        """
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=['id'] + CQ_FIELDS + ['RTCC_ChangeSet.FileList.Filename'],
+                                lineterminator='\n')
+        writer.writeheader()
+
+        for dr_id in sorted(self.dr_versions):
+            row = self._gen_dr(dr_id)
+            version = self.dr_versions[dr_id]
+
+            for i in range(self.params['changed_files']):
+                row['RTCC_ChangeSet.FileList.Filename'] = 'src/{0}/file{1}_{2}.c'.format(dr_id, version, i)
+                writer.writerow(row)
+                self.counts['cq_old'] += 1
+
+        return output.getvalue()
+
+
+def add_arguments(parser):
+    """
+    Add an argparse option for every generator parameter.
+    :param parser: the argparse parser
+    """
+    for name, default in DEFAULTS.items():
+        parser.add_argument('--{0}'.format(name.replace('_', '-')), dest=name, type=type(default), default=default)
+
+
+def get_params(args):
+    """
+    Get generator parameters from parsed arguments.
+    :param args: arguments parsed by a parser passed to add_arguments
+    :return: dict of parameters
+    """
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Generate synthetic PIVT new data archives')
+    parser.add_argument('out_dir')
+    add_arguments(parser)
+    args = parser.parse_args(args)
+
+    generator = ArchiveGenerator(**get_params(args))
+    for path in generator.generate(Path(args.out_dir)):
+        print(path)
+    print(json.dumps(generator.counts))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures peak memory and time of merging new CQ data into existing CQ data (CqSourceOld)
+
+Usage: python -m benchmarks.bench_cq_old [--drs N] [--fields N] [--changed N]
+"""
+
+import sys
+import copy
+import time
+import argparse
+import tracemalloc
+from pivt.process import CqSourceOld
+
+
+def gen_rows(num_drs, num_fields, value='value'):
+    """
+    Generate synthetic CQ rows.
+    :param num_drs: number of DRs
+    :param num_fields: number of fields per DR (besides id)
+    :param value: prefix of every field value
+    :return: dict of rows keyed by DR ID
+    """
+    rows = {}
+    for i in range(num_drs):
+        dr_id = 'DR{0:08d}'.format(i)
+        row = {'id': dr_id}
+        for j in range(num_fields):
+            row['field{0}'.format(j)] = '{0}-{1}-{2}'.format(value, i, j)
+        rows[dr_id] = row
+    return rows
+
+
+def legacy_get_updated_data(source):
+    """
+    Reference implementation of CqSourceOld._get_updated_data prior to the overlay view.
+    :param source: the CqSourceOld
+    :return: added, updated, and skipped row counts and the updated data
+    """
+    added_rows = 0
+    updated_rows = 0
+    skipped_rows = 0
+
+    updated_data = copy.deepcopy(source.orig_data)
+
+    for dr_id, row in source.new_data.items():
+        updated_data[dr_id] = row
+        if dr_id in source.orig_data:
+            if set(row.items()) ^ set(source.orig_data[dr_id].items()):
+                updated_rows += 1
+            else:
+                skipped_rows += 1
+        else:
+            added_rows += 1
+
+    return added_rows, updated_rows, skipped_rows, updated_data
+
+
+def measure(func, source):
+    """
+    Run a merge function and measure it.
+    :param func: function taking a CqSourceOld
+    :param source: the CqSourceOld
+    :return: (counts, peak bytes allocated, wall time in seconds)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    added, updated, skipped, updated_data = func(source)
+    rows = list(updated_data.values())
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (added, updated, skipped, len(rows)), peak, elapsed
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Benchmark CQ (legacy) data merging')
+    parser.add_argument('--drs', type=int, default=50000)
+    parser.add_argument('--fields', type=int, default=40)
+    parser.add_argument('--changed', type=int, default=1000)
+    args = parser.parse_args(args)
+
+    source = CqSourceOld()
+    source.orig_data = gen_rows(args.drs, args.fields)
+    source.orig_row_hashes = {dr_id: CqSourceOld._row_hash(row) for dr_id, row in source.orig_data.items()}
+    source.new_data = gen_rows(args.changed, args.fields, value='changed')
+
+    legacy_counts, legacy_peak, legacy_time = measure(legacy_get_updated_data, source)
+    counts, peak, elapsed = measure(CqSourceOld._get_updated_data, source)
+
+    if counts != legacy_counts:
+        sys.exit('Mismatched results! legacy: {0}, current: {1}'.format(legacy_counts, counts))
+
+    print('DRs: {0}, fields: {1}, changed: {2}'.format(args.drs, args.fields, args.changed))
+    print('legacy:  peak {0:10.1f} KiB, {1:8.3f} s'.format(legacy_peak / 1024, legacy_time))
+    print('overlay: peak {0:10.1f} KiB, {1:8.3f} s'.format(peak / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
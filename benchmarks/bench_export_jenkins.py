@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures JenkinsExporter.main against the local mock Jenkins/Bitbucket server (benchmarks.mock_jenkins)
+
+Every run gets a fresh PIVT_HOME with sources files and export_jenkins settings pointing at the mock server, so
+each run is a full first pull. The exporter runs in a separate process; the server counts requests, bytes and
+how many requests were in flight at once. Concurrency is the mean number of requests in flight over the run
+(total request time / wall time) and busy is the fraction of the run with at least one request in flight.
+
+Usage: python -m benchmarks.bench_export_jenkins [--repeat N] [--output FILE] [mock_jenkins options...]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+from benchmarks import mock_jenkins
+from pivt.util import Utility
+
+CFG_DIR = Path(__file__).resolve().parent.parent / 'cfg'
+
+BITBUCKET_PROJECT = 'PLAT'
+BITBUCKET_REPO = 'platform-config'
+ALL_CORES_FILE = 'AllCores.yml'
+
+
+def write_sources_file(path, header, rows):
+    """
+    Write a fixed-width sources file as read by JenkinsExporter.load_sources_file.
+    :param path: path to the file
+    :param header: list of column names
+    :param rows: list of rows, each a list of values (None for blank)
+    """
+    widths = [max([len(name)] + [len(row[i] or '') for row in rows]) + 2 for i, name in enumerate(header)]
+
+    with path.open('w') as file:
+        file.write(''.join(name.ljust(width) for name, width in zip(header, widths)).rstrip() + '\n')
+        for row in rows:
+            file.write(''.join((value or '').ljust(width) for value, width in zip(row, widths)).rstrip() + '\n')
+
+
+def make_pivt_home(server):
+    """
+    Create a PIVT_HOME configured to export from the mock server.
+    :param server: the MockJenkinsServer
+    :return: Path to the new PIVT_HOME
+    """
+    pivt_home = Path(tempfile.mkdtemp(prefix='pivt_bench_'))
+    etc_dir = pivt_home / 'etc'
+    shutil.copytree(str(CFG_DIR), str(etc_dir))
+
+    local_dir = etc_dir / 'local'
+    local_dir.mkdir(parents=True, exist_ok=True)
+    with (local_dir / 'pivt.conf').open('w') as file:
+        file.write('[export_jenkins]\n')
+        file.write('jenkins_prod_url = {0}/prod\n'.format(server.url))
+        file.write('jenkins_dev_url = {0}/dev\n'.format(server.url))
+        file.write('bitbucket_url = {0}/bitbucket\n'.format(server.url))
+        file.write('bitbucket_ins_project = {0}\n'.format(BITBUCKET_PROJECT))
+        file.write('bitbucket_ins_repo = {0}\n'.format(BITBUCKET_REPO))
+        file.write('ins_all_cores_file = {0}\n'.format(ALL_CORES_FILE))
+
+    product_rows = [['Both', ci, stage, job_name, None] for ci, stage, job_name in server.product_jobs()]
+    write_sources_file(etc_dir / 'product.sources', ['instance', 'ci', 'stage', 'job_name', 'tags'], product_rows)
+    write_sources_file(etc_dir / 'vic.sources', ['job_name'], [[mock_jenkins.VIC_JOB]])
+
+    return pivt_home
+
+
+def run_exporter(pivt_home):
+    """
+    Run JenkinsExporter.main. Meant to run in a fresh process.
+    :param pivt_home: path to PIVT_HOME
+    :return: dict of measurements
+    """
+    os.environ['PIVT_HOME'] = str(pivt_home)
+
+    from pivt.util import util
+    from pivt.export_jenkins import JenkinsExporter
+
+    start = time.perf_counter()
+    exporter = JenkinsExporter()
+    status = exporter.main()
+    wall = time.perf_counter() - start
+
+    files = [path for path in util.new_data_dir.glob('**/*') if path.is_file()]
+    events = 0
+    for path in files:
+        with path.open() as file:
+            events += sum(1 for _ in file)
+
+    return {'wall': wall, 'status': status, 'files': len(files), 'events': events,
+            'bytes_written': sum(path.stat().st_size for path in files)}
+
+
+def run(server):
+    """
+    Export everything from the mock server once.
+    :param server: the running MockJenkinsServer
+    :return: dict of measurements
+    """
+    pivt_home = make_pivt_home(server)
+
+    try:
+        server.reset_stats()
+
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            result = pool.apply(run_exporter, (str(pivt_home),))
+    finally:
+        shutil.rmtree(str(pivt_home), ignore_errors=True)
+
+    stats = dict(server.stats)
+    wall = result['wall']
+
+    result.update({
+        'requests': stats['requests'],
+        'bytes': stats['bytes'],
+        'not_found': stats['not_found'],
+        'endpoints': stats['endpoints'],
+        'requests_per_sec': stats['requests'] / wall if wall else 0.0,
+        'bytes_per_sec': stats['bytes'] / wall if wall else 0.0,
+        'concurrency': stats['request_seconds'] / wall if wall else 0.0,
+        'max_in_flight': stats['max_in_flight'],
+        'busy': stats['busy_seconds'] / wall if wall else 0.0
+    })
+
+    return result
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Benchmark export_jenkins.py against a mock Jenkins server')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    mock_jenkins.add_arguments(parser)
+    args = parser.parse_args(args)
+
+    params = mock_jenkins.get_params(args)
+
+    # use CI names the exporter can map to a subsystem
+    ci_names = sorted(Utility.setup_ci_to_ss())
+
+    runs = []
+    with mock_jenkins.MockJenkinsServer(recordings_dir=args.recordings, ci_names=ci_names, **params) as server:
+        for i in range(args.repeat):
+            result = run(server)
+            runs.append(result)
+
+            print('run {0}: {1:8.3f} s, {2:8.0f} requests/s, {3:8.2f} MiB/s, concurrency {4:.2f} (max {5}), '
+                  'busy {6:.0%}'.format(i + 1, result['wall'], result['requests_per_sec'],
+                                        result['bytes_per_sec'] / 1024 / 1024, result['concurrency'],
+                                        result['max_in_flight'], result['busy']))
+
+    best = min(runs, key=lambda result: result['wall'])
+
+    print('requests: {0}, bytes: {1}, events: {2}, not found: {3}'.format(
+        best['requests'], best['bytes'], best['events'], best['not_found']))
+    for endpoint, count in sorted(best['endpoints'].items()):
+        print('  {0} {1}'.format(endpoint.ljust(12), count))
+
+    if args.output:
+        report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': params,
+            'runs': runs,
+            'best': best
+        }
+
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
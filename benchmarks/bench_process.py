@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures wall time, events/sec, peak RSS and per-phase timings of Processor.main over synthetic archives
+
+Every run gets a fresh PIVT_HOME in a temp directory with the default configuration from cfg/ and a clean child
+process, so peak RSS covers only processing. With --preload N, N archives are processed first (untimed) so the
+measured run starts with existing data and key loading at setup is realistic. Splunk REST calls and dashboard
+updates are skipped.
+
+Phases are exclusive: time spent in FT parsing while cooking Jenkins events counts as ft, not cook.
+
+Usage: python -m benchmarks.bench_process [--repeat N] [--preload N] [--set STANZA.SETTING=VALUE ...]
+                                          [--output FILE] [archive_gen options...]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import functools
+import multiprocessing
+from pathlib import Path
+from unittest import mock
+
+from benchmarks import archive_gen
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CFG_DIR = Path(__file__).resolve().parent.parent / 'cfg'
+
+PHASES = ['setup', 'extract', 'cook', 'ft', 'dedup_write', 'cq', 'finish']
+
+
+class PhaseTimer:
+    """
+    Accumulates exclusive wall time of wrapped methods per phase.
+    """
+    def __init__(self):
+        self.totals = {phase: 0.0 for phase in PHASES}
+        self._stack = []
+        self._patched = []
+
+    def wrap(self, owner, name, phase):
+        """
+        Replace a method of a class with one that times it.
+        :param owner: the class
+        :param name: name of the method
+        :param phase: phase to charge the time to
+        """
+        original = owner.__dict__[name]
+        is_static = isinstance(original, staticmethod)
+        func = original.__func__ if is_static else original
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            self._enter(phase)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit()
+
+        setattr(owner, name, staticmethod(timed) if is_static else timed)
+        self._patched.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+    def _enter(self, phase):
+        self._stack.append([phase, time.perf_counter(), 0.0])
+
+    def _exit(self):
+        phase, start, child_time = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.totals[phase] = self.totals.get(phase, 0.0) + elapsed - child_time
+
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+
+def get_peak_rss():
+    """
+    Get the peak resident set size of this process.
+    :return: bytes, or None if not available on this platform
+    """
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def make_pivt_home(settings):
+    """
+    Create a PIVT_HOME with the default configuration and local overrides.
+    :param settings: dict of 'stanza.setting' to value for etc/local/pivt.conf
+    :return: Path to the new PIVT_HOME
+    """
+    pivt_home = Path(tempfile.mkdtemp(prefix='pivt_bench_'))
+    shutil.copytree(str(CFG_DIR), str(pivt_home / 'etc'))
+
+    if settings:
+        stanzas = {}
+        for key, value in settings.items():
+            stanza, setting = key.split('.', 1)
+            stanzas.setdefault(stanza, []).append('{0} = {1}'.format(setting, value))
+
+        local_dir = pivt_home / 'etc' / 'local'
+        local_dir.mkdir(parents=True, exist_ok=True)
+        with (local_dir / 'pivt.conf').open('w') as file:
+            for stanza, lines in stanzas.items():
+                file.write('[{0}]\n{1}\n\n'.format(stanza, '\n'.join(lines)))
+
+    return pivt_home
+
+
+def run_processor(pivt_home):
+    """
+    Run Processor.main over the archives in a PIVT_HOME's collected directory. Meant to run in a fresh process.
+    :param pivt_home: path to PIVT_HOME
+    :return: dict of measurements
+    """
+    os.environ['PIVT_HOME'] = str(pivt_home)
+
+    from pivt.util import util
+    from pivt import process
+
+    timer = PhaseTimer()
+    timer.wrap(process.JenkinsSource, 'setup', 'setup')
+    timer.wrap(process.ProductSource, 'setup', 'setup')
+    timer.wrap(process.CqSource, 'setup', 'setup')
+    timer.wrap(process.CqSourceOld, 'load_existing_data', 'setup')
+    timer.wrap(process.Archive, '_extract', 'extract')
+    timer.wrap(process.JsonDataFile, 'load_events', 'cook')
+    timer.wrap(process.ProductDataFile, 'load_events', 'cook')
+    timer.wrap(process.FtInfo, 'load_ft_info', 'ft')
+    timer.wrap(process.FtInfo, 'process', 'ft')
+    timer.wrap(process.JsonDataFile, 'process', 'dedup_write')
+    timer.wrap(process.CqSource, 'load_new_data', 'cq')
+    timer.wrap(process.CqSource, 'finish', 'cq')
+    timer.wrap(process.CqSourceOld, 'load_new_data', 'cq')
+    timer.wrap(process.CqSourceOld, 'finish', 'cq')
+    timer.wrap(process.JenkinsSource, 'finish', 'finish')
+    timer.wrap(process.ProductSource, 'finish', 'finish')
+
+    try:
+        with mock.patch.object(util, 'update_dashboards'), \
+                mock.patch.object(process.Processor, 'refresh_app'), \
+                mock.patch.object(process.Processor, 'delete_index'), \
+                mock.patch.object(process.Processor, 'create_index'):
+            start = time.perf_counter()
+            processor = process.Processor([])
+            processor.main()
+            wall = time.perf_counter() - start
+    finally:
+        timer.restore()
+
+    added = {}
+    for name, source in processor.sources.items():
+        if isinstance(source, process.JenkinsSource):
+            added[name] = sum(stats['added'] for stats in source.file_stats.values())
+
+    phases = dict(timer.totals)
+    phases['other'] = max(0.0, wall - sum(timer.totals.values()))
+
+    return {'wall': wall, 'peak_rss': get_peak_rss(), 'phases': phases, 'added': added}
+
+
+def run_isolated(pivt_home):
+    """
+    Run Processor.main in a new process.
+    :param pivt_home: path to PIVT_HOME
+    :return: dict of measurements
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(run_processor, (str(pivt_home),))
+
+
+def run(params, preload, settings, keep=False):
+    """
+    Generate archives into a fresh PIVT_HOME and measure processing them.
+    :param params: archive generator parameters
+    :param preload: number of archives to process before the measured run
+    :param settings: dict of pivt.conf overrides
+    :param keep: if True, leave the PIVT_HOME in place
+    :return: dict of measurements
+    """
+    pivt_home = make_pivt_home(settings)
+    collected_dir = pivt_home / 'var' / 'data' / 'collected'
+
+    try:
+        generator = archive_gen.ArchiveGenerator(**params)
+
+        if preload:
+            generator.generate(collected_dir, num_archives=preload)
+            run_isolated(pivt_home)
+
+        counts_before = dict(generator.counts)
+        paths = generator.generate(collected_dir, first_archive=preload)
+        counts = {name: count - counts_before[name] for name, count in generator.counts.items()}
+        archive_bytes = sum(path.stat().st_size for path in paths)
+
+        result = run_isolated(pivt_home)
+    finally:
+        if keep:
+            print('PIVT_HOME: {0}'.format(pivt_home))
+        else:
+            shutil.rmtree(str(pivt_home), ignore_errors=True)
+
+    result['archive_bytes'] = archive_bytes
+    result['events'] = counts
+    total_events = sum(counts.values())
+    result['events_per_sec'] = total_events / result['wall'] if result['wall'] else 0.0
+
+    return result
+
+
+def parse_settings(parser, values):
+    """
+    Parse --set values.
+    :param parser: the argparse parser, for reporting errors
+    :param values: list of STANZA.SETTING=VALUE strings
+    :return: dict of 'stanza.setting' to value
+    """
+    settings = {}
+    for value in values:
+        key, sep, setting_value = value.partition('=')
+        if not sep or '.' not in key:
+            parser.error('expected STANZA.SETTING=VALUE, got {0}'.format(value))
+        settings[key] = setting_value
+    return settings
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Benchmark process.py over synthetic archives')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--preload', type=int, default=0, help='archives to process before the measured run')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='STANZA.SETTING=VALUE',
+                        help='pivt.conf override, e.g. process.key_index=true')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--keep', action='store_true', help='keep the temp PIVT_HOME of each run')
+    archive_gen.add_arguments(parser)
+    args = parser.parse_args(args)
+
+    params = archive_gen.get_params(args)
+    settings = parse_settings(parser, args.settings)
+
+    runs = []
+    for i in range(args.repeat):
+        result = run(params, args.preload, settings, keep=args.keep)
+        runs.append(result)
+
+        print('run {0}: {1:8.3f} s, {2:10.0f} events/s, peak RSS {3}'.format(
+            i + 1, result['wall'], result['events_per_sec'],
+            '{0:.1f} MiB'.format(result['peak_rss'] / 1024 / 1024) if result['peak_rss'] else 'n/a'))
+
+    best = min(runs, key=lambda result: result['wall'])
+
+    print('events: {0}'.format(sum(best['events'].values())))
+    for phase, seconds in best['phases'].items():
+        print('  {0} {1:8.3f} s'.format(phase.ljust(12), seconds))
+
+    if args.output:
+        report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': params,
+            'preload': args.preload,
+            'settings': settings,
+            'runs': runs,
+            'best': best
+        }
+
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures records/sec of the ttr search command by replaying chunked protocol input through TtrCommand
+
+Input is either a capture recorded by adding record=true to a ttr search (written to
+$SPLUNK_HOME/var/run/splunklib.searchcommands/recordings/TtrCommand-*.input) or synthetic Jenkins-like events.
+
+With --output-only, only the output side is measured: the records ttr would emit are written with RecordWriterV2.
+
+Usage: python -m benchmarks.bench_ttr [--input FILE] [--events N] [--groups N] [--chunk-size N] [--repeat N]
+                                      [--save FILE] [--output-only] [ttr arguments...]
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'splunk-app', 'bin'))
+
+from ttr import TtrCommand
+from splunklib.searchcommands.internals import RecordWriterV2
+
+DEFAULT_TTR_ARGS = ['ttrfield=ttr', 'resultfield=result', 'passvalue=SUCCESS', 'instance', 'ci', 'stage', 'release']
+
+
+def make_chunk(metadata, body=''):
+    """
+    Encode a chunked protocol (SCP v2) chunk.
+    :param metadata: chunk metadata
+    :param body: chunk body
+    :return: the chunk
+    """
+    metadata = json.dumps(metadata)
+    return 'chunked 1.0,{0},{1}\n{2}{3}'.format(len(metadata), len(body), metadata, body)
+
+
+def gen_capture(num_events, num_groups, chunk_size, ttr_args, dispatch_dir):
+    """
+    Generate chunked protocol input of synthetic events in descending time order.
+    :param num_events: number of events
+    :param num_groups: number of instance/ci/stage/release combinations
+    :param chunk_size: events per chunk
+    :param ttr_args: arguments to the ttr command
+    :param dispatch_dir: search dispatch directory
+    :return: the input
+    """
+    rand = random.Random(0)
+
+    groups = [('instance{0}'.format(i % 3), 'ci{0}'.format(i), 'stage{0}'.format(i % 7), 'release{0}'.format(i % 5))
+              for i in range(num_groups)]
+
+    latest_time = 1550000000
+    earliest_time = latest_time - num_events
+
+    getinfo = {
+        'action': 'getinfo',
+        'preview': False,
+        'searchinfo': {
+            'args': ttr_args,
+            'raw_args': ttr_args,
+            'earliest_time': str(earliest_time),
+            'latest_time': str(latest_time),
+            'search': 'ttr',
+            'dispatch_dir': dispatch_dir,
+            'sid': 'bench',
+            'splunk_version': '7.2.0',
+            'app': 'pivt',
+            'owner': 'admin',
+            'username': 'admin',
+            'splunkd_uri': 'https://127.0.0.1:8089',
+            'session_key': '',
+            'maxresultrows': 50000
+        }
+    }
+
+    chunks = [make_chunk(getinfo)]
+
+    for start in range(0, num_events, chunk_size):
+        body = io.StringIO()
+        writer = csv.writer(body, lineterminator='\n')
+        writer.writerow(['_time', 'instance', 'ci', 'stage', 'release', 'number', 'result'])
+
+        for i in range(start, min(start + chunk_size, num_events)):
+            result = 'SUCCESS' if rand.random() < 0.8 else 'FAILURE'
+            writer.writerow([latest_time - i] + list(rand.choice(groups)) + [i, result])
+
+        finished = start + chunk_size >= num_events
+        chunks.append(make_chunk({'action': 'execute', 'finished': finished}, body.getvalue()))
+
+    if not num_events:
+        chunks.append(make_chunk({'action': 'execute', 'finished': True}))
+
+    return ''.join(chunks)
+
+
+def count_records(capture):
+    """
+    Count the records in chunked protocol input.
+    :param capture: the input
+    :return: number of records
+    """
+    num_records = 0
+    ifile = io.StringIO(capture)
+
+    while True:
+        result = TtrCommand._read_chunk(ifile)
+        if not result:
+            return num_records
+
+        metadata, body = result
+        if body:
+            num_records += sum(1 for _ in csv.reader(io.StringIO(body))) - 1
+
+
+def run(capture):
+    """
+    Replay chunked protocol input through a new TtrCommand.
+    :param capture: the input
+    :return: wall time in seconds and output length
+    """
+    ofile = io.StringIO()
+
+    start = time.perf_counter()
+    TtrCommand().process(['ttr.py'], io.StringIO(capture), ofile)
+    elapsed = time.perf_counter() - start
+
+    return elapsed, len(ofile.getvalue())
+
+
+def read_records(capture):
+    """
+    Read the records in chunked protocol input and give them a ttr field, as ttr output would have.
+    :param capture: the input
+    :return: the records
+    """
+    records = []
+    ifile = io.StringIO(capture)
+
+    while True:
+        result = TtrCommand._read_chunk(ifile)
+        if not result:
+            return records
+
+        metadata, body = result
+        if body:
+            for i, record in enumerate(csv.DictReader(io.StringIO(body))):
+                record['ttr'] = float(i) if i % 10 == 0 else None
+                records.append(record)
+
+
+def run_writer(records):
+    """
+    Write records with a new RecordWriterV2.
+    :param records: the records
+    :return: wall time in seconds and output length
+    """
+    ofile = io.StringIO()
+
+    start = time.perf_counter()
+    writer = RecordWriterV2(ofile)
+    writer.write_records(records)
+    writer.flush(finished=True)
+    elapsed = time.perf_counter() - start
+
+    return elapsed, len(ofile.getvalue())
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Benchmark the ttr search command')
+    parser.add_argument('--input', help='captured chunked protocol input to replay')
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--groups', type=int, default=500)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='save the generated input to this file')
+    parser.add_argument('--output-only', action='store_true', help='only measure writing ttr output')
+    parser.add_argument('ttr_args', nargs='*', default=DEFAULT_TTR_ARGS)
+    args = parser.parse_args(args)
+
+    dispatch_dir = tempfile.mkdtemp()
+
+    if args.input:
+        with open(args.input) as file:
+            capture = file.read()
+    else:
+        capture = gen_capture(args.events, args.groups, args.chunk_size, args.ttr_args, dispatch_dir)
+
+        if args.save:
+            with open(args.save, 'w') as file:
+                file.write(capture)
+
+    if args.output_only:
+        records = read_records(capture)
+        num_records = len(records)
+    else:
+        num_records = count_records(capture)
+
+    times = []
+    for _ in range(args.repeat):
+        if args.output_only:
+            elapsed, output_length = run_writer(records)
+        else:
+            elapsed, output_length = run(capture)
+        times.append(elapsed)
+
+    best = min(times)
+    print('records: {0}, runs: {1}'.format(num_records, args.repeat))
+    print('best: {0:8.3f} s, {1:12.0f} records/s'.format(best, num_records / best if best else 0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
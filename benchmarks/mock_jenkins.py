@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Local stand-in for the Jenkins and Bitbucket servers export_jenkins.py pulls from
+
+Serves deterministic synthetic responses for the endpoints JenkinsExporter uses: job and build api/json, wfapi
+runs, stages and node logs, testReport, artifacts (pipeline.properties, pipeline.json, cucumber reports),
+consoleText, and Bitbucket commits and raw files. Jenkins instances are mounted at /prod and /dev and Bitbucket at
+/bitbucket. Responses found in a recordings directory take precedence, so captures of real responses can be
+replayed; a recording's file name is the request path and query, URL-quoted (urllib.parse.quote(path, safe='')).
+
+Every response can be delayed (--latency, --jitter) and padded (--padding) to model a slow or verbose server.
+
+Usage: python -m benchmarks.mock_jenkins [--port N] [--builds N] [--latency SECONDS] [--padding BYTES] ...
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs, quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PRODUCT_STAGES = ['Pipeline', 'Build', 'UnitTest', 'FunctionalTest']
+INS_JOB_PREFIXES = ['Platform-Patch-Pipeline-', 'Platform-Template-AllCores-Pipeline-']
+VIC_JOB = 'AWS-VIC-Manager'
+VIC_ACTIONS = ['create-vic', 'assign-vic', 'release-vic']
+RESULTS = ['SUCCESS'] * 8 + ['FAILURE', 'UNSTABLE']
+
+DEFAULTS = {
+    'cis': 4,
+    'builds': 20,
+    'ins_branches': 2,
+    'ins_stages': 6,
+    'flow_nodes': 3,
+    'ft_reports': 2,
+    'ft_features': 5,
+    'ft_scenarios': 10,
+    'ut_cases': 50,
+    'console_lines': 100,
+    'commits': 20,
+    'padding': 0,
+    'latency': 0.0,
+    'jitter': 0.0,
+    'seed': 0
+}
+
+BUILD_INTERVAL_MS = 10 * 60 * 1000
+START_MS = 1546819200000  # 2019-01-07T00:00:00Z
+
+
+class MockJenkinsServer:
+    """
+    Threaded HTTP server generating Jenkins and Bitbucket responses. Parameters not passed use DEFAULTS.
+    Pass ci_names to use CI names the exporter knows (util.ci_to_ss) instead of ci0, ci1, ...
+    """
+    def __init__(self, host='127.0.0.1', port=0, recordings_dir=None, ci_names=None, **params):
+        unknown = set(params) - set(DEFAULTS)
+        if unknown:
+            raise ValueError('Unknown server parameters: {0}'.format(', '.join(sorted(unknown))))
+
+        self.params = dict(DEFAULTS)
+        self.params.update(params)
+
+        self.recordings_dir = Path(recordings_dir) if recordings_dir else None
+        if ci_names is None:
+            ci_names = ['ci{0}'.format(i) for i in range(self.params['cis'])]
+        self.cis = list(ci_names)[:self.params['cis']]
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.url = 'http://{0}:{1}'.format(*self.httpd.server_address[:2])
+
+        self.thread = None
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+        self.routes = [
+            (re.compile(r'^/(prod|dev)/?$'), self.root),
+            (re.compile(r'^/(prod|dev)(?:/view/[^/]+)*/api/json$'), self.jobs),
+            (re.compile(r'^/(prod|dev)(?:/view/[^/]+)*/job/([^/]+)/api/json$'), self.job),
+            (re.compile(r'^/(prod|dev)/job/([^/]+)/(\d+)/api/json$'), self.build),
+            (re.compile(r'^/(prod|dev)/job/([^/]+)/(\d+)/wfapi$'), self.run),
+            (re.compile(r'^/(prod|dev)/job/([^/]+)/(\d+)/execution/node/(\d+)/wfapi/describe$'), self.stage),
+            (re.compile(r'^/(prod|dev)/job/([^/]+)/(\d+)/execution/node/(\d+)/wfapi/log$'), self.node_log),
+            (re.compile(r'^/(prod|dev)/job/([^/]+)/(\d+)/testReport/api/json$'), self.test_report),
+            (re.compile(r'^/(prod|dev)/job/([^/]+)/(\d+)/consoleText$'), self.console_text),
+            (re.compile(r'^/(prod|dev)/job/([^/]+)/(\d+)/artifact/(.+)$'), self.artifact),
+            (re.compile(r'^/bitbucket/rest/api/1.0/projects/[^/]+/repos/[^/]+/commits/?$'), self.commits),
+            (re.compile(r'^/bitbucket/projects/[^/]+/repos/[^/]+/raw/(.+)$'), self.raw_file)
+        ]
+
+    def start(self):
+        """
+        Serve requests in a background thread.
+        :return: self
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {'requests': 0, 'bytes': 0, 'not_found': 0, 'endpoints': {}, 'max_in_flight': 0,
+                          'request_seconds': 0.0, 'busy_seconds': 0.0}
+            self._in_flight = 0
+            self._busy_since = None
+
+    def _request_started(self):
+        with self.stats_lock:
+            self._in_flight += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+            if self._in_flight == 1:
+                self._busy_since = time.perf_counter()
+
+    def _request_finished(self, endpoint, num_bytes, elapsed, found):
+        with self.stats_lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self.stats['busy_seconds'] += time.perf_counter() - self._busy_since
+
+            self.stats['requests'] += 1
+            self.stats['bytes'] += num_bytes
+            self.stats['request_seconds'] += elapsed
+            self.stats['endpoints'][endpoint] = self.stats['endpoints'].get(endpoint, 0) + 1
+            if not found:
+                self.stats['not_found'] += 1
+
+    def respond(self, path):
+        """
+        Build the response to a GET request.
+        :param path: request path including the query string
+        :return: (endpoint name, body bytes or None if not found, content type)
+        """
+        if self.recordings_dir is not None:
+            recording = self.recordings_dir / quote(path, safe='')
+            if recording.is_file():
+                return 'recording', recording.read_bytes(), 'application/octet-stream'
+
+        parts = urlsplit(path)
+        url_path = re.sub('/+', '/', parts.path)
+        query = parse_qs(parts.query)
+
+        for regex, handler in self.routes:
+            match = regex.match(url_path)
+            if match:
+                body = handler(query, *match.groups())
+                if body is None:
+                    return handler.__name__, None, None
+                if isinstance(body, str):
+                    return handler.__name__, body.encode('utf-8'), 'text/plain; charset=utf-8'
+                return handler.__name__, json.dumps(body).encode('utf-8'), 'application/json'
+
+        return 'unknown', None, None
+
+    def delay(self, path):
+        latency = self.params['latency']
+        if self.params['jitter']:
+            latency += random.Random(path).uniform(0, self.params['jitter'])
+        if latency > 0:
+            time.sleep(latency)
+
+    def _pad(self, body):
+        if self.params['padding']:
+            body['_padding'] = 'x' * self.params['padding']
+        return body
+
+    def _rng(self, *parts):
+        return random.Random(':'.join(str(part) for part in (self.params['seed'],) + parts))
+
+    def _base(self, instance):
+        return '{0}/{1}'.format(self.url, instance)
+
+    @staticmethod
+    def _timestamp(number):
+        return START_MS + number * BUILD_INTERVAL_MS
+
+    def product_jobs(self):
+        """
+        :return: list of (ci, stage, job name) of product jobs
+        """
+        return [(ci, stage, '{0}-{1}'.format(ci, stage)) for ci in self.cis for stage in PRODUCT_STAGES]
+
+    def ins_jobs(self):
+        """
+        :return: list of INS workflow job names
+        """
+        return ['{0}branch{1}'.format(prefix, i) for prefix in INS_JOB_PREFIXES
+                for i in range(self.params['ins_branches'])]
+
+    @staticmethod
+    def _job_stage(job_name):
+        return job_name[job_name.rfind('-') + 1:]
+
+    @staticmethod
+    def _is_workflow(job_name):
+        return any(job_name.startswith(prefix) for prefix in INS_JOB_PREFIXES)
+
+    # Jenkins endpoints
+
+    @staticmethod
+    def root(query, instance):
+        return 'Jenkins'
+
+    def jobs(self, query, instance):
+        return {'jobs': [{'name': name} for name in self.ins_jobs()]}
+
+    def job(self, query, instance, job_name):
+        job_class = 'org.jenkinsci.plugins.workflow.job.WorkflowJob' if self._is_workflow(job_name) \
+            else 'hudson.model.FreeStyleProject'
+        base = self._base(instance)
+        builds = [{'url': '{0}/job/{1}/{2}'.format(base, job_name, number), 'timestamp': self._timestamp(number)}
+                  for number in range(self.params['builds'], 0, -1)]
+        return {'_class': job_class, 'builds': builds}
+
+    def build(self, query, instance, job_name, number):
+        number = int(number)
+        rng = self._rng(instance, job_name, number)
+        base = self._base(instance)
+        build_url = '{0}/job/{1}/{2}'.format(base, job_name, number)
+
+        parameters = [{'name': 'BASELINE_VERSION', 'value': '1.{0}.{1}.0'.format(number // 100, number // 10 % 10)}]
+        artifacts = []
+
+        if job_name == VIC_JOB:
+            parameters.append({'name': 'ACTION', 'value': rng.choice(VIC_ACTIONS)})
+        elif self._job_stage(job_name) == 'Pipeline':
+            artifacts = [{'fileName': 'pipeline.properties', 'relativePath': 'pipeline.properties'},
+                         {'fileName': 'pipeline.json', 'relativePath': 'pipeline.json'}]
+        elif not self._is_workflow(job_name):
+            ci = job_name[:job_name.rfind('-')]
+            parameters.append({'name': 'PIPELINE_URL', 'value': '{0}/job/{1}-Pipeline/{2}'.format(base, ci, number)})
+
+            if self._job_stage(job_name) == 'FunctionalTest':
+                artifacts = [{'fileName': 'cucumber{0}.json'.format(i), 'relativePath': 'target/cucumber{0}.json'.format(i)}
+                             for i in range(self.params['ft_reports'])]
+
+        if rng.random() < 0.5:
+            causes = [{'_class': 'hudson.model.Cause$UpstreamCause', 'upstreamProject': 'Nightly-Builds',
+                       'upstreamBuild': number, 'upstreamUrl': 'job/Nightly-Builds/'}]
+        else:
+            causes = [{'_class': 'hudson.model.Cause$UserIdCause', 'userId': 'user{0}'.format(rng.randint(0, 9))}]
+
+        return self._pad({
+            '_class': 'hudson.model.FreeStyleBuild',
+            'number': number,
+            'id': str(number),
+            'url': build_url + '/',
+            'fullDisplayName': '{0} #{1}'.format(job_name, number),
+            'timestamp': self._timestamp(number),
+            'duration': rng.randint(1000, 3600000),
+            'result': rng.choice(RESULTS),
+            'building': False,
+            'actions': [
+                {'_class': 'hudson.model.ParametersAction', 'parameters': parameters},
+                {'_class': 'hudson.model.CauseAction', 'causes': causes}
+            ],
+            'artifacts': artifacts
+        })
+
+    def run(self, query, instance, job_name, number):
+        number = int(number)
+        rng = self._rng(instance, job_name, number, 'wfapi')
+
+        stages = []
+        for i in range(self.params['ins_stages']):
+            stages.append({
+                'id': str(i + 1),
+                'name': 'stage{0}'.format(i),
+                'status': rng.choice(RESULTS),
+                'durationMillis': rng.randint(1000, 600000),
+                '_links': {'self': {'href': 'job/{0}/{1}/execution/node/{2}/wfapi/describe'.format(job_name, number, i + 1)}}
+            })
+
+        return self._pad({
+            'id': str(number),
+            'name': '#{0}'.format(number),
+            'status': rng.choice(RESULTS),
+            'startTimeMillis': self._timestamp(number),
+            'durationMillis': sum(stage['durationMillis'] for stage in stages),
+            '_links': {'self': {'href': 'job/{0}/{1}/wfapi/describe'.format(job_name, number)}},
+            'stages': stages
+        })
+
+    def stage(self, query, instance, job_name, number, node):
+        nodes = [{
+            'id': '{0}{1}'.format(node, i),
+            'name': 'step{0}'.format(i),
+            'status': 'SUCCESS',
+            '_links': {'log': {'href': 'job/{0}/{1}/execution/node/{2}{3}/wfapi/log'.format(job_name, number, node, i)}}
+        } for i in range(self.params['flow_nodes'])]
+
+        return self._pad({'id': node, 'name': 'stage{0}'.format(int(node) - 1), 'status': 'SUCCESS',
+                          'stageFlowNodes': nodes})
+
+    def node_log(self, query, instance, job_name, number, node):
+        return {'nodeId': node, 'nodeStatus': 'SUCCESS', 'text': self._console_lines(job_name, number, 10)}
+
+    def test_report(self, query, instance, job_name, number):
+        rng = self._rng(instance, job_name, number, 'testReport')
+        cases = [{'className': 'pkg.Test{0}'.format(i // 10), 'name': 'test{0}'.format(i), 'duration': rng.random(),
+                  'status': rng.choice(['PASSED'] * 18 + ['FAILED', 'SKIPPED']), 'skipped': False, 'age': 0}
+                 for i in range(self.params['ut_cases'])]
+
+        return self._pad({
+            'duration': sum(case['duration'] for case in cases),
+            'failCount': sum(1 for case in cases if case['status'] == 'FAILED'),
+            'skipCount': sum(1 for case in cases if case['status'] == 'SKIPPED'),
+            'passCount': sum(1 for case in cases if case['status'] == 'PASSED'),
+            'suites': [{'name': 'suite', 'duration': 0, 'cases': cases}]
+        })
+
+    def _console_lines(self, job_name, number, num_lines):
+        lines = ['[{0} #{1}] line {2}'.format(job_name, number, i) for i in range(num_lines)]
+        if self.params['padding']:
+            lines.append('x' * self.params['padding'])
+        return '\n'.join(lines) + '\n'
+
+    def console_text(self, query, instance, job_name, number):
+        text = self._console_lines(job_name, number, self.params['console_lines'])
+        if job_name == VIC_JOB:
+            rng = self._rng(instance, job_name, int(number))
+            text += "Created AWS VIC '{0}' under IP 10.0.0.1\nCI: {1}\n".format(rng.randint(1, 50), rng.choice(self.cis))
+        return text
+
+    def artifact(self, query, instance, job_name, number, relative_path):
+        number = int(number)
+
+        if relative_path == 'pipeline.properties':
+            return 'PIPELINE_VERSION=1.{0}.{1}.0.{2}\nTARGET_ENV=aws\n'.format(number // 100, number // 10 % 10, number)
+        if relative_path == 'pipeline.json':
+            return self._pad({'stages': PRODUCT_STAGES, 'number': number})
+        if relative_path.endswith('.json'):
+            return self.cucumber_report(instance, job_name, number, relative_path)
+
+        return None
+
+    def cucumber_report(self, instance, job_name, number, relative_path):
+        rng = self._rng(instance, job_name, number, relative_path)
+        features = []
+
+        for f in range(self.params['ft_features']):
+            elements = [{
+                'type': 'scenario',
+                'id': 'feature-{0};scenario-{1}'.format(f, s),
+                'name': 'Scenario {0}'.format(s),
+                'tags': [{'name': '@tag{0}'.format(s % 4)}],
+                'steps': [{'name': 'step', 'result': {'status': rng.choice(['passed'] * 18 + ['failed', 'skipped'])}}
+                          for _ in range(5)]
+            } for s in range(self.params['ft_scenarios'])]
+
+            features.append({'id': '{0}-feature-{1}'.format(relative_path, f), 'name': 'Feature {0}'.format(f),
+                             'tags': [], 'elements': elements})
+
+        return features
+
+    # Bitbucket endpoints
+
+    def commits(self, query):
+        # newest first, like the Bitbucket API
+        values = [{'id': 'commit{0:04d}'.format(i), 'committerTimestamp': self._timestamp(i * 2)}
+                  for i in range(self.params['commits'], 0, -1)]
+        return {'values': values, 'size': len(values), 'isLastPage': True}
+
+    def raw_file(self, query, path):
+        commit = query.get('at', ['none'])[0]
+        lines = ['AllCores:']
+        for i in range(self.params['ins_stages']):
+            lines.append('  - name: stage{0}'.format(i))
+            lines.append('    commit: {0}'.format(commit))
+            lines.append('    cores: [core{0}, core{1}]'.format(i, i + 1))
+        return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        mock = self.server.mock
+        start = time.perf_counter()
+        mock._request_started()
+
+        endpoint = 'unknown'
+        num_bytes = 0
+        found = False
+
+        try:
+            endpoint, body, content_type = mock.respond(self.path)
+            mock.delay(self.path)
+
+            if body is None:
+                self.send_error(404)
+            else:
+                found = True
+                num_bytes = len(body)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(num_bytes))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            mock._request_finished(endpoint, num_bytes, time.perf_counter() - start, found)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_arguments(parser):
+    """
+    Add an argparse option for every server parameter.
+    :param parser: the argparse parser
+    """
+    for name, default in DEFAULTS.items():
+        parser.add_argument('--{0}'.format(name.replace('_', '-')), dest=name, type=type(default), default=default)
+    parser.add_argument('--recordings', help='directory of recorded responses to serve instead of synthetic ones')
+
+
+def get_params(args):
+    """
+    Get server parameters from parsed arguments.
+    :param args: arguments parsed by a parser passed to add_arguments
+    :return: dict of parameters
+    """
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Serve synthetic Jenkins and Bitbucket responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args(args)
+
+    server = MockJenkinsServer(args.host, args.port, args.recordings, **get_params(args))
+    print('Jenkins prod: {0}/prod, dev: {0}/dev, Bitbucket: {0}/bitbucket'.format(server.url))
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
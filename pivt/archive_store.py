@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Content-addressed store for archived new data
+
+Archives are split into their members and each member into fixed-size chunks. Chunks are stored once, compressed,
+under their SHA-256 hash, and each archive keeps a manifest listing its members and their chunks, so a pipeline.json
+or FT report repeated across pulls takes up space once. Archives are rebuilt from their manifests on demand.
+
+Usage: python -m pivt.archive_store list
+       python -m pivt.archive_store ingest ARCHIVE...
+       python -m pivt.archive_store restore NAME... [--to DIR]
+       python -m pivt.archive_store remove NAME...
+       python -m pivt.archive_store gc
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+from pivt.util import util
+from pivt.zip_writer import ParallelZipWriter
+
+
+class ArchiveStore:
+    """
+    Stores new data archives as manifests of deduplicated, compressed chunks.
+
+    Layout: blobs/<first 2 hex digits>/<sha256> holds a zlib-compressed chunk and manifests/<archive name>.json
+    lists the members of an archive with their metadata and chunk hashes.
+    """
+    CHUNK_SIZE = 1024 * 1024
+    MANIFEST_VERSION = 1
+
+    def __init__(self, root=None, chunk_size=CHUNK_SIZE, level=6):
+        self.root = Path(root) if root is not None else util.archive_store_dir
+        self.blobs_dir = self.root / 'blobs'
+        self.manifests_dir = self.root / 'manifests'
+        self.chunk_size = chunk_size
+        self.level = level
+        self.logger = util.get_logger(self)
+
+    def names(self):
+        """
+        Get the names of the stored archives.
+        :return: sorted list of archive names
+        """
+        if not self.manifests_dir.exists():
+            return []
+        return sorted(path.stem for path in self.manifests_dir.glob('*.json'))
+
+    def contains(self, name):
+        """
+        Check whether an archive is stored.
+        :param name: archive name, e.g. 19-05-01T00-00-00_NewData.zip
+        :return: True if the archive is stored
+        """
+        return self._manifest_path(name).exists()
+
+    def ingest(self, archive_path):
+        """
+        Store an archive. Chunks already in the store are not written again.
+        :param archive_path: path to the zip archive
+        :return: dict with the number of chunks and bytes read and the number of new chunks and bytes stored
+        """
+        archive_path = Path(archive_path)
+        stats = {'chunks': 0, 'bytes': 0, 'new_chunks': 0, 'new_bytes': 0}
+        members = []
+
+        with zipfile.ZipFile(str(archive_path)) as archive:
+            for info in archive.infolist():
+                chunks = []
+                if not info.filename.endswith('/'):
+                    with archive.open(info) as member:
+                        for chunk in iter(lambda: member.read(self.chunk_size), b''):
+                            digest, stored_size = self._put_blob(chunk)
+                            chunks.append(digest)
+
+                            stats['chunks'] += 1
+                            stats['bytes'] += len(chunk)
+                            if stored_size:
+                                stats['new_chunks'] += 1
+                                stats['new_bytes'] += stored_size
+
+                members.append({
+                    'name': info.filename,
+                    'date_time': list(info.date_time),
+                    'compress_type': info.compress_type,
+                    'external_attr': info.external_attr,
+                    'size': info.file_size,
+                    'crc': info.CRC,
+                    'chunks': chunks
+                })
+
+        manifest = {
+            'version': self.MANIFEST_VERSION,
+            'name': archive_path.name,
+            'size': archive_path.stat().st_size,
+            'members': members
+        }
+
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        self._write_atomic(self._manifest_path(archive_path.name), json.dumps(manifest).encode('utf-8'))
+
+        self.logger.info('Stored %s: %s of %s chunks new (%s bytes)', archive_path.name, stats['new_chunks'],
+                         stats['chunks'], stats['new_bytes'])
+        return stats
+
+    def restore(self, name, out_dir):
+        """
+        Rebuild a stored archive. Member contents, names, times and compression methods match the original, and
+        every member is checked against its original CRC. Members are written chunk by chunk, so only a few chunks
+        are held in memory at a time.
+        :param name: archive name
+        :param out_dir: directory to write the archive to
+        :return: path to the rebuilt archive
+        """
+        manifest = self._load_manifest(name)
+
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        out_path = out_dir / name
+        temp_path = out_dir / (name + '.tmp')
+
+        # the writer deletes the temp archive if a member fails
+        with ParallelZipWriter(temp_path, compression=zipfile.ZIP_STORED, workers=1) as writer:
+            for member in manifest['members']:
+                info = zipfile.ZipInfo(member['name'], tuple(member['date_time']))
+                info.compress_type = member['compress_type']
+                info.external_attr = member['external_attr']
+                info.file_size = member['size']
+
+                writer.write_stream(info, (self._get_blob(digest) for digest in member['chunks']))
+                if info.CRC != member['crc']:
+                    raise ValueError('{0} in {1} does not match its original CRC'.format(member['name'], name))
+
+        temp_path.replace(out_path)
+        return out_path
+
+    def remove(self, name):
+        """
+        Remove an archive's manifest. Its chunks are deleted by the next gc() if no other archive uses them.
+        :param name: archive name
+        """
+        self._manifest_path(name).unlink()
+
+    def gc(self):
+        """
+        Delete chunks no manifest refers to. Do not run while archives are being stored.
+        :return: number of chunks deleted
+        """
+        referenced = set()
+        for name in self.names():
+            for member in self._load_manifest(name)['members']:
+                referenced.update(member['chunks'])
+
+        deleted = 0
+        if self.blobs_dir.exists():
+            for path in self.blobs_dir.glob('*/*'):
+                if path.name not in referenced:
+                    path.unlink()
+                    deleted += 1
+
+        return deleted
+
+    def stats(self):
+        """
+        Get the size of the stored archives and of the store.
+        :return: dict with the number of archives, the total size of the original archives, the number of unique
+                 chunks and the bytes they take on disk
+        """
+        archive_bytes = sum(self._load_manifest(name)['size'] for name in self.names())
+
+        chunks = 0
+        stored_bytes = 0
+        if self.blobs_dir.exists():
+            for path in self.blobs_dir.glob('*/*'):
+                chunks += 1
+                stored_bytes += path.stat().st_size
+
+        return {'archives': len(self.names()), 'archive_bytes': archive_bytes, 'chunks': chunks,
+                'stored_bytes': stored_bytes}
+
+    def _manifest_path(self, name):
+        return self.manifests_dir / (name + '.json')
+
+    def _load_manifest(self, name):
+        with self._manifest_path(name).open() as file:
+            return json.load(file)
+
+    def _blob_path(self, digest):
+        return self.blobs_dir / digest[:2] / digest
+
+    def _put_blob(self, chunk):
+        """
+        Store a chunk if it is not stored yet.
+        :param chunk: bytes
+        :return: the chunk's hash and the number of bytes written (0 if it was already stored)
+        """
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._blob_path(digest)
+        if path.exists():
+            return digest, 0
+
+        data = zlib.compress(chunk, self.level)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_atomic(path, data)
+        return digest, len(data)
+
+    def _get_blob(self, digest):
+        with self._blob_path(digest).open('rb') as file:
+            chunk = zlib.decompress(file.read())
+
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError('Chunk {0} is corrupt'.format(digest))
+
+        return chunk
+
+    @staticmethod
+    def _write_atomic(path, data):
+        fd, temp_path = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, str(path))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Manage the content-addressed archive store')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    subparsers.add_parser('list', help='list stored archives and store size')
+
+    ingest_parser = subparsers.add_parser('ingest', help='store archives (e.g. existing ones in the archive dir)')
+    ingest_parser.add_argument('archives', nargs='+', type=Path)
+    ingest_parser.add_argument('--delete', action='store_true', help='delete each archive once it is stored')
+
+    restore_parser = subparsers.add_parser('restore', help='rebuild archives, by default into the collected dir '
+                                                           'so the next process run reprocesses them')
+    restore_parser.add_argument('names', nargs='+')
+    restore_parser.add_argument('--to', type=Path, help='directory to write the archives to')
+
+    remove_parser = subparsers.add_parser('remove', help='remove archives from the store')
+    remove_parser.add_argument('names', nargs='+')
+
+    subparsers.add_parser('gc', help='delete chunks no stored archive uses')
+
+    args = parser.parse_args(args)
+
+    util.setup()
+    store = ArchiveStore()
+
+    if args.command == 'list':
+        for name in store.names():
+            print(name)
+        stats = store.stats()
+        print('{0} archives, {1} bytes; {2} unique chunks, {3} bytes stored'.format(
+            stats['archives'], stats['archive_bytes'], stats['chunks'], stats['stored_bytes']))
+    elif args.command == 'ingest':
+        for path in args.archives:
+            store.ingest(path)
+            if args.delete:
+                path.unlink()
+    elif args.command == 'restore':
+        out_dir = args.to or util.collected_dir
+        for name in args.names:
+            print(store.restore(name, out_dir))
+    elif args.command == 'remove':
+        for name in args.names:
+            store.remove(name)
+    elif args.command == 'gc':
+        print('Deleted {0} chunks'.format(store.gc()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
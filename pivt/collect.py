@@ -18,42 +18,129 @@
 Gathers data collected from Jenkins and ClearQuest and readies it for processing
 """
 
+import argparse
+import os
 import shutil
 import time
 import sys
-from pathlib import Path
+import zipfile
+import zlib
+from pivt.archive_store import ArchiveStore
 from pivt.util import util
+from pivt.zip_writer import ParallelZipWriter
+
+COMPRESSION_METHODS = {
+    'stored': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA
+}
+if hasattr(zipfile, 'ZIP_ZSTANDARD'):
+    COMPRESSION_METHODS['zstd'] = zipfile.ZIP_ZSTANDARD
+
+
+def get_compression():
+    """
+    Read the compression method and level of collected archives from the [collect] settings.
+    :return: the compression name and the level, or None for the library default
+    :raise ValueError: if the compression is not supported
+    """
+    compression = util.get_setting('collect', 'compression', 'deflate')
+    if compression not in COMPRESSION_METHODS:
+        raise ValueError('Unsupported compression {0}; supported: {1}'.format(
+            compression, ', '.join(sorted(COMPRESSION_METHODS))))
+
+    level = util.get_setting('collect', 'compression_level', None)
+    return compression, int(level) if level not in (None, '') else None
+
+
+def get_zip_options(level, logger):
+    """
+    Get the keyword arguments that make zipfile.ZipFile compress at a level.
+    :param level: the level, or None for the library default
+    :param logger: logs a warning if this Python cannot set the level
+    :return: the keyword arguments
+    """
+    if level is None:
+        return {}
+
+    # zipfile only takes a compression level from Python 3.7
+    if sys.version_info < (3, 7):
+        logger.warning('Python %s.%s cannot set the zip compression level; using the default', *sys.version_info[:2])
+        return {}
+
+    return {'compresslevel': level}
 
 
 class Collector:
     """
     Collects data exported from export_jenkins and compresses it in Collected directory.
     """
-    def __init__(self):
+    def __init__(self, args=None):
         util.setup()
         self.logger = util.get_logger(self)
 
+        self.args = self.parse_args(args or [])
+
+        self.incremental = self.args.append or util.get_boolean_setting('collect', 'incremental', False)
+
+    @staticmethod
+    def parse_args(args):
+        """
+        Parse command line arguments using argparse.
+        :param args: command line arguments
+        :return: parsed arguments
+        """
+        parser = argparse.ArgumentParser(description='Collect exported data into an archive for processing')
+        parser.add_argument('--append', dest='append', action='store_true',
+                            help='only append new pull directories to the rolling archive, e.g. after export_cq.pl')
+        parser.set_defaults(append=False)
+
+        return parser.parse_args(args)
+
     def main(self):
         """Collect data and package it in a zip file."""
         self.setup()
 
-        if not util.new_data_dir.exists():
+        rolling_archive = RollingArchive() if self.incremental else None
+        has_rolling_archive = rolling_archive is not None and rolling_archive.parts_dir.exists()
+
+        if not util.new_data_dir.exists() and not has_rolling_archive:
             self.logger.info('New data dir (%s) does not exist. Exiting.', util.new_data_dir)
             sys.exit()
 
+        if self.args.append:
+            self.append_data(rolling_archive, self.get_pull_dirs())
+            return
+
         self.logger.info('Starting collection')
 
         pull_dirs = self.get_pull_dirs()
 
         self.logger.info('%s pulls since last collection', len(pull_dirs))
 
-        self.logger.info('Zipping %s', util.new_data_dir)
-        archive_path = self.zip_data()
+        if self.incremental:
+            self.append_data(rolling_archive, self.get_new_data_paths())
+            archive_path = rolling_archive.finish(self.get_archive_path())
+            if archive_path is None:
+                self.logger.info('Nothing to collect')
+                return
+
+            self.logger.info('Zip file name: %s', archive_path)
 
-        self.logger.info('Zip file name: %s', archive_path)
+        else:
+            self.logger.info('Zipping %s', util.new_data_dir)
+            archive_path = self.zip_data()
+
+            self.logger.info('Zip file name: %s', archive_path)
 
         self.logger.info('Archiving...')
-        shutil.copy(str(archive_path), str(util.archive_dir))
+        if util.get_boolean_setting('archive', 'store', False):
+            ArchiveStore().ingest(archive_path)
+        elif self.incremental:
+            self.link_or_copy(archive_path, util.archive_dir)
+        else:
+            shutil.copy(str(archive_path), str(util.archive_dir))
 
         self.logger.info('Cleaning up...')
         self.cleanup()
@@ -79,12 +166,71 @@ class Collector:
         return pull_dirs
 
     @staticmethod
-    def zip_data():
-        """Create zip file."""
+    def get_new_data_paths():
+        """Retrieve pull directories and other files in the new data directory, oldest pull first."""
+        if not util.new_data_dir.exists():
+            return []
+        return sorted(util.new_data_dir.glob('*'))
+
+    def append_data(self, rolling_archive, paths):
+        """
+        Move pull directories and files into the rolling archive.
+        :param rolling_archive: the RollingArchive
+        :param paths: paths in the new data directory
+        """
+        for path in sorted(paths):
+            self.logger.info('Appending %s to %s', path.name, rolling_archive.parts_dir)
+            rolling_archive.add(path)
+
+    @staticmethod
+    def get_archive_path():
+        """Get the path of a new archive in the collected directory."""
         date = time.strftime('%Y-%m-%dT%H-%M-%S')[2:]
-        archive_name = '{0}/{1}_NewData'.format(util.collected_dir, date)
-        archive_path = shutil.make_archive(archive_name, 'zip', str(util.new_data_dir))
-        return Path(archive_path)
+        return util.collected_dir / '{0}_NewData.zip'.format(date)
+
+    def zip_data(self):
+        """Create zip file."""
+        workers = int(util.get_setting('collect', 'compression_workers', 1)) or os.cpu_count()
+        compression, level = get_compression()
+        archive_path = self.get_archive_path()
+
+        if workers > 1 and compression in ParallelZipWriter.COMPRESSION_METHODS:
+            self.logger.info('Compressing with %s workers', workers)
+            with ParallelZipWriter(archive_path, compression=COMPRESSION_METHODS[compression],
+                                   level=zlib.Z_DEFAULT_COMPRESSION if level is None else level,
+                                   workers=workers) as writer:
+                writer.write_tree(util.new_data_dir)
+            return archive_path
+
+        if workers > 1:
+            self.logger.warning('Parallel compression does not support %s; compressing on one core', compression)
+
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(str(archive_path), 'w', compression=COMPRESSION_METHODS[compression],
+                             **get_zip_options(level, self.logger)) as archive:
+            for path in sorted(util.new_data_dir.rglob('*')):
+                archive.write(str(path), path.relative_to(util.new_data_dir).as_posix())
+
+        return archive_path
+
+    @staticmethod
+    def link_or_copy(path, target_dir):
+        """
+        Hard-link a file into a directory, copying it if the directory is on another file system.
+        :param path: the file
+        :param target_dir: the directory
+        :return: the new path
+        """
+        target_path = target_dir / path.name
+        if target_path.exists():
+            target_path.unlink()
+
+        try:
+            os.link(str(path), str(target_path))
+        except OSError:
+            shutil.copy(str(path), str(target_path))
+
+        return target_path
 
     @staticmethod
     def cleanup():
@@ -98,8 +244,84 @@ class Collector:
                 path.unlink()  # remove file
 
 
+class RollingArchive:
+    """
+    Zip archives in the tmp directory that exported data is moved into as soon as it is exported.
+
+    Each added pull directory is compressed once, with the configured method and level, into its own zip in the
+    parts directory and removed from the new data directory. A part is written under a temporary name and
+    renamed into place before its pull is removed, so a failed or interrupted add never damages the pulls
+    added before it. At collection time the parts are joined into one archive without recompressing them.
+    """
+    def __init__(self, parts_dir=None):
+        self.logger = util.get_logger(self)
+        self.parts_dir = parts_dir or util.tmp_dir / 'NewData.parts'
+
+        compression, self.compression_level = get_compression()
+        self.compression = COMPRESSION_METHODS[compression]
+        self.zip_options = get_zip_options(self.compression_level, self.logger)
+
+    def add(self, path):
+        """
+        Compress a pull directory or file in the new data directory into a part, then remove it.
+        :param path: the pull directory or file
+        """
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        part_path = self.parts_dir / (path.name + '.zip')
+        tmp_path = self.parts_dir / (path.name + '.zip.tmp')
+
+        with zipfile.ZipFile(str(tmp_path), 'w', compression=self.compression, **self.zip_options) as archive:
+            archive.write(str(path), path.relative_to(util.new_data_dir).as_posix())
+            if path.is_dir():
+                for sub_path in sorted(path.rglob('*')):
+                    archive.write(str(sub_path), sub_path.relative_to(util.new_data_dir).as_posix())
+
+        # only remove the data once its part is complete and in place
+        os.replace(str(tmp_path), str(part_path))
+        if path.is_dir():
+            util.rmtree(path)
+        else:
+            path.unlink()
+
+    def finish(self, archive_path):
+        """
+        Join the parts into one archive at its final path and remove them.
+        :param archive_path: the final path, on the same file system
+        :return: the final path, or None if nothing was added since the last finish
+        """
+        parts = sorted(self.parts_dir.glob('*.zip')) if self.parts_dir.exists() else []
+        if not parts:
+            return None
+
+        if len(parts) == 1:
+            os.replace(str(parts[0]), str(archive_path))
+        else:
+            tmp_path = self.parts_dir / 'NewData.zip.tmp'
+            with ParallelZipWriter(tmp_path, compression=zipfile.ZIP_STORED, workers=1) as writer:
+                for part in parts:
+                    writer.copy_archive(part)
+            os.replace(str(tmp_path), str(archive_path))
+
+        util.rmtree(self.parts_dir)
+        return archive_path
+
+
+def append_pull(pull_dir):
+    """
+    Move a finished pull directory into the rolling archive if collect.incremental is on. Called by the exporters at
+    the end of each export; pulls that are not appended here are appended by the next collection.
+    :param pull_dir: the pull directory in the new data directory
+    :return: True if the pull was appended
+    """
+    if not util.get_boolean_setting('collect', 'incremental', False) or not pull_dir.exists():
+        return False
+
+    RollingArchive().add(pull_dir)
+    return True
+
+
 if __name__ == '__main__':
-    COLLECTOR = Collector()
+    COLLECTOR = Collector(sys.argv[1:])
 
     try:
         COLLECTOR.main()
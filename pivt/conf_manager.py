@@ -22,6 +22,8 @@ from pathlib import Path
 import configparser
 import logging
 
+_NO_FALLBACK = object()
+
 
 class ConfManager:
     """Configuration manager"""
@@ -72,26 +74,33 @@ class ConfManager:
 
             self.configs[filename] = config
 
-    def get(self, filename, stanza, setting):
+    def get(self, filename, stanza, setting, fallback=_NO_FALLBACK):
         """
         Get a specific configuration value.
         :param filename: config file
         :param stanza: stanza the config setting is under
         :param setting: name of setting
+        :param fallback: value to return if the setting does not exist; if not given, an exception is raised
         :return: config value
         """
         self.logger.info('Retrieving setting %s.%s.%s', filename, stanza, setting)
 
         if filename not in self.configs:
+            if fallback is not _NO_FALLBACK:
+                return fallback
             raise Exception('No {0} config file! Config files: {1}'.format(filename, self.configs.keys()))
 
         config = self.configs[filename]
 
         if not config.has_section(stanza):
+            if fallback is not _NO_FALLBACK:
+                return fallback
             raise Exception('No {0} stanza in config file {1}! Stanzas: {2}'
                             .format(stanza, filename, config.sections()))
 
         if not config.has_option(stanza, setting):
+            if fallback is not _NO_FALLBACK:
+                return fallback
             raise Exception('No {0} setting in stanza {1} for config file {2}! Settings: {3}'
                             .format(setting, stanza, filename, config.options(stanza)))
 
@@ -101,6 +110,26 @@ class ConfManager:
 
         return value
 
+    def get_boolean(self, filename, stanza, setting, fallback=_NO_FALLBACK):
+        """
+        Get a specific configuration value as a boolean.
+        Accepts the same values as configparser (1/0, yes/no, true/false, on/off).
+        :param filename: config file
+        :param stanza: stanza the config setting is under
+        :param setting: name of setting
+        :param fallback: value to return if the setting does not exist; if not given, an exception is raised
+        :return: config value
+        """
+        value = self.get(filename, stanza, setting, fallback=fallback)
+
+        if isinstance(value, bool):
+            return value
+
+        if value.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+            raise Exception('Setting {0}.{1}.{2} is not a boolean: {3}'.format(filename, stanza, setting, value))
+
+        return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+
     def set(self, filename, stanza, setting, value, create=False):
         """
         Set a configuration value and save it to a file.
@@ -28,6 +28,7 @@ import configparser
 import sys
 import copy
 import yaml
+from pivt.collect import append_pull
 from pivt.util import util
 from pivt.util import Constants
 
@@ -62,11 +63,11 @@ class JenkinsExporter:
         self.vic_ci_regex = re.compile(r'CI: (.+)')
 
         date = time.strftime('%Y%m%d%H%M%S', time.gmtime())[2:]
-        base_dir = util.new_data_dir / date
+        self.pull_dir = util.new_data_dir / date
 
-        self.jenkins_dir = base_dir / 'jenkins'
-        self.ins_dir = base_dir / 'ins'
-        self.vic_dir = base_dir / 'vic'
+        self.jenkins_dir = self.pull_dir / 'jenkins'
+        self.ins_dir = self.pull_dir / 'ins'
+        self.vic_dir = self.pull_dir / 'vic'
 
         self.config = configparser.ConfigParser({'lastJobPulledTime': '0'})
 
@@ -128,6 +129,9 @@ class JenkinsExporter:
         with util.metadata_file.open('w') as config_file:
             self.config.write(config_file)
 
+        if append_pull(self.pull_dir):
+            self.logger.info('Appended %s to the rolling archive', self.pull_dir)
+
         return 0
 
     @staticmethod
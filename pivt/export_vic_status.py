@@ -20,6 +20,7 @@ Exports VIC status data
 
 import json
 import time
+from pivt.collect import append_pull
 from pivt.util import util
 
 
@@ -37,9 +38,9 @@ class VicStatusPlugin:
         self.timestamp = time.time()
         gmtime = time.gmtime(self.timestamp)
         date = time.strftime('%Y%m%d%H%M%S', gmtime)[2:]
-        base_dir = util.new_data_dir / date
+        self.pull_dir = util.new_data_dir / date
 
-        self.data_dir = base_dir / 'vic_status'
+        self.data_dir = self.pull_dir / 'vic_status'
 
     def main(self):
         """
@@ -60,6 +61,9 @@ class VicStatusPlugin:
         self.logger.info('Writing data to %s', self.data_dir.resolve())
         self.write(parsed_data)
 
+        if append_pull(self.pull_dir):
+            self.logger.info('Appended %s to the rolling archive', self.pull_dir)
+
         self.logger.info('Done')
 
     def write(self, parsed_data):
@@ -14,60 +14,66 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+import logging
 import time
-from functools import partial
 from pathlib import Path
-import pipe_core as pc
+from pivt.pipeline import pipe_core as pc
 
 class VicStatusLogger:
     pass
 
-def create_vic_status_pipeline(source, target):
+def create_vic_status_pipeline(source, target, metrics_hooks=None, cache_dir=None):
     # Initial setup of the vic status pipeline context and other data
-    context = pc.Context()
+    # Stage metrics are logged after every run so a slow stage stands out
+    context = pc.Context(metrics=True)
+    context.add_metrics_hook(pc.LoggingMetricsHook(logging.getLogger(__name__)))
+    for hook in metrics_hooks or []:
+        context.add_metrics_hook(hook)
     timestamp = time.time()
     gmtime = time.gmtime(timestamp)
     date = time.strftime('%Y%m%d%H%M%S', gmtime)[2:]
     target_dir = target / date / 'vic_status'
-    target_path = target_dir / ('{}.json'.format(target))
+    target_path = target_dir / 'vic_status.json'
 
     ## STAGES OF THE PIPELINE
+    # Items stream through the stages one at a time, so the status file is never held in memory whole
 
     # Define the reader
-    #reader, context = pc.create_url_reader(source, context)
-    reader, context = pc.create_file_reader(path=source, context=context)
+    #reader, context = pc.create_url_chunk_reader(source, encoding='utf-8', context=context)
+    reader, context = pc.create_file_chunk_reader(path=source, context=context)
 
     # Create the target directory
-    def dir_creator(data, context):
+    def dir_creator(chunks, context):
         target_dir.mkdir(parents=True, exist_ok=True)
-        return data
+        return chunks
 
-    # Take the raw data from the previous stage and parse it as json
-    def parser(raw_data, context):
-    #    logger.info('Parsing data')
-        return json.loads(raw_data)
+    # Take the raw data from the previous stage and parse the items of the JSON array
+    parser, context = pc.create_json_array_parser(context)
 
-    # Take the items from the previous stage and add a timestamp field
-    def timestamper(items, context):
+    # Reuse the parsed items if the status has not changed since an earlier run
+    if cache_dir is not None:
+        parser, context = pc.create_caching_stage(parser, pc.StageCache(cache_dir), 'vic_status_parser', context)
+
+    # Take batches of items from the previous stage and add a timestamp field
+    def stamp(items, context):
         for item in items:
             item['timestamp'] = timestamp
         return items
 
-    # Convert the data from the previous stage to JSON
-    def serializer(items, context):
-        return json.dumps(items)
+    timestamper, context = pc.create_batching_stage(stamp, context=context)
+
+    # Convert the items from the previous stage back to a JSON array
+    serializer, context = pc.create_json_array_serializer(newline=True, context=context)
 
     # Define the writer
     writer, context = pc.create_file_writer(
         path=target_path,
-        newline=True,
         context=context
     )
 
     ## PIPELINE CREATION
 
-    vic_status_pipeline = pc.Pipeline(context)
+    vic_status_pipeline = pc.Pipeline(context, streaming=True)
     vic_status_pipeline.connect_transforms(
         [
             reader,
@@ -81,5 +87,7 @@ def create_vic_status_pipeline(source, target):
 
     return vic_status_pipeline
 
-vic_status_pipeline = create_vic_status_pipeline('test_in.json', Path('test_out'))
-vic_status_pipeline.run()
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    vic_status_pipeline = create_vic_status_pipeline('test_in.json', Path('test_out'))
+    vic_status_pipeline.run()
@@ -15,8 +15,27 @@
 # limitations under the License.
 
 from functools import partial
-from urllib.request import urlopen
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+from collections import abc, deque
+from pathlib import Path
+import codecs
+import hashlib
 import inspect
+import os
+import pickle
+import tempfile
+import json
+import logging
+import re
+import time
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_PENDING = 64
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
 
 class Pipeline:
     """
@@ -24,16 +43,87 @@ class Pipeline:
 
     This class is a collection of stages and junctions and has methods and properties for
     building and controlling the execution of a pipeline.
+
+    In streaming mode, stages consume and produce iterators of records (lines, JSON items, chunks) and run()
+    drains the iterator the last stage returns, so records flow through every stage one at a time and a
+    pipeline can process arbitrarily large inputs in constant memory.
+
+    Resources registered on the context (such as the handle of a buffered file writer) stay open across
+    runs. teardown() flushes and closes them; using the pipeline as a context manager runs setup() on entry
+    and teardown() on exit.
     """
-    def __init__(self, context = None):
+    def __init__(self, context = None, streaming=False):
         self.stages = []
         self.context = context
+        self.streaming = streaming
+        self.setup_hooks = []
+        self.teardown_hooks = []
+
+    def __enter__(self):
+        self.setup()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.teardown()
+
+    def add_setup_hook(self, hook):
+        """
+        Adds a function to call with the context when the pipeline is set up.
+
+        :param hook: A function that takes the context
+        """
+        self.setup_hooks.append(hook)
+
+    def add_teardown_hook(self, hook):
+        """
+        Adds a function to call with the context when the pipeline is torn down.
+
+        :param hook: A function that takes the context
+        """
+        self.teardown_hooks.append(hook)
+
+    def setup(self):
+        """
+        Call the setup hooks, then open the resources of the context.
+        """
+        for hook in self.setup_hooks:
+            hook(self.context)
+
+        if self.context is not None:
+            for resource in self.context.resources:
+                resource.open()
+
+    def teardown(self):
+        """
+        Close the resources of the context, then call the teardown hooks in reverse order.
 
-    def _pick_path(self, path):
+        Every resource and hook runs even if an earlier one fails; the first error is raised at the end.
+        """
+        errors = []
+
+        if self.context is not None:
+            for resource in reversed(self.context.resources):
+                try:
+                    resource.close()
+                except Exception as e:
+                    errors.append(e)
+
+        for hook in reversed(self.teardown_hooks):
+            try:
+                hook(self.context)
+            except Exception as e:
+                errors.append(e)
+
+        if errors:
+            raise errors[0]
+
+    def _pick_path(self, path, data):
         """
         Private function used for picking branches in the pipeline.
 
         :param path: A pair consisting of (predicate function, pipeline)
+        :param data: The input data
+        :return: The return value of the pipeline if the predicate returned True, otherwise False
         """
         predicate = path[0]
         pipeline = path[1]
@@ -41,7 +131,7 @@ class Pipeline:
             return pipeline.run(data)
         return False
 
-    def connect_branch_junction(self, predicates, pipelines):
+    def connect_branch_junction(self, predicates, pipelines, executor=None):
         """
         Connects a branching junction to the end of the pipeline.
 
@@ -49,20 +139,40 @@ class Pipeline:
         of the predicates and pipelines do not match, assignments will take place up to the
         last element in the shorter list.
 
+        If an executor (a concurrent.futures.ThreadPoolExecutor or ProcessPoolExecutor) is given, the
+        pipelines whose predicates return True run on it concurrently. Pipelines run on a process pool
+        must be picklable, so their stages must be module level functions.
+
         :param predicates: A list of functions that take one argument and return true or false
         :param pipelines: A list of pipelines to transfer control to based on the predicates
+        :param executor: An executor to run the pipelines on (optional)
         """
-        def branch_junction(data):
+        paths = list(zip(predicates, pipelines))
+
+        def branch_junction(data, context):
             """
             A branch junction will send data to every pipeline where the associated predicate returns true.
 
+            A stream of records is collected into a list first so every pipeline sees all of the records.
+
             :param data: The input data
-            :return: A map object that will execute the associated pipeline for every predicate that returned true.
+            :param context: A context object
+            :return: A list with the return value of every pipeline, in order, or False for pipelines whose
+                     predicate returned False.
             """
-            return map(self._pick_path, zip(predicates, pipelines))
+            if isinstance(data, abc.Iterator):
+                data = list(data)
+
+            if executor is None:
+                return [self._pick_path(path, data) for path in paths]
+
+            # predicates are cheap, so only the pipelines are handed to the executor
+            futures = [executor.submit(pipeline.run, data) if predicate(data) else None
+                       for predicate, pipeline in paths]
+            return [future.result() if future is not None else False for future in futures]
         self.stages.append(branch_junction)
 
-    def connect_select_junction(self, predicates, pipelines):
+    def connect_select_junction(self, predicates, pipelines, executor=None):
         """
         Connects a select junction to the end of the pipeline.
 
@@ -72,44 +182,47 @@ class Pipeline:
 
         :param predicates: A list of functions that take one argument and return true or false
         :param pipelines: A list of pipelines to transfer control to based on the predicates
-        :return: A function that executes a branch junction
-        """
-        def select_junction(data):
+        :param executor: An executor to run the selected pipeline on (optional)
         """
-        A selection junction will send data to the first pipeline where the associated predicate
-        returns true.
+        paths = list(zip(predicates, pipelines))
 
-        :param data: The input data
-        :return: The pipeline return data associated with the first predicate that returned True or
-                 False if no predicate returned True.
-        """
+        def select_junction(data, context):
+            """
+            A selection junction will send data to the first pipeline where the associated predicate
+            returns true.
 
-            for path in zip(predicates, pipelines):
-                data = self.pick_path(path)
-                if data:
-                    return data
+            :param data: The input data
+            :param context: A context object
+            :return: The pipeline return data associated with the first predicate that returned True or
+                     False if no predicate returned True.
+            """
+            for predicate, pipeline in paths:
+                if predicate(data):
+                    return _run_pipeline(pipeline, data, executor)
             return False
         self.stages.append(select_junction)
 
-    def connect_binary_junction(self, predicate, true_pipeline, false_pipeline):
+    def connect_binary_junction(self, predicate, true_pipeline, false_pipeline, executor=None):
         """
         Connects a binary junction to the end of the pipeline.
 
         :param predicate: A function that takes one argument and returns True or False.
         :param true_pipeline: The pipeline that is executed if the predicate returns True.
         :param false_pipeline: The pipeline that is executed if the predicate returns False.
+        :param executor: An executor to run the chosen pipeline on (optional)
         """
-        def binary_junction(data):
+        def binary_junction(data, context):
             """
             This method returns the output of one of two pipelines depending on the output of the predicate.
 
             :param data: The input data
+            :param context: A context object
             :return: The return value of the true_pipeline if predicate returned True, otherwise the
                      value of the false_pipeline.
             """
             if predicate(data):
-                return true_pipeline.run(data)
-            return false_pipeline.run(data)
+                return _run_pipeline(true_pipeline, data, executor)
+            return _run_pipeline(false_pipeline, data, executor)
         self.stages.append(binary_junction)
 
     def connect_transforms(self, transforms):
@@ -132,17 +245,36 @@ class Pipeline:
         """
         Execute the stages in the pipeline in order.
 
+        If the context collects metrics, every stage call and every record a stage yields is timed and
+        counted in context.metrics, and the context's metrics hooks are called when the run ends.
+
         :param seed: Seed for the data
+        :return: The output of the last stage, or in streaming mode the number of records it produced if
+                 it produced an iterator. Errors raised while records stream through the stages propagate.
         """
-        data = seed
-        for stage in self.stages:
-            try:
-                new_data = stage(data, self.context)
-                data = new_data
-            except ValueError:
-                # Log error in pipeline
-                pass
-        return data
+        tracer = None
+        if self.context is not None and self.context.metrics is not None:
+            tracer = _StageTracer(self.context)
+
+        try:
+            data = seed
+            for index, stage in enumerate(self.stages):
+                try:
+                    if tracer is None:
+                        new_data = stage(data, self.context)
+                    else:
+                        new_data = tracer.call(index, stage, data)
+                    data = new_data
+                except ValueError:
+                    # the error is counted in the stage metrics if they are collected
+                    pass
+
+            if self.streaming and isinstance(data, abc.Iterator):
+                return drain(data)
+            return data
+        finally:
+            if tracer is not None:
+                tracer.finish()
 
 class Context:
     """
@@ -150,11 +282,19 @@ class Context:
 
     This is meant to be an extremely flexible system for keeping track of the state of the pipeline.
     It is up to the developer not to abuse the context object and make things too obscure to follow.
+
+    If metrics are enabled, Pipeline.run records per stage metrics in the metrics dictionary, keyed by
+    '<index>:<stage name>'. Each entry holds the number of calls, the seconds spent in the stage excluding
+    time spent pulling from earlier stages, the input and output sizes (len() of sized values plus the
+    number of records streamed) and the number of errors and the last error.
     """
-    def __init__(self):
+    def __init__(self, metrics=False):
         self.option_id = 0
         self.options = {}
         self.data = {}
+        self.metrics = {} if metrics else None
+        self.metrics_hooks = []
+        self.resources = []
 
     def add_options(self, kv_pairs):
         """
@@ -172,6 +312,221 @@ class Context:
         self.option_id += 1
         return self, this_option_id
 
+    def add_resource(self, resource):
+        """
+        Adds a resource that the pipeline opens on setup and closes on teardown.
+
+        :param resource: An object with open() and close() methods
+        :return: The context object
+        """
+        self.resources.append(resource)
+        return self
+
+    def add_metrics_hook(self, hook):
+        """
+        Adds a hook that exports the metrics of this context, and enables metrics.
+
+        :param hook: A MetricsHook
+        :return: The context object
+        """
+        if self.metrics is None:
+            self.metrics = {}
+        self.metrics_hooks.append(hook)
+        return self
+
+class MetricsHook:
+    """
+    Receives stage metrics from Pipeline.run. Subclasses override the methods they need.
+    """
+    def stage_error(self, stage_name, error):
+        """
+        Called when a stage raises an error.
+
+        :param stage_name: The name the stage's metrics are kept under
+        :param error: The exception
+        """
+        pass
+
+    def run_finished(self, metrics, seconds):
+        """
+        Called at the end of every run, including runs that raised an error.
+
+        :param metrics: The metrics dictionary of the context, accumulated over all runs
+        :param seconds: The wall time of this run
+        """
+        pass
+
+class LoggingMetricsHook(MetricsHook):
+    """
+    Logs stage errors and a line per stage at the end of each run.
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def stage_error(self, stage_name, error):
+        self.logger.error('Stage %s failed: %r', stage_name, error)
+
+    def run_finished(self, metrics, seconds):
+        self.logger.log(self.level, 'Pipeline run took %.3f s', seconds)
+        for name, stage_metrics in metrics.items():
+            self.logger.log(self.level, '  %s: %d calls, %.3f s, %d in, %d out, %d errors', name,
+                            stage_metrics['calls'], stage_metrics['seconds'], stage_metrics['input_size'],
+                            stage_metrics['output_size'], stage_metrics['errors'])
+
+class JsonMetricsHook(MetricsHook):
+    """
+    Writes the metrics to a JSON file at the end of each run.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def run_finished(self, metrics, seconds):
+        with open(self.path, 'w') as fd:
+            json.dump({'seconds': seconds, 'stages': metrics}, fd, indent=2)
+
+def new_stage_metrics():
+    """
+    Create the metrics entry of a stage.
+
+    :return: A dictionary of zeroed metrics
+    """
+    return {
+        'calls': 0,
+        'seconds': 0.0,
+        'input_size': 0,
+        'output_size': 0,
+        'errors': 0,
+        'last_error': None
+    }
+
+def stage_name(stage):
+    """
+    Get a readable name for a stage.
+
+    :param stage: A stage
+    :return: The name of the stage function, or of its type
+    """
+    return getattr(stage, '__name__', type(stage).__name__)
+
+def _size(data):
+    """
+    Get the size of a value passed between stages.
+
+    :param data: The value
+    :return: len(data), or None if data has no length
+    """
+    if isinstance(data, abc.Sized):
+        return len(data)
+    return None
+
+class _StageTracer:
+    """
+    Records the metrics of one pipeline run.
+
+    Stage calls and pulls from streamed stages nest, so a stack of running timers lets each stage be
+    charged only for its own time.
+    """
+    def __init__(self, context):
+        self.context = context
+        self.stack = []
+        self.last_error = None
+        self.start = time.perf_counter()
+
+    def call(self, index, stage, data):
+        name = '{}:{}'.format(index, stage_name(stage))
+        metrics = self.context.metrics.setdefault(name, new_stage_metrics())
+        metrics['calls'] += 1
+
+        if isinstance(data, _TracedStream):
+            # records are counted as this stage pulls them
+            data.consumer = metrics
+        else:
+            metrics['input_size'] += _size(data) or 0
+
+        self.enter()
+        try:
+            output = stage(data, self.context)
+        except Exception as e:
+            self.error(name, metrics, e)
+            raise
+        finally:
+            self.exit(metrics)
+
+        if isinstance(output, abc.Iterator):
+            return _TracedStream(self, name, metrics, output)
+
+        metrics['output_size'] += _size(output) or 0
+        return output
+
+    def enter(self):
+        self.stack.append([time.perf_counter(), 0.0])
+
+    def exit(self, metrics):
+        start, child_time = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        metrics['seconds'] += elapsed - child_time
+
+        if self.stack:
+            self.stack[-1][1] += elapsed
+
+    def error(self, name, metrics, error):
+        # an error raised while streaming passes through every later stage; charge only the stage raising it
+        if error is self.last_error:
+            return
+        self.last_error = error
+
+        metrics['errors'] += 1
+        metrics['last_error'] = repr(error)
+        for hook in self.context.metrics_hooks:
+            hook.stage_error(name, error)
+
+    def finish(self):
+        seconds = time.perf_counter() - self.start
+        for hook in self.context.metrics_hooks:
+            hook.run_finished(self.context.metrics, seconds)
+
+class _TracedStream(abc.Iterator):
+    """
+    Wraps the iterator a stage returned to time and count the records it yields.
+    """
+    def __init__(self, tracer, name, metrics, records):
+        self.tracer = tracer
+        self.name = name
+        self.metrics = metrics
+        self.records = records
+        self.consumer = None
+
+    def __next__(self):
+        self.tracer.enter()
+        try:
+            record = next(self.records)
+        except StopIteration:
+            raise
+        except Exception as e:
+            self.tracer.error(self.name, self.metrics, e)
+            raise
+        finally:
+            self.tracer.exit(self.metrics)
+
+        self.metrics['output_size'] += 1
+        if self.consumer is not None:
+            self.consumer['input_size'] += 1
+        return record
+
+def _run_pipeline(pipeline, data, executor=None):
+    """
+    Run a pipeline, on an executor if one is given.
+
+    :param pipeline: The pipeline to run
+    :param data: Seed for the data
+    :param executor: An executor to run the pipeline on (optional)
+    :return: The return value of the pipeline
+    """
+    if executor is None:
+        return pipeline.run(data)
+    return executor.submit(pipeline.run, data).result()
+
 # Verification functions
 def verify_context(context, function_name):
     """
@@ -250,6 +605,232 @@ def create_url_reader(url=None, context=None):
 
     return reader, context
 
+def create_cached_url_reader(url=None, cache=None, context=None):
+    """
+    Create a url reader that sends a conditional request and reuses the cached response if it has not changed.
+
+    The response body is stored in the cache with its ETag and Last-Modified headers. Later reads send them
+    back as If-None-Match and If-Modified-Since, and a 304 Not Modified response returns the cached body
+    without downloading it. Hits and misses are counted in context.data['cache_stats'].
+
+    :param url: The url to read data from
+    :param cache: A StageCache
+    :param context: A context object that will be assigned a url for this reader
+    :return: A function that reads data from a url, and the modified context object
+    """
+    verify_context(context, 'cached url reader')
+    context, options_id = context.add_options({
+        'url': url
+    })
+    stats = _new_cache_stats(context, options_id)
+
+    def reader(data, context):
+        url = context.options[options_id]['url']
+        key = cache.make_key('url', url)
+        hit, cached = cache.get(key)
+
+        request = Request(url)
+        if hit:
+            if cached['etag']:
+                request.add_header('If-None-Match', cached['etag'])
+            if cached['last_modified']:
+                request.add_header('If-Modified-Since', cached['last_modified'])
+
+        try:
+            with urlopen(request) as response:
+                body = response.read()
+                headers = response.headers
+        except HTTPError as e:
+            if hit and e.code == 304:
+                stats['hits'] += 1
+                return cached['body']
+            raise
+
+        stats['misses'] += 1
+        if headers.get('ETag') or headers.get('Last-Modified'):
+            cache.put(key, {
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'body': body
+            })
+        return body
+
+    return reader, context
+
+def create_file_line_reader(path=None, mode='r', context=None):
+    """
+    Create a streaming file reader that yields the lines of a file without their line endings.
+
+    :param path: The path to the file to be read
+    :param mode: The mode of the file reader
+    :param context: A context object that will be assigned the given path and mode for this reader
+    :return: A function that returns an iterator over the lines of a file, and the modified context object
+    """
+    verify_context(context, 'file line reader')
+    context, options_id = context.add_options({
+        'path': path,
+        'mode': mode
+    })
+    def reader(data, context):
+        path = context.options[options_id]['path']
+        mode = context.options[options_id]['mode']
+        line_end = b'\r\n' if 'b' in mode else '\r\n'
+        with open(path, mode) as fd:
+            for line in fd:
+                yield line.rstrip(line_end)
+
+    return reader, context
+
+def create_file_chunk_reader(path=None, mode='r', chunk_size=DEFAULT_CHUNK_SIZE, context=None):
+    """
+    Create a streaming file reader that yields a file in chunks.
+
+    :param path: The path to the file to be read
+    :param mode: The mode of the file reader
+    :param chunk_size: The maximum number of characters (or bytes in binary mode) per chunk
+    :param context: A context object that will be assigned the given path, mode and chunk size for this reader
+    :return: A function that returns an iterator over the chunks of a file, and the modified context object
+    """
+    verify_context(context, 'file chunk reader')
+    context, options_id = context.add_options({
+        'path': path,
+        'mode': mode,
+        'chunk_size': chunk_size
+    })
+    def reader(data, context):
+        path = context.options[options_id]['path']
+        mode = context.options[options_id]['mode']
+        chunk_size = context.options[options_id]['chunk_size']
+        with open(path, mode) as fd:
+            for chunk in iter(partial(fd.read, chunk_size), fd.read(0)):
+                yield chunk
+
+    return reader, context
+
+def create_url_line_reader(url=None, encoding='utf-8', context=None):
+    """
+    Create a streaming url reader that yields the decoded lines of the response without their line endings.
+
+    :param url: The url to read data from
+    :param encoding: The encoding of the response
+    :param context: A context object that will be assigned a url and encoding for this reader
+    :return: A function that returns an iterator over the lines of a url, and the modified context object
+    """
+    verify_context(context, 'url line reader')
+    context, options_id = context.add_options({
+        'url': url,
+        'encoding': encoding
+    })
+    def reader(data, context):
+        url = context.options[options_id]['url']
+        encoding = context.options[options_id]['encoding']
+        with urlopen(url) as response:
+            for line in response:
+                yield line.decode(encoding, 'replace').rstrip('\r\n')
+
+    return reader, context
+
+def create_url_chunk_reader(url=None, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None, context=None):
+    """
+    Create a streaming url reader that yields the response in chunks.
+
+    :param url: The url to read data from
+    :param chunk_size: The maximum number of bytes read per chunk
+    :param encoding: If given, chunks are decoded to strings with this encoding; otherwise they are bytes
+    :param context: A context object that will be assigned a url, chunk size and encoding for this reader
+    :return: A function that returns an iterator over the chunks of a url, and the modified context object
+    """
+    verify_context(context, 'url chunk reader')
+    context, options_id = context.add_options({
+        'url': url,
+        'chunk_size': chunk_size,
+        'encoding': encoding
+    })
+    def reader(data, context):
+        url = context.options[options_id]['url']
+        chunk_size = context.options[options_id]['chunk_size']
+        encoding = context.options[options_id]['encoding']
+        # an incremental decoder keeps multi-byte characters split across chunks intact
+        decoder = codecs.getincrementaldecoder(encoding)('replace') if encoding else None
+        with urlopen(url) as response:
+            for chunk in iter(partial(response.read, chunk_size), b''):
+                yield decoder.decode(chunk) if decoder else chunk
+            if decoder:
+                tail = decoder.decode(b'', final=True)
+                if tail:
+                    yield tail
+
+    return reader, context
+
+# Parsers
+def create_json_lines_parser(context=None):
+    """
+    Create a streaming parser that yields the JSON value on each non-blank line.
+
+    :param context: A context object
+    :return: A function that returns an iterator over parsed values, and the context object
+    """
+    verify_context(context, 'JSON lines parser')
+    def parser(lines, context):
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+    return parser, context
+
+def create_json_array_parser(context=None):
+    """
+    Create a streaming parser that yields the items of a JSON array read in chunks of text.
+
+    Only one chunk and the item being parsed are held in memory at a time.
+
+    :param context: A context object
+    :return: A function that returns an iterator over the items of the array, and the context object
+    """
+    verify_context(context, 'JSON array parser')
+    def parser(chunks, context):
+        return iter_json_array(chunks)
+
+    return parser, context
+
+# Serializers
+def create_json_lines_serializer(context=None):
+    """
+    Create a streaming serializer that yields each record as a line of JSON (without the line ending).
+
+    :param context: A context object
+    :return: A function that returns an iterator over serialized records, and the context object
+    """
+    verify_context(context, 'JSON lines serializer')
+    def serializer(records, context):
+        for record in records:
+            yield json.dumps(record)
+
+    return serializer, context
+
+def create_json_array_serializer(newline=False, context=None):
+    """
+    Create a streaming serializer that yields a single JSON array of the records in chunks.
+
+    :param newline: If True, end the array with a newline
+    :param context: A context object that will be assigned the newline option for this serializer
+    :return: A function that returns an iterator over chunks of the array, and the modified context object
+    """
+    verify_context(context, 'JSON array serializer')
+    context, options_id = context.add_options({
+        'newline': newline
+    })
+    def serializer(records, context):
+        separator = '['
+        for record in records:
+            yield separator + json.dumps(record)
+            separator = ', '
+
+        end = ']\n' if context.options[options_id]['newline'] else ']'
+        yield '[' + end if separator == '[' else end
+
+    return serializer, context
+
 # Writers
 def create_terminal_writer(context=None):
     """
@@ -259,6 +840,13 @@ def create_terminal_writer(context=None):
     """
     verify_context(context, 'terminal writer')
     def writer(data, context):
+        if is_stream(data):
+            count = 0
+            for record in data:
+                print(record)
+                count += 1
+            return count
+
         print(data)
         return data
 
@@ -266,7 +854,10 @@ def create_terminal_writer(context=None):
 
 def create_file_writer(path=None, mode='a+', newline=False, context=None):
     """
-    Create a file reader with the given path.
+    Create a file writer with the given path.
+
+    The writer accepts either a single value or an iterable of records, which are written in order
+    through one file handle.
 
     :param path: The path to the file to write to (optional)
     :return: A function that writes to a file for a path
@@ -281,17 +872,147 @@ def create_file_writer(path=None, mode='a+', newline=False, context=None):
         """
         Write data to a file
 
-        :data: Data to write
+        :data: Data to write, or an iterable of records to write
         :context: A context object that should contain the path, mode and newline option for
                   the writer.
+        :return: The number of records written if data is an iterable of records
         """
         path = context.options[options_id]['path']
         mode = context.options[options_id]['mode']
         newline = context.options[options_id]['newline']
         with open(path, mode) as fd:
-            if newline:
-                data += '\n'
+            if is_stream(data):
+                count = 0
+                for record in data:
+                    fd.write(record)
+                    if newline:
+                        fd.write('\n')
+                    count += 1
+                return count
+
             fd.write(data)
+            if newline:
+                fd.write('\n')
+        return data
+
+    return writer, context
+
+class FileWriterResource:
+    """
+    A file kept open across writes and pipeline runs, with optional rotation by size.
+
+    The file is opened on the first write (or by open()) with a large buffer. When max_bytes is set and a
+    write would take the file past it, the file is rotated like logging.handlers.RotatingFileHandler:
+    path.1 becomes path.2 and so on, up to backup_count backups, and the full file becomes path.1.
+    """
+    def __init__(self, path, mode='a', newline=False, buffering=DEFAULT_BUFFER_SIZE, max_bytes=None,
+                 backup_count=DEFAULT_BACKUP_COUNT, encoding='utf-8'):
+        self.path = Path(path)
+        self.mode = mode
+        self.binary = 'b' in mode
+        self.newline = (b'\n' if self.binary else '\n') if newline else None
+        self.buffering = buffering
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.encoding = None if self.binary else encoding
+        self.fd = None
+        self.size = 0
+
+    def open(self):
+        """
+        Open the file if it is not open.
+        """
+        if self.fd is not None:
+            return
+        self.fd = open(str(self.path), self.mode, buffering=self.buffering, encoding=self.encoding)
+        self.size = self.fd.tell() if 'a' in self.mode else 0
+
+    def write(self, record):
+        """
+        Write a record, followed by a newline if the resource was created with newline=True.
+
+        :param record: A string, or bytes if the file is binary
+        :return: The record
+        """
+        if self.fd is None:
+            self.open()
+
+        if self.max_bytes is not None:
+            size = len(record) if self.binary else len(record.encode(self.encoding))
+            if self.newline is not None:
+                size += 1
+            if self.size and self.size + size > self.max_bytes:
+                self.rotate()
+            self.size += size
+
+        self.fd.write(record)
+        if self.newline is not None:
+            self.fd.write(self.newline)
+        return record
+
+    def rotate(self):
+        """
+        Close the file, shift it and its backups and start a new file.
+        """
+        self.close()
+
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = self.path.with_name('{}.{}'.format(self.path.name, i))
+                if source.exists():
+                    source.replace(self.path.with_name('{}.{}'.format(self.path.name, i + 1)))
+            self.path.replace(self.path.with_name(self.path.name + '.1'))
+        else:
+            self.path.unlink()
+
+        self.fd = open(str(self.path), self.mode.replace('a', 'w'), buffering=self.buffering, encoding=self.encoding)
+        self.size = 0
+
+    def flush(self):
+        """
+        Flush buffered records to the file.
+        """
+        if self.fd is not None:
+            self.fd.flush()
+
+    def close(self):
+        """
+        Flush and close the file. It is reopened on the next write.
+        """
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+
+def create_buffered_file_writer(path=None, mode='a', newline=False, buffering=DEFAULT_BUFFER_SIZE, max_bytes=None,
+                                backup_count=DEFAULT_BACKUP_COUNT, context=None):
+    """
+    Create a file writer that keeps its file open across records and runs and passes written data through.
+
+    The file is a FileWriterResource registered on the context, so it is flushed and closed by
+    Pipeline.teardown() (or on leaving a with block on the pipeline), not after every write.
+
+    :param path: The path to the file to write to
+    :param mode: The mode of the file, 'a' or 'w' with an optional 'b'
+    :param newline: If True, write a newline after every record
+    :param buffering: The buffer size of the file
+    :param max_bytes: Rotate the file before it would grow past this many bytes (optional)
+    :param backup_count: The number of rotated files to keep
+    :param context: A context object that the file resource will be added to
+    :return: A function that writes data and returns it, and the modified context object. An iterator of
+             records (as passed between stages in streaming mode) is written lazily, yielding each record as
+             it is written; any other iterable of records is written immediately and returned as a list.
+    """
+    verify_context(context, 'buffered file writer')
+    resource = FileWriterResource(path, mode=mode, newline=newline, buffering=buffering, max_bytes=max_bytes,
+                                  backup_count=backup_count)
+    context.add_resource(resource)
+
+    def writer(data, context):
+        if isinstance(data, abc.Iterator):
+            return map(resource.write, data)
+        if is_stream(data):
+            return [resource.write(record) for record in data]
+        return resource.write(data)
 
     return writer, context
 
@@ -330,6 +1051,289 @@ def create_packing_stage(func):
     verify_stage(func)
     return lambda data: (data, func(data))
 
+def create_batching_stage(stage, batch_size=DEFAULT_BATCH_SIZE, max_latency=None, unbatch=True, context=None):
+    """
+    Create a streaming stage that runs a stage over batches of records.
+
+    Records are grouped into lists of at most batch_size records. If max_latency is given, a batch is also
+    closed once max_latency seconds have passed since its first record arrived; since records are pulled,
+    this is checked as each record arrives. The stage is called once per batch as stage(batch, context),
+    so per-call overhead (a bulk parse, a bulk write) is paid once per batch rather than once per record.
+
+    The number of batches and records and the total and maximum time spent in the stage per batch are kept
+    in context.data['batch_stats'] under the options id of this stage.
+
+    :param stage: A stage that takes a list of records
+    :param batch_size: The maximum number of records per batch
+    :param max_latency: The maximum number of seconds a batch is held open (optional)
+    :param unbatch: If True, yield each record of the iterable the stage returns; otherwise yield what the
+                    stage returns for each batch
+    :param context: A context object that will be assigned the batching options for this stage
+    :return: A function that returns an iterator over the output of the stage, and the modified context object
+    """
+    verify_context(context, 'batching stage')
+    context, options_id = context.add_options({
+        'batch_size': batch_size,
+        'max_latency': max_latency,
+        'unbatch': unbatch
+    })
+    stats = context.data.setdefault('batch_stats', {})[options_id] = {
+        'batches': 0,
+        'records': 0,
+        'seconds': 0.0,
+        'max_seconds': 0.0
+    }
+
+    def batching_stage(data, context):
+        options = context.options[options_id]
+        for batch in batched(data, options['batch_size'], options['max_latency']):
+            start = time.perf_counter()
+            output = stage(batch, context)
+            if options['unbatch']:
+                output = list(output)
+            elapsed = time.perf_counter() - start
+
+            stats['batches'] += 1
+            stats['records'] += len(batch)
+            stats['seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+            if options['unbatch']:
+                yield from output
+            else:
+                yield output
+
+    return batching_stage, context
+
+class StageCache:
+    """
+    A directory of pickled stage outputs with least recently used eviction.
+
+    Each entry is one file named by its key. A value is stored as one pickle; a stream of records is stored as
+    one pickle per record, so it is written and read back one record at a time. Reading an entry updates its
+    modification time, and when the entries take up more than max_bytes the least recently used ones are
+    deleted.
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.sizes = {path.name: path.stat().st_size for path in self.directory.glob('*.pickle')}
+        self.total_bytes = sum(self.sizes.values())
+
+    @staticmethod
+    def _new_digest(namespace):
+        digest = hashlib.sha256(namespace.encode('utf-8'))
+        digest.update(b'\0')
+        return digest
+
+    @staticmethod
+    def make_key(namespace, data):
+        """
+        Make a cache key from the content of some data.
+
+        :param namespace: A string that separates the entries of different stages
+        :param data: A string, bytes or any picklable value
+        :return: A hex digest
+        """
+        digest = StageCache._new_digest(namespace)
+        if isinstance(data, str):
+            digest.update(data.encode('utf-8'))
+        elif isinstance(data, (bytes, bytearray)):
+            digest.update(data)
+        else:
+            digest.update(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+        return digest.hexdigest()
+
+    def spool(self, namespace, records):
+        """
+        Make a cache key from a stream of records, writing them to a temporary file as they are hashed.
+
+        :param namespace: A string that separates the entries of different stages
+        :param records: An iterable of picklable records
+        :return: A hex digest, and the temporary file positioned at its start (see read_records())
+        """
+        digest = self._new_digest(namespace)
+        spool_file = tempfile.TemporaryFile(dir=str(self.directory))
+        try:
+            for record in records:
+                data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+                digest.update(data)
+                spool_file.write(data)
+            spool_file.seek(0)
+        except BaseException:
+            spool_file.close()
+            raise
+
+        return digest.hexdigest(), spool_file
+
+    @staticmethod
+    def read_records(fd):
+        """
+        Read back the records of a spool file or stream entry, closing the file at the end.
+
+        :param fd: A binary file of consecutive pickles
+        :return: An iterator over the records
+        """
+        with fd:
+            while True:
+                try:
+                    yield pickle.load(fd)
+                except EOFError:
+                    return
+
+    def _path(self, key):
+        return self.directory / (key + '.pickle')
+
+    def _stream_path(self, key):
+        return self.directory / (key + '.stream.pickle')
+
+    def get(self, key):
+        """
+        Get an entry.
+
+        :param key: The key of the entry
+        :return: (True, value) if the entry exists, otherwise (False, None)
+        """
+        path = self._path(key)
+        try:
+            with path.open('rb') as fd:
+                value = pickle.load(fd)
+        except FileNotFoundError:
+            return False, None
+
+        os.utime(str(path))
+        return True, value
+
+    def get_stream(self, key):
+        """
+        Get an entry stored by put_stream().
+
+        :param key: The key of the entry
+        :return: (True, iterator over the records) if the entry exists, otherwise (False, None)
+        """
+        path = self._stream_path(key)
+        try:
+            fd = path.open('rb')
+        except FileNotFoundError:
+            return False, None
+
+        os.utime(str(path))
+        return True, self.read_records(fd)
+
+    def put(self, key, value):
+        """
+        Store an entry, then evict least recently used entries until the cache fits in max_bytes.
+
+        :param key: The key of the entry
+        :param value: A picklable value
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.directory), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            pickle.dump(value, tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._commit(tmp_path, self._path(key))
+
+    def put_stream(self, key, records):
+        """
+        Store a stream of records as they pass through. The entry is only stored if the stream is consumed to
+        the end; least recently used entries are then evicted until the cache fits in max_bytes.
+
+        :param key: The key of the entry
+        :param records: An iterable of picklable records
+        :return: An iterator over the records
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.directory), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for record in records:
+                    pickle.dump(record, tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield record
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        self._commit(tmp_path, self._stream_path(key))
+
+    def _commit(self, tmp_path, path):
+        os.replace(tmp_path, str(path))
+
+        size = path.stat().st_size
+        self.total_bytes += size - self.sizes.get(path.name, 0)
+        self.sizes[path.name] = size
+        self._evict(keep=path.name)
+
+    def _evict(self, keep):
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        paths = [self.directory / name for name in self.sizes if name != keep]
+        for path in sorted(paths, key=lambda path: path.stat().st_mtime):
+            if self.total_bytes <= self.max_bytes:
+                break
+            path.unlink()
+            self.total_bytes -= self.sizes.pop(path.name)
+
+def create_caching_stage(stage, cache, namespace=None, context=None):
+    """
+    Create a stage that returns the stored output of a stage for input it has seen before.
+
+    The key is a hash of the input, so unchanged input skips the wrapped stage entirely. An iterator of input
+    records is hashed one record at a time while it is spooled to a temporary file in the cache directory, and
+    the wrapped stage reads it back from there on a miss. An iterator of output records is stored one record
+    at a time as later stages consume it, and read back one at a time on a hit, so a cached stage keeps the
+    memory bound of a streaming pipeline. Hits and misses are counted in context.data['cache_stats'] under the
+    options id of this stage.
+
+    :param stage: The stage to cache; its input records and output must be picklable
+    :param cache: A StageCache
+    :param namespace: A name that separates the entries of this stage from others in the same cache
+                      (defaults to the name of the stage)
+    :param context: A context object that will be assigned the namespace for this stage
+    :return: A function that runs the stage or returns its cached output, and the modified context object
+    """
+    verify_context(context, 'caching stage')
+    context, options_id = context.add_options({
+        'namespace': namespace or stage_name(stage)
+    })
+    stats = _new_cache_stats(context, options_id)
+
+    def caching_stage(data, context):
+        spool_file = None
+        if isinstance(data, abc.Iterator):
+            key, spool_file = cache.spool(context.options[options_id]['namespace'], data)
+        else:
+            key = cache.make_key(context.options[options_id]['namespace'], data)
+
+        hit, output = cache.get_stream(key)
+        if not hit:
+            hit, output = cache.get(key)
+
+        if hit:
+            stats['hits'] += 1
+            if spool_file is not None:
+                spool_file.close()
+            return output
+
+        stats['misses'] += 1
+        if spool_file is not None:
+            data = cache.read_records(spool_file)
+
+        output = stage(data, context)
+        if isinstance(output, abc.Iterator):
+            return cache.put_stream(key, output)
+
+        cache.put(key, output)
+        return output
+
+    return caching_stage, context
+
+def _new_cache_stats(context, options_id):
+    stats = context.data.setdefault('cache_stats', {})[options_id] = {
+        'hits': 0,
+        'misses': 0
+    }
+    return stats
+
 
 # Utility functions
 def collection_version(func):
@@ -345,6 +1349,179 @@ def collection_version(func):
 
     return apply_func_to_collection
 
+def streaming_version(func):
+    """
+    Creates a streaming stage that lazily applies a function to each record.
+
+    :param func: A function that takes one argument
+    :return: A stage that takes an iterable of records and returns an iterator over func applied to each
+    """
+    def apply_func_to_stream(data, context):
+        for elem in data:
+            yield func(elem)
+
+    return apply_func_to_stream
+
+def parallel_version(func, executor, max_pending=DEFAULT_MAX_PENDING):
+    """
+    Creates a streaming stage that applies a function to each record on an executor.
+
+    Results are yielded in the order of the records. At most max_pending records are in flight at once,
+    so a stream of any length can be processed without submitting it all up front.
+
+    :param func: A function that takes one argument (module level if the executor is a process pool)
+    :param executor: A concurrent.futures executor
+    :param max_pending: The maximum number of records submitted and not yet yielded
+    :return: A stage that takes an iterable of records and returns an iterator over func applied to each
+    """
+    def apply_func_in_parallel(data, context):
+        pending = deque()
+        for elem in data:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, elem))
+
+        while pending:
+            yield pending.popleft().result()
+
+    return apply_func_in_parallel
+
+def batched(records, batch_size=DEFAULT_BATCH_SIZE, max_latency=None):
+    """
+    Group records into lists.
+
+    :param records: An iterable of records
+    :param batch_size: The maximum number of records per batch
+    :param max_latency: The maximum number of seconds since the first record of a batch before the batch
+                        is yielded, checked as each record arrives (optional)
+    :return: An iterator over lists of records
+    """
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1, got {}'.format(batch_size))
+
+    batch = []
+    deadline = None
+    for record in records:
+        if not batch and max_latency is not None:
+            deadline = time.monotonic() + max_latency
+
+        batch.append(record)
+
+        if len(batch) >= batch_size or (deadline is not None and time.monotonic() >= deadline):
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+def is_stream(data):
+    """
+    Check whether data is a stream of records rather than a single value.
+
+    :param data: The data passed to a stage
+    :return: True if data is iterable and not a string, bytes or dictionary
+    """
+    return isinstance(data, abc.Iterable) and not isinstance(data, (str, bytes, bytearray, dict))
+
+def drain(records):
+    """
+    Consume an iterator of records.
+
+    :param records: An iterable of records
+    :return: The number of records consumed
+    """
+    count = 0
+    for _ in records:
+        count += 1
+    return count
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_NUMBER_CONTINUATION = frozenset('.eE+-')
+_ARRAY_START, _ARRAY_FIRST_ITEM, _ARRAY_ITEM, _ARRAY_SEPARATOR, _ARRAY_END = range(5)
+
+def iter_json_array(chunks):
+    """
+    Incrementally parse a JSON array from chunks of text.
+
+    :param chunks: An iterable of strings that together form one JSON array (a single string also works)
+    :return: An iterator over the items of the array
+    :raise: ValueError if the text is not a single well-formed JSON array
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    state = _ARRAY_START
+
+    for chunk in chunks:
+        items, buffer, state = _scan_json_array(decoder, buffer + chunk, state, False)
+        yield from items
+
+    items, buffer, state = _scan_json_array(decoder, buffer, state, True)
+    yield from items
+
+    if state != _ARRAY_END:
+        raise ValueError('Unterminated JSON array')
+
+def _scan_json_array(decoder, buffer, state, final):
+    """
+    Parse as many array items as possible from a buffer.
+
+    :param decoder: A json.JSONDecoder
+    :param buffer: Unparsed text
+    :param state: The parser state after the text parsed so far
+    :param final: True if no more text will follow
+    :return: The items parsed, the unparsed rest of the buffer and the new state
+    """
+    items = []
+    pos = 0
+    length = len(buffer)
+
+    while True:
+        pos = _JSON_WHITESPACE.match(buffer, pos).end()
+        if pos >= length:
+            break
+
+        char = buffer[pos]
+
+        if state == _ARRAY_START:
+            if char != '[':
+                raise ValueError('Expected a JSON array at position {}'.format(pos))
+            state = _ARRAY_FIRST_ITEM
+            pos += 1
+        elif state == _ARRAY_SEPARATOR:
+            if char == ',':
+                state = _ARRAY_ITEM
+            elif char == ']':
+                state = _ARRAY_END
+            else:
+                raise ValueError('Expected , or ] in JSON array, got {!r}'.format(char))
+            pos += 1
+        elif state == _ARRAY_END:
+            raise ValueError('Extra data after JSON array')
+        elif char == ']' and state == _ARRAY_FIRST_ITEM:
+            state = _ARRAY_END
+            pos += 1
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if final:
+                    raise
+                # the item continues in the next chunk
+                break
+
+            if not final and (end == length or buffer[end] in _JSON_NUMBER_CONTINUATION):
+                # a number cut off by the end of the buffer may continue in the next chunk
+                break
+
+            items.append(item)
+            state = _ARRAY_SEPARATOR
+            pos = end
+
+    return items, buffer[pos:], state
+
 def filter_dict(d, f):
     return {k: v for k, v in d.items() if f(v)}
 
@@ -24,14 +24,21 @@ import json
 import datetime
 import zipfile
 import csv
+import io
+import struct
+import hashlib
 import argparse
 import re
 import locale
-import copy
 import time
+import math
+import sqlite3
+from array import array
+from bisect import bisect_left
 from functools import reduce
-from collections import OrderedDict
+from collections import OrderedDict, ChainMap
 import requests
+from pivt.archive_store import ArchiveStore
 from pivt.util import util
 from pivt.util import Constants
 
@@ -59,6 +66,7 @@ CI_SUBS = {
 ITERATION_REX = re.compile(r'\d+\.\d+')
 
 CQ_INDEX = 'pivt_cq'
+CQ_VERSION_FIELD = 'cq_version'
 PIVT_APP = 'pivt'
 
 SPLUNK_USERNAME = "script_user"
@@ -75,12 +83,15 @@ class Processor:
 
         self.args = self.parse_args(args)
 
+        if self.args.profile:
+            util.profiler.enable(cprofile=self.args.profile == 'cprofile')
+
         self.sources = {
             'jenkins': ProductSource(),
             'ins': InsSource(),
             'vic': VicSource(),
             'cq': CqSource(),
-            'cq_old': CqSourceOld(),
+            'cq_old': CqSourceOld(incremental=util.get_boolean_setting('process', 'cq_incremental', False)),
             'vic_status': VicStatusSource()
         }
 
@@ -89,6 +100,16 @@ class Processor:
         Process the data.
         :return:
         """
+        with util.profiler.span('Processor.main'):
+            self._main()
+
+        if util.profiler.enabled:
+            for path in util.profiler.write(util.log_dir, 'process'):
+                self.logger.info('Wrote profile %s', path)
+
+        self.logger.info('Done')
+
+    def _main(self):
         # create archive directory if it doesn't exist
         util.archive_dir.mkdir(parents=True, exist_ok=True)
 
@@ -106,20 +127,26 @@ class Processor:
 
         # SETUP
         for source in self.sources.values():
-            source.setup()
+            with util.profiler.span('{0}.setup'.format(type(source).__name__)):
+                source.setup()
 
         if archive_paths:
-            self.sources['cq_old'].load_existing_data()
+            with util.profiler.span('CqSourceOld.load_existing_data'):
+                self.sources['cq_old'].load_existing_data()
 
         # PROCESS
         # extract archives, pull out relevant data, and process jenkins and ins data
         # (we leave CQ processing until after)
         for archive_path in archive_paths:
             archive = Archive(archive_path, self.sources)
-            archive.load(archive_paths, self.args.reverse)
+            with util.profiler.span('Archive.load'):
+                archive.load(archive_paths, self.args.reverse)
 
         for source in self.sources.values():
-            source.finish()
+            with util.profiler.span('{0}.finish'.format(type(source).__name__)):
+                source.finish()
+
+        self._log_memory_usage()
 
         util.update_dashboards(SPLUNK_PATH, self.logger, get_new_date=True)
 
@@ -127,7 +154,16 @@ class Processor:
         self.logger.info('Refreshing %s app', PIVT_APP)
         Processor.refresh_app(PIVT_APP)
 
-        self.logger.info('Done')
+    def _log_memory_usage(self):
+        """
+        Log the memory held by each source's event keys.
+        """
+        self.logger.info('Event key memory usage:')
+
+        col_width = max(len(name) for name in self.sources)
+        for name, source in self.sources.items():
+            num_keys, num_bytes = source.get_key_memory_usage()
+            self.logger.info('%s keys: %s, memory: %.1f MiB', name.ljust(col_width), num_keys, num_bytes / 1024 / 1024)
 
     @staticmethod
     def parse_args(args):
@@ -141,6 +177,8 @@ class Processor:
         # parser.add_argument('--no-cq', dest='process_cq', action='store_false')
         # parser.add_argument('--no-ins', dest='process_ins', action='store_false')
         parser.add_argument('--reverse', dest='reverse', action='store_true')
+        parser.add_argument('--profile', dest='profile', nargs='?', const='spans', choices=['spans', 'cprofile'],
+                            help='write timing spans (and with "cprofile", cProfile stats) to the log directory')
         # parser.set_defaults(process_jenkins=True)
         # parser.set_defaults(process_ins=True)
         # parser.set_defaults(process_cq=True)
@@ -227,6 +265,368 @@ class Processor:
         return '/servicesNS/nobody/{0}'.format(app_name)
 
 
+class CompactKeySet:
+    """
+    Memory-compact set of event keys.
+
+    Keys are stored as 64-bit hashes instead of strings. Keys given to the constructor (usually every key in a DB
+    file) are kept in a sorted array and looked up by bisection. Keys added afterwards are kept in a dict of hash to
+    key so that two different added keys with the same hash are both kept exactly. A set loaded with from_db_file also
+    records where each event starts in the file, so a hash hit in the array is confirmed by reading the event back and
+    comparing exact keys. Hits on a set built from plain keys cannot be confirmed; they are counted and reported as
+    present.
+    """
+    def __init__(self, keys=()):
+        self.hashes = array('q', sorted({hash(key) for key in keys}))
+        self.num_hashes = len(self.hashes)
+        self.offsets = None
+        self.db_file = None
+        self.get_key = None
+        self.added = {}
+        self.collisions = set()
+        self.stats = {'unconfirmed': 0, 'false_hits': 0}
+        self.logger = util.get_logger(self)
+
+    @classmethod
+    def from_db_file(cls, db_file, get_key):
+        """
+        Create a set of the keys of the events in a DB file.
+        :param db_file: path to the DB file, one event per line
+        :param get_key: function that returns the key of a raw event
+        :return: the CompactKeySet
+        """
+        entries = []
+        offset = 0
+
+        with db_file.open('rb') as file:
+            for line in file:
+                entries.append((hash(get_key(line.decode('utf-8'))), offset))
+                offset += len(line)
+
+        entries.sort()
+
+        key_set = cls()
+        key_set.hashes = array('q', (entry[0] for entry in entries))
+        key_set.offsets = array('q', (entry[1] for entry in entries))
+        key_set.num_hashes = len({entry[0] for entry in entries})
+        key_set.db_file = db_file
+        key_set.get_key = get_key
+        return key_set
+
+    def __contains__(self, key):
+        key_hash = hash(key)
+
+        added_key = self.added.get(key_hash)
+        if added_key is not None and (added_key == key or key in self.collisions):
+            return True
+
+        index = bisect_left(self.hashes, key_hash)
+        if index == len(self.hashes) or self.hashes[index] != key_hash:
+            return False
+
+        if self.offsets is None:
+            self.stats['unconfirmed'] += 1
+            return True
+
+        return self._confirm(key, key_hash, index)
+
+    def _confirm(self, key, key_hash, index):
+        """
+        Check a hash hit in the sorted array against the exact keys of the events with that hash.
+        :param key: the key looked up
+        :param key_hash: hash of the key
+        :param index: index of the first matching hash in the array
+        :return: whether the key is present
+        """
+        with self.db_file.open('rb') as file:
+            while index < len(self.hashes) and self.hashes[index] == key_hash:
+                file.seek(self.offsets[index])
+                if self.get_key(file.readline().decode('utf-8')) == key:
+                    return True
+                index += 1
+
+        self.stats['false_hits'] += 1
+        self.logger.warning('Key %s collides with the hash of a different key in %s', key, self.db_file)
+        return False
+
+    def __len__(self):
+        return self.num_hashes + len(self.added) + len(self.collisions)
+
+    def add(self, key):
+        """
+        Add a key.
+        :param key: the key
+        """
+        key_hash = hash(key)
+
+        added_key = self.added.get(key_hash)
+        if added_key is None:
+            self.added[key_hash] = key
+        elif added_key != key:
+            self.collisions.add(key)
+
+    def get_memory_usage(self):
+        """
+        Estimate the memory held by this set.
+        :return: number of bytes
+        """
+        return (sys.getsizeof(self.hashes) + sys.getsizeof(self.offsets) + sys.getsizeof(self.added)
+                + sys.getsizeof(self.collisions)
+                + sum(sys.getsizeof(key) for key in self.added.values())
+                + sum(sys.getsizeof(key) for key in self.collisions))
+
+
+def make_key_set(keys=()):
+    """
+    Create a set of event keys, compact unless process.compact_keys is turned off.
+    :param keys: initial keys
+    :return: a CompactKeySet or set
+    """
+    if util.get_boolean_setting('process', 'compact_keys', True):
+        return CompactKeySet(keys)
+
+    return set(keys)
+
+
+def load_key_set(db_file, get_key):
+    """
+    Create a set of the keys of the events in a DB file, compact unless process.compact_keys is turned off.
+    :param db_file: path to the DB file, one event per line
+    :param get_key: function that returns the key of a raw event
+    :return: a CompactKeySet or set
+    """
+    if util.get_boolean_setting('process', 'compact_keys', True):
+        return CompactKeySet.from_db_file(db_file, get_key)
+
+    with db_file.open() as file:
+        return {get_key(line) for line in file}
+
+
+def get_key_set_memory_usage(key_set):
+    """
+    Estimate the memory held by a set of event keys.
+    :param key_set: a CompactKeySet or set
+    :return: number of bytes
+    """
+    if isinstance(key_set, (CompactKeySet, EventKeyIndex)):
+        return key_set.get_memory_usage()
+
+    return sys.getsizeof(key_set) + sum(sys.getsizeof(key) for key in key_set)
+
+
+class BloomFilter:
+    """
+    Bloom filter over string keys.
+
+    Bit positions are derived from a SHA-256 digest of the key, so a saved filter stays valid across runs.
+    """
+    HEADER = struct.Struct('<QQQQQ')  # capacity, number of bits, number of hashes, key count, indexed DB file size
+
+    def __init__(self, capacity, fp_rate, num_bits=None, num_hashes=None):
+        self.capacity = max(int(capacity), 1)
+
+        if num_bits is None:
+            num_bits = int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        self.num_bits = max(num_bits, 8)
+
+        if num_hashes is None:
+            num_hashes = round(self.num_bits / self.capacity * math.log(2))
+        self.num_hashes = max(num_hashes, 1)
+
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        hash1 = int.from_bytes(digest[:8], 'little')
+        hash2 = int.from_bytes(digest[8:16], 'little') | 1
+
+        for i in range(self.num_hashes):
+            yield (hash1 + i * hash2) % self.num_bits
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        """
+        Add a key.
+        :param key: the key
+        """
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def save(self, path, indexed_size):
+        """
+        Save the filter, writing to a temporary file first.
+        :param path: path to save to
+        :param indexed_size: size of the DB file the filter covers
+        """
+        temp_path = path.with_suffix('.tmp')
+        with temp_path.open('wb') as file:
+            file.write(self.HEADER.pack(self.capacity, self.num_bits, self.num_hashes, self.count, indexed_size))
+            file.write(self.bits)
+        temp_path.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a saved filter.
+        :param path: path to load from
+        :return: the filter and the size of the DB file it covers
+        """
+        with path.open('rb') as file:
+            capacity, num_bits, num_hashes, count, indexed_size = cls.HEADER.unpack(file.read(cls.HEADER.size))
+            bloom = cls(capacity, None, num_bits=num_bits, num_hashes=num_hashes)
+            bloom.bits = bytearray(file.read())
+            bloom.count = count
+
+        if len(bloom.bits) != (num_bits + 7) // 8:
+            raise ValueError('Truncated bloom filter {0}'.format(path))
+
+        return bloom, indexed_size
+
+
+class EventKeyIndex:
+    """
+    Persistent index of the event keys in one DB file.
+
+    A Bloom filter answers most lookups for new events without touching disk. Keys that may be present are checked
+    against an exact index in a SQLite database shared by the files of a source. Both record how much of the DB file
+    they cover, so each load only reads events appended since the last save. If the DB file shrinks, the index for it
+    is rebuilt.
+    """
+    MIN_CAPACITY = 100000
+
+    def __init__(self, db_file, index_dir, connection, get_key, fp_rate):
+        self.db_file = db_file
+        self.name = util.basename(db_file)
+        self.bloom_path = index_dir / (self.name + '.bloom')
+        self.connection = connection
+        self.get_key = get_key
+        self.fp_rate = fp_rate
+        self.logger = util.get_logger(self)
+
+        self.bloom = None
+        self.indexed_size = 0
+        self.stats = {'lookups': 0, 'negatives': 0, 'false_positives': 0}
+
+    @staticmethod
+    def connect(index_dir):
+        """
+        Open the key database for a source, creating it if needed.
+        :param index_dir: directory holding the source's index files
+        :return: the connection
+        """
+        index_dir.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(index_dir / 'keys.sqlite'))
+        connection.execute('CREATE TABLE IF NOT EXISTS keys (file TEXT, key TEXT, PRIMARY KEY (file, key)) '
+                           'WITHOUT ROWID')
+        connection.execute('CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, indexed_size INTEGER)')
+        return connection
+
+    def __contains__(self, key):
+        self.stats['lookups'] += 1
+
+        if key not in self.bloom:
+            self.stats['negatives'] += 1
+            return False
+
+        found = self.connection.execute('SELECT 1 FROM keys WHERE file = ? AND key = ?', (self.name, key)).fetchone()
+        if found is None:
+            self.stats['false_positives'] += 1
+            return False
+
+        return True
+
+    def __len__(self):
+        return self.bloom.count
+
+    def get_memory_usage(self):
+        return sys.getsizeof(self.bloom.bits)
+
+    def load(self):
+        """
+        Load the index and catch up with events appended to the DB file since it was saved.
+        """
+        db_size = self.db_file.stat().st_size if self.db_file.exists() else 0
+
+        row = self.connection.execute('SELECT indexed_size FROM files WHERE file = ?', (self.name,)).fetchone()
+        self.indexed_size = row[0] if row else 0
+
+        if self.indexed_size > db_size:
+            self.logger.warning('%s is smaller than its key index. Rebuilding.', self.db_file)
+            self.connection.execute('DELETE FROM keys WHERE file = ?', (self.name,))
+            self.indexed_size = 0
+
+        if self.bloom_path.exists():
+            try:
+                self.bloom, bloom_size = BloomFilter.load(self.bloom_path)
+                if bloom_size != self.indexed_size:
+                    self.bloom = None
+            except (ValueError, struct.error):
+                self.bloom = None
+
+        if self.bloom is None:
+            self._rebuild_bloom()
+
+        self.sync()
+
+    def sync(self):
+        """
+        Index events appended to the DB file and save the index.
+        """
+        db_size = self.db_file.stat().st_size if self.db_file.exists() else 0
+
+        if db_size > self.indexed_size:
+            self._index_from(self.indexed_size)
+
+        if self.bloom.count > self.bloom.capacity:
+            self._rebuild_bloom()
+
+        self.connection.execute('INSERT OR REPLACE INTO files (file, indexed_size) VALUES (?, ?)',
+                                (self.name, self.indexed_size))
+        self.connection.commit()
+
+        self.bloom.save(self.bloom_path, self.indexed_size)
+
+    def _index_from(self, offset):
+        """
+        Index complete lines of the DB file starting at a byte offset.
+        :param offset: byte offset of the first line to index
+        """
+        with self.db_file.open('rb') as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+
+                offset += len(line)
+
+                key = self.get_key(line.decode('utf-8'))
+                cursor = self.connection.execute('INSERT OR IGNORE INTO keys (file, key) VALUES (?, ?)',
+                                                 (self.name, key))
+                if cursor.rowcount:
+                    self.bloom.add(key)
+
+        self.indexed_size = offset
+
+    def _rebuild_bloom(self):
+        """
+        Rebuild the Bloom filter from the exact index, sized for twice the number of keys.
+        """
+        count = self.connection.execute('SELECT COUNT(*) FROM keys WHERE file = ?', (self.name,)).fetchone()[0]
+
+        self.bloom = BloomFilter(max(2 * count, self.MIN_CAPACITY), self.fp_rate)
+        for row in self.connection.execute('SELECT key FROM keys WHERE file = ?', (self.name,)):
+            self.bloom.add(row[0])
+
+
 class Source:
     def __init__(self, name, data_dir):
         self.name = name
@@ -250,40 +650,71 @@ class Source:
     def finish(self):
         pass
 
+    def get_key_memory_usage(self):
+        """
+        Get the number of event keys held by this source and an estimate of their memory.
+        :return: (number of keys, number of bytes)
+        """
+        return 0, 0
+
 
 class JenkinsSource(Source):
     def __init__(self, name, data_dir):
         super().__init__(name, data_dir)
         self.event_keys = {}
         self.file_stats = {}
+        self.key_index_connection = None
+        self.event_hook = None
 
     def setup(self):
         super().setup()
 
-        files = self.data_dir.glob('*')
-        files = list(filter(lambda file: file.is_file(), files))
+        if util.get_boolean_setting('process', 'key_index', False):
+            self.key_index_connection = EventKeyIndex.connect(self._get_key_index_dir())
+
+        files = self._get_db_files()
         self._load_event_keys(files)
 
+    def _get_db_files(self):
+        files = self.data_dir.glob('*')
+        return list(filter(lambda file: file.is_file(), files))
+
+    def _get_key_index_dir(self):
+        return util.index_dir / self.name
+
     def _load_event_keys(self, files):
         for file_path in files:
             basename = util.basename(file_path)
-            self.event_keys[basename] = {'new': set()}
+            self.event_keys[basename] = {'new': make_key_set()}
             self.event_keys[basename]['existing'] = self._load_db_file_event_keys(file_path)
 
     def _load_db_file_event_keys(self, db_file):
-        db_file_event_keys = set()
-        if db_file.exists():
-            with db_file.open() as file:
-                for line in file:
-                    key = self._get_event_key(line)
-                    db_file_event_keys.add(key)
+        if self.key_index_connection is not None:
+            return self._open_key_index(db_file)
 
-        return db_file_event_keys
+        if not db_file.exists():
+            return make_key_set()
+
+        return load_key_set(db_file, self._get_event_key)
+
+    def _open_key_index(self, db_file):
+        fp_rate = float(util.get_setting('process', 'key_index_fp_rate', 0.01))
+        key_index = EventKeyIndex(db_file, self._get_key_index_dir(), self.key_index_connection,
+                                  self._get_event_key, fp_rate)
+        key_index.load()
+        return key_index
 
     @staticmethod
     def _get_event_key(raw_event):
         return None
 
+    def get_write_dir(self):
+        """
+        Get the directory new events are appended to.
+        :return: the data directory, or a directory the source moves them from into its data directory at finish
+        """
+        return self.data_dir
+
     def load_new_data(self, pull_source_path, **kwargs):
         files = self._load_new_files(pull_source_path, **kwargs)
 
@@ -291,10 +722,12 @@ class JenkinsSource(Source):
         total_events_skipped = 0
 
         for file in files:
-            added, skipped = file.process(self.data_dir, self.file_stats, self.event_keys)
+            added, skipped = file.process(self.get_write_dir(), self.file_stats, self.event_keys,
+                                          event_hook=self.event_hook)
             total_events_added += added
             total_events_skipped += skipped
 
+        util.profiler.count(added=total_events_added, skipped=total_events_skipped)
         self.logger.info('Added: %s, skipped: %s', total_events_added, total_events_skipped)
 
     def _load_new_files(self, files_path, **kwargs):
@@ -328,6 +761,47 @@ class JenkinsSource(Source):
     def finish(self):
         self._print_file_stats()
 
+        if self.key_index_connection is not None:
+            self._sync_key_indexes()
+
+    def _sync_key_indexes(self):
+        """
+        Bring the key index of every DB file up to date with the events appended this run and log lookup stats.
+        """
+        stats = {'lookups': 0, 'negatives': 0, 'false_positives': 0}
+
+        for db_file in self._get_db_files():
+            basename = util.basename(db_file)
+            key_sets = self.event_keys.get(basename)
+
+            if key_sets is not None and isinstance(key_sets['existing'], EventKeyIndex):
+                key_index = key_sets['existing']
+                key_index.sync()
+                for stat, value in key_index.stats.items():
+                    stats[stat] += value
+            else:
+                self._open_key_index(db_file)
+
+        self.key_index_connection.close()
+        self.key_index_connection = None
+
+        absent = stats['negatives'] + stats['false_positives']
+        fp_rate = stats['false_positives'] / absent if absent else 0.0
+
+        self.logger.info('Key index lookups: %s, definitely new: %s, false positives: %s (rate: %.4f)',
+                         stats['lookups'], stats['negatives'], stats['false_positives'], fp_rate)
+
+    def get_key_memory_usage(self):
+        num_keys = 0
+        num_bytes = 0
+
+        for key_sets in self.event_keys.values():
+            for key_set in key_sets.values():
+                num_keys += len(key_set)
+                num_bytes += get_key_set_memory_usage(key_set)
+
+        return num_keys, num_bytes
+
     def _print_file_stats(self):
         file_names = sorted(list(self.file_stats.keys()))
         if not file_names:
@@ -343,13 +817,75 @@ class JenkinsSource(Source):
 
 
 class ProductSource(JenkinsSource):
+    """
+    Jenkins stage events. If TTR is computed, new events are held in the pending directory until the end of the run
+    and then stamped and appended to the DB files in timestamp order, so the order pulls are processed in (e.g.
+    --reverse) does not matter. Events left pending by an interrupted run are added by the next one.
+    """
     def __init__(self):
         super().__init__('jenkins', util.jenkins_data_dir)
+        self.ttr_tracker = None
+        self.summary = None
 
     def setup(self):
+        if util.get_boolean_setting('process', 'jenkins_ttr', True):
+            self.ttr_tracker = TtrTracker(util.jenkins_ttr_state_path)
+            self.ttr_tracker.load(self._get_db_files())
+
+        if util.get_boolean_setting('process', 'summary', True):
+            self.summary = JenkinsSummary()
+
+        if self.ttr_tracker is None and self.summary is not None:
+            self.event_hook = self.summary.add_event
+
+        if self.ttr_tracker is not None:
+            if util.jenkins_ttr_pending_dir.exists():
+                self.logger.warning('Adding events left pending by an interrupted run')
+                self.data_dir.mkdir(parents=True, exist_ok=True)
+                self._add_pending_events()
+            util.jenkins_ttr_pending_dir.mkdir(parents=True)
+
         super().setup()
         util.jenkins_ft_data_dir.mkdir(parents=True, exist_ok=True)
 
+    def get_write_dir(self):
+        return util.jenkins_ttr_pending_dir if self.ttr_tracker is not None else self.data_dir
+
+    def _add_pending_events(self):
+        """
+        Stamp the pending events of each DB file with their TTR in timestamp order, append them to the DB file and
+        remove them. The events of one DB file are held in memory while they are sorted.
+        """
+        for pending_file in sorted(util.jenkins_ttr_pending_dir.glob('*')):
+            with pending_file.open() as file:
+                events = [json.loads(line) for line in file]
+            events.sort(key=lambda event: event.get('timestamp', 0))
+
+            with util.open_batch_writer(self.data_dir / pending_file.name) as writer:
+                for event in events:
+                    self.ttr_tracker.stamp(event)
+                    if self.summary is not None:
+                        self.summary.add_event(event)
+                    writer.write_json(event)
+
+            pending_file.unlink()
+
+        util.rmtree(util.jenkins_ttr_pending_dir)
+
+    def finish(self):
+        if self.ttr_tracker is not None and util.jenkins_ttr_pending_dir.exists():
+            self._add_pending_events()
+
+        super().finish()
+
+        if self.ttr_tracker is not None:
+            self.ttr_tracker.save()
+            self.logger.info('TTR stamped: %s, out of order: %s', self.ttr_tracker.stamped,
+                             self.ttr_tracker.out_of_order)
+
+        if self.summary is not None:
+            self.summary.write(datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d%H%M%S%f'))
+
     @staticmethod
     def _get_event_key(raw_event):
         event = ProductCookedEvent(raw_event)
@@ -390,13 +926,222 @@ class VicSource(JenkinsSource):
         return None
 
 
+class TtrTracker:
+    """
+    Computes the time-to-repair (TTR) of Jenkins stage events as they are added, the same way the ttr search command
+    does for the PIVT Jenkins TTR saved search.
+
+    Events are grouped by instance, ci, stage, and release. A passing event that ends a streak of failures which
+    followed a passing event gets a TTR, in seconds, measured from the first failure of the streak. The last event of
+    each group is persisted so TTR carries over between runs. Events older than the last one seen for their group
+    can't be placed in the sequence and are left without a TTR, so ProductSource stamps the events of a run in
+    timestamp order once all of them are loaded.
+    """
+    PASS_VALUE = 'SUCCESS'
+    IGNORED_STAGES = ['Pipeline']
+
+    def __init__(self, path):
+        self.path = path
+        self.groups = {}
+        self.stamped = 0
+        self.out_of_order = 0
+        self.logger = util.get_logger(self)
+
+    def load(self, db_files, before=None):
+        """
+        Load the persisted state. If there is none, build it by replaying the events already in the data files.
+        :param db_files: paths of the Jenkins data files
+        :param before: if given, only events with earlier timestamps (in milliseconds) are replayed
+        """
+        if self.path.exists():
+            with self.path.open() as file:
+                for group, state in json.load(file):
+                    self.groups[tuple(group)] = state
+            return
+
+        events = []
+        for db_file in db_files:
+            with db_file.open() as file:
+                for line in file:
+                    event = json.loads(line)
+                    if self._is_tracked(event) and (before is None or event['timestamp'] < before):
+                        events.append((event['timestamp'], self._get_group(event), event['result']))
+
+        events.sort(key=lambda event: event[0])
+        for timestamp, group, result in events:
+            self._update(group, timestamp, result)
+
+        self.logger.info('Built TTR state for %s groups from %s events', len(self.groups), len(events))
+
+    def save(self):
+        """
+        Save the state, writing to a temporary file first.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix('.tmp')
+
+        with temp_path.open('w') as file:
+            json.dump([[list(group), state] for group, state in self.groups.items()], file)
+
+        temp_path.replace(self.path)
+
+    def stamp(self, event):
+        """
+        Set the TTR of a new event, if it has one, and advance the state of its group.
+        :param event: the event
+        """
+        if not self._is_tracked(event):
+            return
+
+        group = self._get_group(event)
+        state = self.groups.get(group)
+
+        if state is not None and event['timestamp'] < state['timestamp']:
+            self.out_of_order += 1
+            return
+
+        ttr = self._update(group, event['timestamp'], event['result'])
+        if ttr is not None:
+            event['ttr'] = ttr
+            self.stamped += 1
+
+    def _update(self, group, timestamp, result):
+        """
+        Advance the state of a group with the next event.
+        :param group: the group
+        :param timestamp: timestamp of the event in milliseconds
+        :param result: result of the event
+        :return: TTR of the event in seconds, or None
+        """
+        state = self.groups.get(group)
+        if state is None:
+            state = self.groups[group] = {'timestamp': timestamp, 'last_result': None, 'first_failure_time': None}
+
+        ttr = None
+
+        last_result = state['last_result']
+        passing = result == self.PASS_VALUE
+
+        if last_result == self.PASS_VALUE and not passing:
+            state['first_failure_time'] = timestamp
+        elif (last_result is not None and last_result != self.PASS_VALUE and passing
+              and state['first_failure_time'] is not None):
+            ttr = (timestamp - state['first_failure_time']) / 1000
+
+        state['timestamp'] = timestamp
+        state['last_result'] = result
+
+        return ttr
+
+    def _is_tracked(self, event):
+        return 'timestamp' in event and 'result' in event and event.get('stage') not in self.IGNORED_STAGES
+
+    @staticmethod
+    def _get_group(event):
+        return event.get('instance'), event.get('ci'), event.get('stage'), event.get('release')
+
+
+class JenkinsSummary:
+    """
+    Daily rollups of new Jenkins stage events and FT scenario results, written to var/data/data/summary for the
+    pivt_summary index.
+
+    Each run writes only the counts of the events it added, so a rollup's totals are the sums of its rows.
+    """
+    STAGES = 'jenkins_stages'
+    FT_SCENARIOS = 'jenkins_ft_scenarios'
+
+    FIELDNAMES = {
+        STAGES: ['day', 'summary', 'instance', 'ci', 'stage', 'release', 'count', 'passed', 'failed',
+                 'duration_total', 'ttr_count', 'ttr_total'],
+        FT_SCENARIOS: ['day', 'summary', 'instance', 'ci', 'release', 'count', 'passed', 'failed', 'skipped']
+    }
+
+    def __init__(self):
+        self.rows = {self.STAGES: {}, self.FT_SCENARIOS: {}}
+        self.logger = util.get_logger(self)
+
+    def add_event(self, event):
+        """
+        Add a new Jenkins stage event to the daily stage rollup.
+        :param event: the event
+        """
+        if 'timestamp' not in event or event.get('stage') in TtrTracker.IGNORED_STAGES:
+            return
+
+        row = self._get_row(self.STAGES, event['timestamp'], instance=event.get('instance'), ci=event.get('ci'),
+                            stage=event.get('stage'), release=event.get('release'))
+
+        result = event.get('result')
+        row['count'] += 1
+        row['passed'] += result == 'SUCCESS'
+        row['failed'] += result == 'FAILURE'
+        row['duration_total'] += event.get('duration', 0)
+
+        if event.get('ttr') is not None:
+            row['ttr_count'] += 1
+            row['ttr_total'] += event['ttr']
+
+    def add_scenarios(self, scenarios):
+        """
+        Add new FT scenario results to the daily scenario rollup.
+        :param scenarios: scenario rows as written to the FT data files
+        """
+        for scenario in scenarios:
+            row = self._get_row(self.FT_SCENARIOS, int(scenario['job_timestamp']), instance=scenario['job_instance'],
+                                ci=scenario['job_ci'], release=scenario['job_release'])
+
+            result = scenario['result']
+            row['count'] += 1
+            row['passed'] += result == 'passed'
+            row['failed'] += result == 'failed'
+            row['skipped'] += result == 'skipped'
+
+    def _get_row(self, summary, timestamp, **dimensions):
+        day = datetime.datetime.fromtimestamp(timestamp / 1000, tz=datetime.timezone.utc).strftime('%Y-%m-%d')
+        key = (day,) + tuple(dimensions.values())
+
+        rows = self.rows[summary]
+        if key not in rows:
+            row = {fieldname: 0 for fieldname in self.FIELDNAMES[summary]}
+            row.update(dimensions, day=day, summary=summary)
+            rows[key] = row
+
+        return rows[key]
+
+    def write(self, run_id):
+        """
+        Write this run's rollups, one file per rollup, moving each into place once complete.
+        :param run_id: identifier of this run, used in the file names
+        """
+        util.summary_data_dir.mkdir(parents=True, exist_ok=True)
+        util.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        for summary, rows in self.rows.items():
+            if not rows:
+                continue
+
+            filename = '{0}_{1}.csv'.format(summary, run_id)
+            temp_path = util.tmp_dir / filename
+
+            with temp_path.open('w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=self.FIELDNAMES[summary])
+                writer.writeheader()
+                writer.writerows(rows.values())
+
+            temp_path.replace(util.summary_data_dir / filename)
+            self.logger.info('%s rows: %s', summary, len(rows))
+
+        self.rows = {self.STAGES: {}, self.FT_SCENARIOS: {}}
+
+
 class CqSource(Source):
     def __init__(self):
         super().__init__('cq', util.cq_data_dir)
 
         self.drs = {}
         self.dr_stats = {'added': 0, 'skipped': 0, 'modified_drs': set()}
-        self.event_keys = {'new': set(), 'existing': set()}
+        self.event_keys = {'new': make_key_set(), 'existing': make_key_set()}
         self.header_fields = set()
 
     def setup(self):
@@ -414,10 +1159,7 @@ class CqSource(Source):
 
     def _load_event_keys(self):
         if util.cq_events_path.exists():
-            with util.cq_events_path.open() as file:
-                for line in file:
-                    key = CqCookedEvent(line).get_key()
-                    self.event_keys['existing'].add(key)
+            self.event_keys['existing'] = load_key_set(util.cq_events_path, lambda line: CqCookedEvent(line).get_key())
 
     def load_new_data(self, pull_source_path, **kwargs):
         added_modified_path = pull_source_path / 'added_modified.csv'
@@ -515,25 +1257,33 @@ class CqSource(Source):
         existing_key_set = self.event_keys['existing']
         new_key_set = self.event_keys['new']
 
-        # open the db file for appending and iterate through events to append to the db file
-        with util.cq_events_path.open('a') as file:
+        # iterate through events and append them to the db file in batches
+        with util.open_batch_writer(util.cq_events_path) as writer:
             for event in events:
                 key = CqCookedEvent(event).get_key()
 
                 # use the key to determine if this event should be added to the db file
                 if key not in existing_key_set and key not in new_key_set:
-                    file.write(json.dumps(event) + '\n')
+                    writer.write_json(event)
                     new_key_set.add(key)
                     events_added += 1
                 elif key in existing_key_set:
                     events_skipped += 1
 
+        util.profiler.count(added=events_added, skipped=events_skipped)
         self.logger.info('%d added events', events_added)
         self.logger.info('%d skipped events', events_skipped)
 
     def finish(self):
         self._write_drs()
 
+    def get_key_memory_usage(self):
+        num_keys = len(self.event_keys['existing']) + len(self.event_keys['new'])
+        num_bytes = (get_key_set_memory_usage(self.event_keys['existing'])
+                     + get_key_set_memory_usage(self.event_keys['new']))
+
+        return num_keys, num_bytes
+
     def _write_drs(self):
         with util.cq_data_path.open('w', newline='') as file:
             writer = csv.DictWriter(file, fieldnames=self.header_fields)
@@ -550,11 +1300,20 @@ class CqSource(Source):
 
 
 class CqSourceOld(Source):
-    def __init__(self):
+    def __init__(self, incremental=False, defer_index_recreation=False):
         super().__init__('cq_old', util.cq_data_dir)
 
+        # if True, write new/changed rows to delta files instead of recreating the CQ index
+        self.incremental = incremental
+
+        # if True, leave the CQ index alone and set index_recreation_pending for the caller to call recreate_index
+        # once the rewritten data is live
+        self.defer_index_recreation = defer_index_recreation
+        self.index_recreation_pending = False
+
         self.orig_data = {}
-        self.orig_changed_files = {}
+        self.orig_row_hashes = {}
+        self.changed_files_index = CqChangedFilesIndex(util.cq_changed_files_path, util.cq_changed_files_index_path)
 
         self.new_data = {}
         self.new_changed_files = {}
@@ -570,20 +1329,25 @@ class CqSourceOld(Source):
                 for row in reader:
                     dr_id = row['id']
                     self.orig_data[dr_id] = row
+                    self.orig_row_hashes[dr_id] = self._row_hash(row)
+
+        self._load_delta_data()
 
-        # load existing data from CQ_Changed_Files.csv
-        if util.cq_changed_files_path.exists():
-            with util.cq_changed_files_path.open(newline='') as file:
+        # load (DR ID, file) pairs from CQ_Changed_Files.csv, reading only rows not yet indexed
+        self.changed_files_index.load()
+
+    def _load_delta_data(self):
+        """
+        Overlay rows from incremental delta files on the existing data, oldest version first.
+        """
+        for delta_path in self._get_delta_paths():
+            with delta_path.open(newline='') as file:
                 reader = csv.DictReader(file)
                 for row in reader:
+                    row.pop(CQ_VERSION_FIELD, None)
                     dr_id = row['id']
-                    filename = row['file']
-
-                    if dr_id not in self.orig_changed_files:
-                        self.orig_changed_files[dr_id] = []
-
-                    if filename not in self.orig_changed_files[dr_id]:
-                        self.orig_changed_files[dr_id].append(filename)
+                    self.orig_data[dr_id] = row
+                    self.orig_row_hashes[dr_id] = self._row_hash(row)
 
     def load_new_data(self, pull_source_path, **kwargs):
         with pull_source_path.open(newline='', encoding='utf-8-sig') as file:
@@ -594,13 +1358,13 @@ class CqSourceOld(Source):
                 if 'RTCC_ChangeSet.FileList.Filename' in row:
                     changed_file = row['RTCC_ChangeSet.FileList.Filename']
 
-                    if changed_file != '':
+                    if changed_file != '' and (dr_id, changed_file) not in self.changed_files_index:
+                        self.changed_files_index.add(dr_id, changed_file)
+
                         if dr_id not in self.new_changed_files:
                             self.new_changed_files[dr_id] = []
 
-                        if ((dr_id not in self.orig_changed_files or changed_file not in self.orig_changed_files[dr_id])
-                                and changed_file not in self.new_changed_files[dr_id]):
-                            self.new_changed_files[dr_id].append(changed_file)
+                        self.new_changed_files[dr_id].append(changed_file)
 
                     del row['RTCC_ChangeSet.FileList.Filename']
 
@@ -615,11 +1379,16 @@ class CqSourceOld(Source):
 
         self.logger.info('Source: cq')
         if added_rows > 0 or updated_rows > 0:
-            self.logger.info('Recreating index %s from app %s', CQ_INDEX, PIVT_APP)
-            Processor.delete_index(CQ_INDEX, PIVT_APP)
-            Processor.create_index(CQ_INDEX, PIVT_APP)
+            if self.incremental:
+                self._write_delta_data(self._get_changed_rows())
+            else:
+                if self.defer_index_recreation:
+                    self.index_recreation_pending = True
+                else:
+                    self.recreate_index()
 
-            self._write_data(list(updated_data.values()))
+                self._write_data(list(updated_data.values()))
+                self._remove_delta_data()
 
         self.logger.info('%s updated rows', updated_rows)
         self.logger.info('%s new rows', added_rows)
@@ -634,19 +1403,31 @@ class CqSourceOld(Source):
 
         self.logger.info('%s files changed', files_changed)
 
+    def recreate_index(self):
+        """
+        Delete and recreate the CQ index so the rewritten CQ data is indexed from scratch.
+        """
+        self.logger.info('Recreating index %s from app %s', CQ_INDEX, PIVT_APP)
+        Processor.delete_index(CQ_INDEX, PIVT_APP)
+        Processor.create_index(CQ_INDEX, PIVT_APP)
+        self.index_recreation_pending = False
+
     def _get_updated_data(self):
+        """
+        Overlay the new CQ data on the existing CQ data.
+        The existing rows are not copied; new rows shadow existing rows with the same DR ID.
+        :return: added, updated, and skipped row counts and a read-through view of the updated data
+        """
         added_rows = 0
         updated_rows = 0
         skipped_rows = 0
 
-        updated_data = copy.deepcopy(self.orig_data)
+        updated_data = ChainMap(self.new_data, self.orig_data)
 
         for dr_id, row in self.new_data.items():
-            updated_data[dr_id] = row
             if dr_id in self.orig_data:  # this DR is in the existing data
-                orig_row = self.orig_data[dr_id]
                 # this DR differs from the one in the existing data, meaning it has been updated
-                if not self._dict_compare(row, orig_row):
+                if self._is_row_changed(dr_id, row):
                     updated_rows += 1
                 else:
                     skipped_rows += 1
@@ -655,9 +1436,41 @@ class CqSourceOld(Source):
 
         return added_rows, updated_rows, skipped_rows, updated_data
 
+    def _is_row_changed(self, dr_id, row):
+        """
+        Determine if a new row differs from the existing row with the same DR ID.
+        :param dr_id: the DR ID
+        :param row: the new row
+        :return: True if the rows differ
+        """
+        orig_row = self.orig_data[dr_id]
+        orig_hash = self.orig_row_hashes.get(dr_id)
+        if orig_hash is None:
+            orig_hash = self._row_hash(orig_row)
+
+        return self._row_hash(row) != orig_hash or not self._dict_compare(row, orig_row)
+
+    def _get_changed_rows(self):
+        """
+        Get the new rows that are either not in the existing data or differ from it.
+        :return: list of rows
+        """
+        return [row for dr_id, row in self.new_data.items()
+                if dr_id not in self.orig_data or self._is_row_changed(dr_id, row)]
+
+    @staticmethod
+    def _row_hash(row):
+        """
+        Hash a CQ row independent of field order.
+        Equal rows have equal hashes, so differing hashes mean the rows differ.
+        :param row: the row
+        :return: the hash
+        """
+        return hash(frozenset(row.items()))
+
     @staticmethod
     def _dict_compare(dict1, dict2):
-        return not set(dict1.items()) ^ set(dict2.items())
+        return dict1 == dict2
 
     @staticmethod
     def _write_data(events):
@@ -681,6 +1494,70 @@ class CqSourceOld(Source):
             writer.writeheader()
             writer.writerows(events)
 
+    def _write_delta_data(self, rows):
+        """
+        Write new and changed rows to a new delta file, tagging each row with the delta version.
+        The file is written under a temporary name and renamed so Splunk never reads a partial file.
+        :param rows: the rows to write
+        """
+        util.cq_data_delta_dir.mkdir(parents=True, exist_ok=True)
+
+        version = self._get_next_delta_version()
+
+        fields = set()
+        for row in rows:
+            fields.update(row.keys())
+        fields.discard(CQ_VERSION_FIELD)
+        fields = [CQ_VERSION_FIELD] + sorted(fields)
+
+        delta_path = util.cq_data_delta_dir / 'CQ_Data_{0}.csv'.format(version)
+        temp_path = delta_path.with_suffix('.tmp')
+
+        with temp_path.open('w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({CQ_VERSION_FIELD: version, **row})
+
+        temp_path.replace(delta_path)
+
+        self.logger.info('Wrote %s rows to %s', len(rows), delta_path)
+
+    def _get_next_delta_version(self):
+        """
+        Get a delta version greater than that of every existing delta file.
+        :return: the version
+        """
+        version = int(time.time())
+
+        delta_paths = self._get_delta_paths()
+        if delta_paths:
+            version = max(version, self._get_delta_version(delta_paths[-1]) + 1)
+
+        return version
+
+    def _remove_delta_data(self):
+        """
+        Remove delta files once they have been folded into CQ_Data.csv.
+        """
+        for delta_path in self._get_delta_paths():
+            delta_path.unlink()
+
+    @staticmethod
+    def _get_delta_paths():
+        """
+        Get paths to existing delta files sorted by version.
+        :return: list of paths
+        """
+        if not util.cq_data_delta_dir.exists():
+            return []
+
+        return sorted(util.cq_data_delta_dir.glob('CQ_Data_*.csv'), key=CqSourceOld._get_delta_version)
+
+    @staticmethod
+    def _get_delta_version(delta_path):
+        return int(delta_path.stem[len('CQ_Data_'):])
+
     def _write_changed_files_data(self):
         # if CQ_Changed_Files.csv does not exist, open it and write the CSV header
         if not util.cq_changed_files_path.exists():
@@ -694,6 +1571,133 @@ class CqSourceOld(Source):
             for dr_id, files in self.new_changed_files.items():
                 for filename in files:
                     writer.writerow([dr_id, filename])
+                    self.changed_files_index.add(dr_id, filename)
+
+        self.changed_files_index.save()
+
+
+class CqChangedFilesIndex:
+    """
+    Set of (DR ID, file) pairs in CQ_Changed_Files.csv.
+
+    Pairs are stored as fixed-size digests in an index file next to the CSV. The index file starts with the size
+    of the CSV it covers, so only rows appended to the CSV since the last save need to be read.
+    """
+    HEADER = struct.Struct('<Q')
+    DIGEST_SIZE = 16
+
+    def __init__(self, csv_path, index_path):
+        self.csv_path = csv_path
+        self.index_path = index_path
+        self.logger = util.get_logger(self)
+
+        self.digests = set()
+        self.unsaved_digests = []
+        self.rewrite = True
+        self.loaded = False
+
+    @classmethod
+    def digest(cls, dr_id, filename):
+        """
+        Digest a (DR ID, file) pair.
+        :param dr_id: the DR ID
+        :param filename: the changed file
+        :return: the digest
+        """
+        pair = '{0}\0{1}'.format(dr_id, filename).encode('utf-8')
+        return hashlib.sha256(pair).digest()[:cls.DIGEST_SIZE]
+
+    def __contains__(self, pair):
+        return self.digest(*pair) in self.digests
+
+    def __len__(self):
+        return len(self.digests)
+
+    def add(self, dr_id, filename):
+        """
+        Add a (DR ID, file) pair.
+        :param dr_id: the DR ID
+        :param filename: the changed file
+        """
+        digest = self.digest(dr_id, filename)
+        if digest not in self.digests:
+            self.digests.add(digest)
+            self.unsaved_digests.append(digest)
+
+    def load(self):
+        """
+        Load the index file, then index any rows appended to the CSV after the index was saved.
+        If the index file is missing or covers more than the CSV holds, the CSV is indexed from the start.
+        """
+        self.loaded = True
+
+        csv_size = self.csv_path.stat().st_size if self.csv_path.exists() else 0
+        indexed_size = 0
+
+        if self.index_path.exists():
+            with self.index_path.open('rb') as file:
+                indexed_size, = self.HEADER.unpack(file.read(self.HEADER.size))
+
+                if indexed_size <= csv_size:
+                    data = file.read()
+                    self.digests.update(data[i:i + self.DIGEST_SIZE] for i in range(0, len(data), self.DIGEST_SIZE))
+                    self.rewrite = False
+                else:
+                    self.logger.warning('%s is newer than %s. Rebuilding.', self.index_path, self.csv_path)
+                    indexed_size = 0
+
+        if indexed_size < csv_size:
+            self._load_csv(indexed_size)
+
+    def _load_csv(self, offset):
+        """
+        Index the CSV rows starting at a byte offset.
+        :param offset: byte offset of the first row to index (0 to index the whole file)
+        """
+        with self.csv_path.open('rb') as binary_file:
+            file = io.TextIOWrapper(binary_file, newline='')
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+
+            id_index = header.index('id')
+            file_index = header.index('file')
+
+            if offset > 0:
+                file.detach()
+                binary_file.seek(offset)
+                reader = csv.reader(io.TextIOWrapper(binary_file, newline=''))
+
+            for row in reader:
+                if row:
+                    self.add(row[id_index], row[file_index])
+
+    def save(self):
+        """
+        Save the index, appending new digests unless the index file needs to be rewritten.
+        """
+        if not self.loaded:
+            self.load()
+
+        csv_size = self.csv_path.stat().st_size if self.csv_path.exists() else 0
+        header = self.HEADER.pack(csv_size)
+
+        if self.rewrite or not self.index_path.exists():
+            temp_path = self.index_path.with_suffix('.tmp')
+            with temp_path.open('wb') as file:
+                file.write(header)
+                file.write(b''.join(self.digests))
+            temp_path.replace(self.index_path)
+        else:
+            with self.index_path.open('r+b') as file:
+                file.seek(0, io.SEEK_END)
+                file.write(b''.join(self.unsaved_digests))
+                file.seek(0)
+                file.write(header)
+
+        self.unsaved_digests = []
+        self.rewrite = False
 
 
 class VicStatusSource(JenkinsSource):
@@ -728,6 +1732,10 @@ class Archive:
 
         return default_instance
 
+    def _get_summary(self):
+        jenkins_source = self.sources.get('jenkins')
+        return jenkins_source.summary if jenkins_source is not None else None
+
     def load(self, archives, reverse):
         """
         Process data from an archive and merge it with existing data (Jenkins and %%ci33%% only).
@@ -742,22 +1750,36 @@ class Archive:
 
             if pull_dir_paths:
                 pull_dir_paths.sort(reverse=reverse)
-                ft_info = FtInfo()
+                ft_info = FtInfo(self._get_summary())
 
                 for pull_dir_path in pull_dir_paths:
-                    self._process_pull_dir(pull_dir_path, ft_info)
+                    with util.profiler.span('Archive._process_pull_dir'):
+                        self._process_pull_dir(pull_dir_path, ft_info)
 
                 ft_info.process()
 
             if cq_file_path is not None:
                 self.logger.info('%s', util.basename(cq_file_path))
-                self.sources['cq_old'].load_new_data(cq_file_path)
+                with util.profiler.span('CqSourceOld.load_new_data'):
+                    self.sources['cq_old'].load_new_data(cq_file_path)
 
-            self.path.replace(util.archive_dir / self.name)
+            self._archive()
         finally:
             if archive_temp_dir:
                 util.rmtree(archive_temp_dir, no_exist_ok=True)
 
+    def _archive(self):
+        """
+        Move the processed archive out of the collected directory, into the archive store if it is enabled
+        """
+        if util.get_boolean_setting('archive', 'store', False):
+            store = ArchiveStore()
+            if not store.contains(self.name):
+                store.ingest(self.path)
+            self.path.unlink()
+        else:
+            self.path.replace(util.archive_dir / self.name)
+
     def _get_components(self, archives):
         """
         Extracts necessary components of an archive to be able to process the archive
@@ -778,7 +1800,8 @@ class Archive:
             return None, None, None
 
         # unzip archive into temp directory
-        archive_temp_dir = self._extract(archives)
+        with util.profiler.span('Archive._extract'):
+            archive_temp_dir = self._extract(archives)
 
         # get all items in temp dir
         archive_contents = list(archive_temp_dir.glob('*'))
@@ -859,17 +1882,20 @@ class Archive:
                 dt = dt.replace(tzinfo=datetime.timezone.utc)
                 kwargs['timestamp'] = dt.timestamp()
 
-            source.load_new_data(pull_source, **kwargs)
+            with util.profiler.span('{0}.load_new_data'.format(type(source).__name__)):
+                source.load_new_data(pull_source, **kwargs)
 
 
 class FtInfo:
-    def __init__(self):
+    def __init__(self, summary=None):
         self.ft_info = {}
+        self.summary = summary
 
     def process(self):
-        for filename, tables in self.ft_info.items():
-            for table_name, content in tables.items():
-                self._process_file(filename, table_name, content)
+        with util.profiler.span('FtInfo.process'):
+            for filename, tables in self.ft_info.items():
+                for table_name, content in tables.items():
+                    self._process_file(filename, table_name, content)
 
     def _process_file(self, filename, table_name, content):
         if not content:
@@ -918,6 +1944,11 @@ class FtInfo:
                 for row in new_rows:
                     writer.writerow(row)
 
+            util.profiler.count(added=len(new_rows))
+
+            if table_name == 'scenarios' and self.summary is not None:
+                self.summary.add_scenarios(new_rows)
+
     @staticmethod
     def load_ft_info(event):
         if 'reports' not in event:
@@ -1127,7 +2158,7 @@ class DataFile:
         self.path = path
         self.name = util.basename(path)
         self._normalize_filename()
-        self.events = {}
+        self.events = OrderedDict()
 
     def is_empty(self):
         return self.path.stat().st_size <= 0
@@ -1141,7 +2172,7 @@ class DataFile:
     def _load_event(self, raw_data, **kwargs):
         pass
 
-    def process(self, data_dir, file_stats, event_keys):
+    def process(self, data_dir, file_stats, event_keys, event_hook=None):
         pass
 
     def _construct_db_path(self, data_dir):
@@ -1157,9 +2188,9 @@ class JsonDataFile(DataFile):
             for line in file:
                 self._load_event(line, **kwargs)
 
-    def process(self, data_dir, file_stats, event_keys):
+    def process(self, data_dir, file_stats, event_keys, event_hook=None):
         if self.name not in event_keys:
-            event_keys[self.name] = {'existing': set(), 'new': set()}
+            event_keys[self.name] = {'existing': make_key_set(), 'new': make_key_set()}
 
         existing_key_set = event_keys[self.name]['existing']
         new_key_set = event_keys[self.name]['new']
@@ -1170,12 +2201,14 @@ class JsonDataFile(DataFile):
         skipped = 0
         skipped_overall = 0
 
-        # open the db file for appending and iterate through events to calculate TTR and then append to the db file
-        with db_file.open('a') as file:
+        # iterate through events and append them to the db file in batches
+        with util.open_batch_writer(db_file) as writer:
             for key, event in self.events.items():
                 # use the key to determine if this event should be added to the db file
                 if key not in existing_key_set and key not in new_key_set:
-                    file.write(json.dumps(event) + '\n')
+                    if event_hook is not None:
+                        event_hook(event)
+                    writer.write_json(event)
                     new_key_set.add(key)
                     added += 1
                 elif key in existing_key_set:
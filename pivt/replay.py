@@ -0,0 +1,685 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Rebuilds the DB files from archived new data
+
+Archives in the archive directory and the archive store are cooked in parallel, each into its own shard directory as
+if it were the only archive ever processed. The shards are merged in archive order into a staging directory, keeping
+the first copy of every event as process.py does, then each replayed source's DB directory is swapped with the staged
+one by two renames, leaving a brief window in which the directory is missing. CQ data is not cooked in the shards; it
+is fed to the CQ sources in archive order during the merge.
+
+A date range selects events by their timestamps, in UTC. The current DB files are kept, the events in the range
+are replaced by the replayed ones, and the events outside it are left as they are. Events are collected after they
+happen, so every archive collected on or after the start of the range is replayed. With --keep-existing the events in
+the range are kept too, and only the replayed events missing from them are added. CQ data is not split by time; the
+replayed pulls are loaded on top of the current CQ data.
+
+Do not run while collect.py or process.py is running.
+
+Usage: python -m pivt.replay [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--sources SOURCE...] [--workers N]
+                             [--keep-existing]
+"""
+
+import argparse
+import calendar
+import csv
+import datetime
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from pivt.util import util
+from pivt.archive_store import ArchiveStore
+from pivt.collect import Collector
+from pivt.process import Archive, CqSource, CqSourceOld, FtInfo, InsSource, JenkinsSource, ProductSource, Source, \
+    TtrTracker, VicSource, VicStatusSource, make_key_set
+
+SOURCES = ['jenkins', 'ins', 'vic', 'vic_status', 'cq']
+
+ARCHIVE_SUFFIX = '_NewData.zip'
+ARCHIVE_DATE_FORMAT = '%y-%m-%dT%H-%M-%S'
+
+# milliseconds per unit of the timestamps of each source's events, if not 1
+TIMESTAMP_UNITS = {'vic_status': 1000}
+
+# shards start empty, and TTR and the daily rollups depend on the merged order, so they are left to the merge
+SHARD_SETTINGS = {('process', 'key_index'): False, ('process', 'jenkins_ttr'): False, ('process', 'summary'): False}
+
+# key indexes are rebuilt by the next process.py run instead of being kept up to date in the staging directory
+MERGE_SETTINGS = {('process', 'key_index'): False}
+
+
+class Replayer:
+    """
+    Rebuilds the DB directories of some sources from the archives collected in a date range.
+    """
+    def __init__(self, sources=None, start=None, end=None, workers=1, keep_existing=False):
+        """
+        :param sources: names of the sources to replay (see SOURCES); defaults to all of them
+        :param start: if given, only replay events at or after this UTC datetime, from archives collected at or after it
+        :param end: if given, only replay events before this UTC datetime
+        :param workers: number of processes cooking archives
+        :param keep_existing: if True, keep the current events and only add the replayed events missing from them
+                              instead of replacing them
+        """
+        self.sources = [name for name in SOURCES if sources is None or name in sources]
+        self.start = start
+        self.end = end
+        self.workers = workers
+        self.keep_existing = keep_existing
+
+        # with a date range, the current DB files are kept outside it
+        self.replace_range = not keep_existing and (start is not None or end is not None)
+        self.start_ms = calendar.timegm(start.timetuple()) * 1000 if start is not None else None
+        self.end_ms = calendar.timegm(end.timetuple()) * 1000 if end is not None else None
+
+        self.staging_dir = util.replay_dir
+        self.staging_db_dir = self.staging_dir / 'data'
+        self.staging_index_dir = self.staging_dir / 'index'
+        self.old_dir = self.staging_dir / 'old'
+
+        self.store = ArchiveStore()
+        self.ft_keys = {}
+        self.logger = util.get_logger(self)
+
+    def get_archives(self):
+        """
+        Get the archives to replay, from the archive directory or, if not there, the archive store.
+        :return: list of (archive name, path or None if the archive is only in the store), oldest first
+        """
+        archives = {name: None for name in self.store.names()}
+
+        if util.archive_dir.exists():
+            for path in util.archive_dir.glob('*' + ARCHIVE_SUFFIX):
+                archives[path.name] = path
+
+        return [(name, archives[name]) for name in sorted(archives) if self._in_range(name)]
+
+    def _in_range(self, name):
+        try:
+            date = datetime.datetime.strptime(name[:len(name) - len(ARCHIVE_SUFFIX)], ARCHIVE_DATE_FORMAT)
+        except ValueError:
+            self.logger.warning('Could not get collection time of %s - skipping', name)
+            return False
+
+        return self.start is None or date >= self.start
+
+    def _in_event_range(self, timestamp):
+        """
+        Check whether an event timestamp falls in the replayed range.
+        :param timestamp: milliseconds since the epoch
+        :return: True if it is in the range
+        """
+        if self.start_ms is not None and timestamp < self.start_ms:
+            return False
+        return self.end_ms is None or timestamp < self.end_ms
+
+    def run(self):
+        """
+        Cook the archives, merge them into the staging directory and swap the staged DB directories in.
+        :return: number of archives replayed
+        """
+        archives = self.get_archives()
+        if not archives:
+            self.logger.warning('No archives to replay')
+            return 0
+
+        self.logger.info('Replaying %s archives (%s to %s) into %s with %s workers', len(archives), archives[0][0],
+                         archives[-1][0], ', '.join(self.sources), self.workers)
+
+        if self.old_dir.exists():
+            raise RuntimeError('{0} holds DB directories a failed replay could not move back; restore them into {1} '
+                               'and delete it before replaying again'.format(self.old_dir, util.db_dir))
+
+        util.rmtree(self.staging_dir, no_exist_ok=True)
+        shard_dirs = [self.staging_dir / 'shards' / '{0:06d}'.format(i) for i in range(len(archives))]
+
+        try:
+            with util.profiler.span('Replayer.cook'):
+                self.cook(archives, shard_dirs)
+
+            with util.profiler.span('Replayer.merge'):
+                cq_source = self.merge(shard_dirs).get('cq_old')
+
+            self.swap()
+
+            # only touch the live CQ index once the data it is rebuilt from is live
+            if cq_source is not None and cq_source.index_recreation_pending:
+                cq_source.recreate_index()
+        finally:
+            # the old directory is only left behind if a failed swap could not be rolled back
+            if self.old_dir.exists():
+                self.logger.error('Live DB directories were left in %s', self.old_dir)
+            else:
+                util.rmtree(self.staging_dir, no_exist_ok=True)
+
+        return len(archives)
+
+    def cook(self, archives, shard_dirs):
+        """
+        Cook each archive into its shard directory.
+        :param archives: list of (archive name, path or None)
+        :param shard_dirs: shard directory of each archive
+        """
+        names = [name for name, _ in archives]
+        paths = [path for _, path in archives]
+        sources = [self.sources] * len(archives)
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(self.workers) as executor:
+                for name in executor.map(cook_archive, names, paths, shard_dirs, sources):
+                    self.logger.info('Cooked %s', name)
+        else:
+            for name in map(cook_archive, names, paths, shard_dirs, sources):
+                self.logger.info('Cooked %s', name)
+
+    def merge(self, shard_dirs):
+        """
+        Merge the shards, oldest first, into the staging directory.
+        :param shard_dirs: shard directories in archive order
+        :return: dict of source name to the finished source
+        """
+        if self.keep_existing or self.replace_range:
+            for relative_path in self._get_db_dirs():
+                live_path = util.db_dir / relative_path
+                if live_path.exists():
+                    shutil.copytree(str(live_path), str(self.staging_db_dir / relative_path),
+                                    copy_function=self._copy_db_file)
+
+            if 'jenkins' in self.sources:
+                self._seed_ttr_state()
+
+        with use_db_dir(self.staging_db_dir, self.staging_index_dir), use_settings(MERGE_SETTINGS):
+            sources = create_sources(self.sources)
+
+            for source in sources.values():
+                source.setup()
+
+            if 'cq_old' in sources:
+                sources['cq_old'].load_existing_data()
+
+            self.ft_keys = {}
+            for shard_dir in shard_dirs:
+                for name, source in sources.items():
+                    if isinstance(source, JenkinsSource):
+                        self._merge_source(source, shard_dir)
+                    else:
+                        for path in DeferredSource.get_paths(name, shard_dir):
+                            source.load_new_data(path)
+
+            for source in sources.values():
+                source.finish()
+
+        if self.replace_range and 'jenkins' in self.sources:
+            self._merge_ttr_state()
+
+        return sources
+
+    def _copy_db_file(self, src, dst):
+        """
+        Copy a live DB file into the staging directory. When replacing a date range, the events and rows in the range
+        are left out.
+        :param src: path of the live file
+        :param dst: path of the staged file
+        """
+        src_path = Path(src)
+        parent = src_path.parent
+        sources = {util.jenkins_data_dir: 'jenkins', util.ins_data_dir: 'ins', util.vic_data_dir: 'vic',
+                   util.vic_status_data_dir: 'vic_status'}
+
+        if not self.replace_range or src_path.suffix not in ('.json', '.csv'):
+            shutil.copy2(src, dst)
+        elif parent in sources:
+            unit = TIMESTAMP_UNITS.get(sources[parent], 1)
+            with src_path.open() as src_file, open(dst, 'w') as dst_file:
+                for line in src_file:
+                    timestamp = json.loads(line).get('timestamp')
+                    if timestamp is None or not self._in_event_range(timestamp * unit):
+                        dst_file.write(line)
+        elif parent == util.jenkins_ft_data_dir:
+            self._copy_csv_rows(src_path, dst, lambda row: int(row['job_timestamp']))
+        elif parent == util.summary_data_dir:
+            self._copy_csv_rows(src_path, dst, lambda row: calendar.timegm(
+                datetime.datetime.strptime(row['day'], '%Y-%m-%d').timetuple()) * 1000)
+        else:
+            shutil.copy2(src, dst)
+
+    def _copy_csv_rows(self, src_path, dst, get_timestamp):
+        """
+        Copy the rows of a CSV file that fall outside the replayed range.
+        :param src_path: path of the file
+        :param dst: path of the copy
+        :param get_timestamp: function that returns the timestamp of a row in milliseconds
+        """
+        with src_path.open(newline='') as src_file, open(dst, 'w', newline='') as dst_file:
+            reader = csv.DictReader(src_file)
+            writer = csv.DictWriter(dst_file, fieldnames=reader.fieldnames)
+            writer.writeheader()
+            writer.writerows(row for row in reader if not self._in_event_range(get_timestamp(row)))
+
+    def _seed_ttr_state(self):
+        """
+        Give the merge the TTR state the added events carry on from. With --keep-existing that is the live state.
+        When replacing a date range it is built from the kept events before the range.
+        """
+        state_path = util.jenkins_ttr_state_path
+        staged_state_path = self.staging_index_dir / state_path.name
+        self.staging_index_dir.mkdir(parents=True, exist_ok=True)
+
+        if not self.replace_range:
+            if state_path.exists():
+                shutil.copy(str(state_path), str(staged_state_path))
+            return
+
+        tracker = TtrTracker(staged_state_path)
+        if self.start_ms is not None:
+            staged_jenkins_dir = self.staging_db_dir / util.jenkins_data_dir.relative_to(util.db_dir)
+            db_files = [path for path in staged_jenkins_dir.glob('*') if path.is_file()]
+            tracker.load(db_files, before=self.start_ms)
+        tracker.save()
+
+    def _merge_ttr_state(self):
+        """
+        Combine the merged TTR state with the live one. Groups with events after the range keep their live state.
+        """
+        if not util.jenkins_ttr_state_path.exists():
+            return
+
+        live = TtrTracker(util.jenkins_ttr_state_path)
+        live.load([])
+        merged = TtrTracker(self.staging_index_dir / util.jenkins_ttr_state_path.name)
+        merged.load([])
+
+        for group, state in live.groups.items():
+            if group not in merged.groups or state['timestamp'] > merged.groups[group]['timestamp']:
+                merged.groups[group] = state
+
+        merged.save()
+
+    def _merge_source(self, source, shard_dir):
+        """
+        Append the events of a shard's source files missing from the staged files.
+        :param source: the source, set up on the staging directory
+        :param shard_dir: the shard directory
+        """
+        shard_data_dir = shard_dir / 'data' / source.data_dir.relative_to(util.db_dir)
+        if not shard_data_dir.exists():
+            return
+
+        for shard_file in sorted(path for path in shard_data_dir.glob('*') if path.is_file()):
+            self._merge_file(source, shard_file, TIMESTAMP_UNITS.get(source.name, 1))
+
+        if isinstance(source, ProductSource):
+            shard_ft_dir = shard_dir / 'data' / util.jenkins_ft_data_dir.relative_to(util.db_dir)
+            for shard_file in sorted(shard_ft_dir.glob('*.csv')):
+                self._merge_ft_file(source, shard_file)
+
+    def _merge_file(self, source, shard_file, unit):
+        """
+        Append the events of a shard file in the replayed range that are missing from the staged file.
+        :param source: the source, set up on the staging directory
+        :param shard_file: the shard file
+        :param unit: milliseconds per unit of the events' timestamps
+        """
+        key_sets = source.event_keys.setdefault(shard_file.name, {'existing': make_key_set(), 'new': make_key_set()})
+        file_stats = source.file_stats.setdefault(shard_file.name, {'added': 0, 'skipped': 0})
+
+        with shard_file.open() as file, util.open_batch_writer(source.get_write_dir() / shard_file.name) as writer:
+            for line in file:
+                event = json.loads(line)
+                if 'timestamp' in event and not self._in_event_range(event['timestamp'] * unit):
+                    continue
+
+                key = source._get_event_key(line)
+                if key in key_sets['existing'] or key in key_sets['new']:
+                    file_stats['skipped'] += 1
+                    continue
+
+                key_sets['new'].add(key)
+                file_stats['added'] += 1
+
+                if source.event_hook is None:
+                    writer.write_line(line.rstrip('\n'))
+                else:
+                    source.event_hook(event)
+                    writer.write_json(event)
+
+    def _merge_ft_file(self, source, shard_file):
+        db_file_path = util.jenkins_ft_data_dir / shard_file.name
+        scenarios = shard_file.stem.endswith('_scenarios')
+        key_func = FtInfo._gen_ft_scenario_key if scenarios else FtInfo._gen_ft_feature_key
+
+        keys = self.ft_keys.get(shard_file.name)
+        if keys is None:
+            keys = self.ft_keys[shard_file.name] = set()
+            if db_file_path.exists():
+                with db_file_path.open(newline='') as file:
+                    keys.update(key_func(row) for row in csv.DictReader(file))
+
+        with shard_file.open(newline='') as file:
+            reader = csv.DictReader(file)
+            fieldnames = reader.fieldnames
+            new_rows = []
+            for row in reader:
+                if not self._in_event_range(int(row['job_timestamp'])):
+                    continue
+
+                key = key_func(row)
+                if key not in keys:
+                    keys.add(key)
+                    new_rows.append(row)
+
+        if not new_rows:
+            return
+
+        if db_file_path.exists():
+            with db_file_path.open() as file:
+                fieldnames = file.readline().strip().split(',')
+
+            mode = 'a'
+        else:
+            mode = 'w'
+
+        with db_file_path.open(mode, newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            if mode == 'w':
+                writer.writeheader()
+            writer.writerows(new_rows)
+
+        if scenarios and source.summary is not None:
+            source.summary.add_scenarios(new_rows)
+
+    def swap(self):
+        """
+        Replace each replayed DB directory with the staged one. The live directory is renamed aside and the staged one
+        renamed into its place. Each rename is atomic but the pair is not: between them the DB directory does not
+        exist, and a Splunk monitor input polling it then may see it as deleted. No directory is ever seen partly
+        written. Key indexes and TTR state of the replayed sources describe the old files and are replaced or
+        removed. If a rename fails, the renames already done are undone and the live directories are moved back.
+        """
+        renames = []
+
+        try:
+            for relative_path in self._get_db_dirs():
+                live_path = util.db_dir / relative_path
+                staged_path = self.staging_db_dir / relative_path
+
+                staged_path.mkdir(parents=True, exist_ok=True)
+                live_path.parent.mkdir(parents=True, exist_ok=True)
+
+                if live_path.exists():
+                    self._rename(live_path, self.old_dir / relative_path, renames)
+                self._rename(staged_path, live_path, renames)
+
+            if 'jenkins' in self.sources:
+                state_path = util.jenkins_ttr_state_path
+                staged_state_path = self.staging_index_dir / state_path.name
+
+                if state_path.exists():
+                    self._rename(state_path, self.old_dir / state_path.name, renames)
+                if staged_state_path.exists():
+                    state_path.parent.mkdir(parents=True, exist_ok=True)
+                    self._rename(staged_state_path, state_path, renames)
+        except BaseException:
+            self.logger.error('Swap failed; moving the live DB directories back')
+            self._roll_back(renames)
+            raise
+
+        for relative_path in self._get_db_dirs():
+            self.logger.info('Swapped in %s', util.db_dir / relative_path)
+
+        for name in self.sources:
+            util.rmtree(util.index_dir / name, no_exist_ok=True)
+
+        util.rmtree(self.old_dir, no_exist_ok=True)
+
+    @staticmethod
+    def _rename(path, target, renames):
+        """
+        Rename a file or directory and record the rename so it can be undone.
+        :param path: the path to rename
+        :param target: the new path
+        :param renames: list of (path, target) the rename is appended to
+        """
+        target.parent.mkdir(parents=True, exist_ok=True)
+        path.replace(target)
+        renames.append((path, target))
+
+    def _roll_back(self, renames):
+        """
+        Undo renames, latest first, then delete the emptied old directory. If a rename can't be undone, the error
+        propagates and the old directory is kept.
+        :param renames: list of (path, target) in the order they were done
+        """
+        for path, target in reversed(renames):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            target.replace(path)
+
+        util.rmtree(self.old_dir, no_exist_ok=True)
+
+    def _get_db_dirs(self):
+        """
+        Get the DB directories written by the replayed sources.
+        :return: list of paths relative to the DB directory
+        """
+        db_dirs = {
+            'jenkins': [util.jenkins_data_dir, util.summary_data_dir],
+            'ins': [util.ins_data_dir],
+            'vic': [util.vic_data_dir],
+            'vic_status': [util.vic_status_data_dir],
+            'cq': [util.cq_data_dir]
+        }
+
+        return [path.relative_to(util.db_dir) for name in self.sources for path in db_dirs[name]]
+
+
+class ReplayArchive(Archive):
+    """
+    An archive being replayed. It is a link or copy of an archived one, so it is left where it is once loaded.
+    """
+    def _get_summary(self):
+        # the merge adds the FT scenarios to the rollups
+        return None
+
+    def _archive(self):
+        pass
+
+
+class DeferredSource(Source):
+    """
+    Stands in for a CQ source while cooking a shard. The CQ sources rewrite their files from everything they have
+    loaded, so each pull's CQ data is moved into the shard and fed to the real source, in archive order, by the merge.
+    """
+    def __init__(self, name, shard_dir):
+        super().__init__(name, shard_dir / 'deferred' / name)
+        self.loaded = 0
+
+    def load_new_data(self, pull_source_path, **kwargs):
+        target_dir = self.data_dir / '{0:06d}'.format(self.loaded)
+        target_dir.mkdir(parents=True)
+        pull_source_path.replace(target_dir / pull_source_path.name)
+        self.loaded += 1
+
+    @staticmethod
+    def get_paths(name, shard_dir):
+        """
+        Get the data deferred by a source while cooking a shard.
+        :param name: name of the source
+        :param shard_dir: the shard directory
+        :return: list of paths, in the order they were loaded
+        """
+        data_dir = shard_dir / 'deferred' / name
+        if not data_dir.exists():
+            return []
+
+        return [next(path.iterdir()) for path in sorted(data_dir.iterdir())]
+
+
+class SkippedSource(Source):
+    """
+    Stands in for a source that is not being replayed. Its data is ignored.
+    """
+    def __init__(self, name):
+        super().__init__(name, None)
+
+    def setup(self):
+        pass
+
+
+def create_sources(names, shard_dir=None):
+    """
+    Create the sources to replay, on the current DB paths.
+    :param names: names of the sources to replay (see SOURCES)
+    :param shard_dir: if given, the CQ sources are deferred to the merge and the other sources are skipped
+    :return: dict of source name to source, in the order process.py uses
+    """
+    sources = {
+        'jenkins': ProductSource,
+        'ins': InsSource,
+        'vic': VicSource,
+        'cq': CqSource,
+        'cq_old': lambda: CqSourceOld(incremental=util.get_boolean_setting('process', 'cq_incremental', False),
+                                      defer_index_recreation=True),
+        'vic_status': VicStatusSource
+    }
+
+    created = {}
+    for name, create in sources.items():
+        replayed = ('cq' if name == 'cq_old' else name) in names
+
+        if not replayed:
+            if shard_dir is not None:
+                created[name] = SkippedSource(name)
+        elif shard_dir is not None and name in ('cq', 'cq_old'):
+            created[name] = DeferredSource(name, shard_dir)
+        else:
+            created[name] = create()
+
+    return created
+
+
+def cook_archive(name, path, shard_dir, sources):
+    """
+    Process one archive into an empty shard directory. Runs in a worker process.
+    :param name: archive name
+    :param path: path to the archive, or None to restore it from the archive store
+    :param shard_dir: the shard directory
+    :param sources: names of the sources to replay
+    :return: the archive name
+    """
+    util.setup()
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    if path is None:
+        archive_path = ArchiveStore().restore(name, shard_dir)
+    else:
+        archive_path = Collector.link_or_copy(path, shard_dir)
+
+    with use_db_dir(shard_dir / 'data', shard_dir / 'index'), use_settings(SHARD_SETTINGS):
+        shard_sources = create_sources(sources, shard_dir)
+
+        for source in shard_sources.values():
+            source.setup()
+
+        ReplayArchive(archive_path, shard_sources).load([archive_path], False)
+
+        for source in shard_sources.values():
+            source.finish()
+
+    archive_path.unlink()
+    return name
+
+
+@contextmanager
+def use_db_dir(db_dir, index_dir):
+    """
+    Point the DB paths at another DB directory for the duration of the context.
+    :param db_dir: the DB directory
+    :param index_dir: the index directory
+    """
+    orig_db_dir = util.db_dir
+    orig_index_dir = util.index_dir
+
+    util.set_db_dir(db_dir, index_dir)
+    try:
+        yield
+    finally:
+        util.set_db_dir(orig_db_dir, orig_index_dir)
+
+
+@contextmanager
+def use_settings(settings):
+    """
+    Override pivt.conf settings for the duration of the context.
+    :param settings: dict of (stanza, setting) to value
+    """
+    orig_settings = dict(util.settings)
+
+    for (stanza, setting), value in settings.items():
+        util.set_setting(stanza, setting, value)
+    try:
+        yield
+    finally:
+        util.settings.clear()
+        util.settings.update(orig_settings)
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d')
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Rebuild the DB files from archived new data')
+    parser.add_argument('--start', type=parse_date, help='replay events on or after this UTC date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=parse_date, help='replay events on or before this UTC date (YYYY-MM-DD)')
+    parser.add_argument('--sources', nargs='+', choices=SOURCES, default=SOURCES, help='sources to rebuild')
+    parser.add_argument('--workers', type=int, help='number of processes cooking archives; 0 for one per CPU '
+                                                    '(default: replay.workers setting)')
+    parser.add_argument('--keep-existing', action='store_true',
+                        help='keep the current events and only add the replayed events missing from them')
+    parser.add_argument('--profile', action='store_true', help='write timing spans to the log directory')
+    args = parser.parse_args(args)
+
+    util.setup()
+    logger = util.get_logger('replay')
+
+    if args.profile:
+        util.profiler.enable()
+
+    workers = args.workers
+    if workers is None:
+        workers = int(util.get_setting('replay', 'workers', 0))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+
+    end = args.end + datetime.timedelta(days=1) if args.end is not None else None
+
+    replayer = Replayer(args.sources, args.start, end, workers, args.keep_existing)
+    with util.profiler.span('Replayer.run'):
+        replayer.run()
+
+    if util.profiler.enabled:
+        for path in util.profiler.write(util.log_dir, 'replay'):
+            logger.info('Wrote profile %s', path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -26,6 +26,7 @@ import time
 import datetime
 import re
 import shutil
+import json
 from urllib.request import urlopen
 from collections import abc
 from pathlib import Path
@@ -55,9 +56,15 @@ class Utility:
         # data directories
         self.data_dir = Path()
         self.archive_dir = Path()
+        self.archive_store_dir = Path()
         self.collected_dir = Path()
         self.db_dir = Path()
         self.new_data_dir = Path()
+        self.tmp_dir = Path()
+        self.index_dir = Path()
+        self.replay_dir = Path()
+        self.jenkins_ttr_state_path = Path()
+        self.jenkins_ttr_pending_dir = Path()
 
         self.jenkins_data_dir = Path()
         self.jenkins_ft_data_dir = Path()
@@ -66,9 +73,12 @@ class Utility:
         self.cq_data_dir = Path()
         self.cq_data_path_old = Path()
         self.cq_changed_files_path = Path()
+        self.cq_changed_files_index_path = Path()
+        self.cq_data_delta_dir = Path()
         self.cq_data_path = Path()
         self.cq_events_path = Path()
         self.vic_status_data_dir = Path()
+        self.summary_data_dir = Path()
 
         # Logging
         self.file_handler = None
@@ -94,6 +104,9 @@ class Utility:
         self.ci_to_ss = Utility.setup_ci_to_ss()
 
         self.conf_manager = None
+        self.settings = {}
+
+        self.profiler = Profiler()
 
         self.initialized = False
 
@@ -140,9 +153,26 @@ class Utility:
 
         self.data_dir = self.var_dir / 'data'  # path to directory with files monitored by Splunk
         self.archive_dir = self.data_dir / 'archive'  # path to archive directory
+        self.archive_store_dir = self.data_dir / 'store'  # content-addressed archive store, not monitored by Splunk
         self.collected_dir = self.data_dir / 'collected'  # path to collected directory
-        self.db_dir = self.data_dir / 'data'
         self.new_data_dir = self.data_dir / 'newdata'
+        self.tmp_dir = self.data_dir / 'tmp'  # scratch space on the same file system as db_dir, not monitored by Splunk
+        self.replay_dir = self.data_dir / 'replay'  # replay staging, on the same file system as db_dir
+
+        self.set_db_dir(self.data_dir / 'data', self.data_dir / 'index')
+
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+
+    def set_db_dir(self, db_dir, index_dir):
+        """
+        Point the DB paths at a DB directory, e.g. a staging directory that is swapped in once complete.
+        :param db_dir: directory with the files monitored by Splunk
+        :param index_dir: directory with the event key indexes and TTR state
+        """
+        self.db_dir = db_dir
+        self.index_dir = index_dir  # persisted event key indexes, not monitored by Splunk
+        self.jenkins_ttr_state_path = self.index_dir / 'jenkins_ttr.json'
+        self.jenkins_ttr_pending_dir = self.index_dir / 'jenkins_ttr_pending'  # new events waiting for their TTR
 
         self.jenkins_data_dir = self.db_dir / 'jenkins'
         self.jenkins_ft_data_dir = self.jenkins_data_dir / 'ft'
@@ -154,13 +184,25 @@ class Utility:
         self.cq_data_dir = self.db_dir / 'cq'
         self.cq_data_path_old = self.cq_data_dir / 'CQ_Data.csv'
         self.cq_changed_files_path = self.cq_data_dir / 'CQ_Changed_Files.csv'
+        self.cq_changed_files_index_path = self.cq_data_dir / 'CQ_Changed_Files.idx'
+        self.cq_data_delta_dir = self.cq_data_dir / 'delta'  # incremental CQ_Data.csv updates
 
         self.cq_data_path = self.cq_data_dir / 'drs.csv'
         self.cq_events_path = self.cq_data_dir / 'events.json'
 
         self.vic_status_data_dir = self.db_dir / 'vic_status'
 
-        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.summary_data_dir = self.db_dir / 'summary'  # daily rollups for the pivt_summary index
+
+    def set_setting(self, stanza, setting, value):
+        """
+        Override a pivt.conf setting for the rest of this process.
+        :param stanza: stanza the setting is under
+        :param setting: name of the setting
+        :param value: the value
+        """
+        self.settings[(stanza, setting, False)] = value
+        self.settings[(stanza, setting, True)] = value
 
     def teardown(self):
         """Tear down the util instance. Mainly used for unit tests."""
@@ -171,6 +213,51 @@ class Utility:
 
         self.__init__()
 
+    def get_setting(self, stanza, setting, fallback):
+        """
+        Get a pivt.conf setting, caching it for later calls.
+        :param stanza: stanza the setting is under
+        :param setting: name of the setting
+        :param fallback: value to use if the setting does not exist or configuration is not loaded
+        :return: the setting value
+        """
+        key = (stanza, setting, False)
+        if key not in self.settings:
+            value = fallback
+            if self.conf_manager is not None:
+                value = self.conf_manager.get('pivt', stanza, setting, fallback=fallback)
+            self.settings[key] = value
+
+        return self.settings[key]
+
+    def get_boolean_setting(self, stanza, setting, fallback):
+        """
+        Get a boolean pivt.conf setting, caching it for later calls.
+        :param stanza: stanza the setting is under
+        :param setting: name of the setting
+        :param fallback: value to use if the setting does not exist or configuration is not loaded
+        :return: the setting value
+        """
+        key = (stanza, setting, True)
+        if key not in self.settings:
+            value = fallback
+            if self.conf_manager is not None:
+                value = self.conf_manager.get_boolean('pivt', stanza, setting, fallback=fallback)
+            self.settings[key] = value
+
+        return self.settings[key]
+
+    def open_batch_writer(self, path):
+        """
+        Create a BatchWriter for a path using the configured buffer size and fsync policy.
+        :param path: path to the file to append to
+        :return: the BatchWriter
+        """
+        buffer_size = int(self.get_setting('process', 'write_buffer_size', BatchWriter.DEFAULT_BUFFER_SIZE))
+        fsync = self.get_setting('process', 'fsync', BatchWriter.FSYNC_CLOSE)
+
+        return BatchWriter(path, buffer_size=buffer_size, fsync=fsync, tmp_dir=self.tmp_dir)
+
     @staticmethod
     def setup_ci_to_ss():
         """
@@ -286,11 +373,12 @@ class Utility:
         :param logger: logger to use for logging
         :param get_new_date: if True, generate a new pull date using current time; else, load from file
         """
-        new_description = self._get_new_dashboard_description(get_new_date)
-        path = self._get_dashboards_path(splunk_home, logger)
-        dashboard_names = os.listdir(path)
-        for dashboard_name in dashboard_names:
-            self._update_last_pull_date(dashboard_name, path, new_description, logger)
+        with self.profiler.span('util.update_dashboards'):
+            new_description = self._get_new_dashboard_description(get_new_date)
+            path = self._get_dashboards_path(splunk_home, logger)
+            dashboard_names = os.listdir(path)
+            for dashboard_name in dashboard_names:
+                self._update_last_pull_date(dashboard_name, path, new_description, logger)
 
     def _get_dashboards_path(self, path_to_splunk, logger):
         """
@@ -480,6 +568,284 @@ class Utility:
         return urlopen(url, context=ssl._create_unverified_context()).read()
 
 
+class BatchWriter:
+    """
+    Appends lines to a file in large batches.
+
+    Lines are buffered in memory and written once the buffer fills or the writer is closed. A file that does not
+    exist yet is written to a temporary file and renamed into place; otherwise each batch is appended with a single
+    write call. Either way every write ends on a line boundary, so a file monitor never picks up a partial line.
+    """
+    FSYNC_NEVER = 'never'  # leave flushing to disk up to the OS
+    FSYNC_BATCH = 'batch'  # fsync after every batch
+    FSYNC_CLOSE = 'close'  # fsync once when the writer is closed
+    FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_BATCH, FSYNC_CLOSE)
+
+    DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+
+    json_encoder = json.JSONEncoder(check_circular=False)
+
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE, fsync=FSYNC_CLOSE, tmp_dir=None):
+        """
+        :param path: path to the file to append to
+        :param buffer_size: number of characters to buffer before writing a batch
+        :param fsync: one of FSYNC_POLICIES
+        :param tmp_dir: directory for the temporary file used to create a new file; defaults to the file's directory
+        """
+        if fsync not in self.FSYNC_POLICIES:
+            raise Exception('Unknown fsync policy {0}! Policies: {1}'.format(fsync, self.FSYNC_POLICIES))
+
+        self.path = Path(path)
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.tmp_dir = Path(tmp_dir) if tmp_dir is not None else self.path.parent
+
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+        self.batches = 0
+        self.dirty = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_line(self, line):
+        """
+        Buffer a line, writing the batch if the buffer is full.
+        :param line: the line, without a trailing newline
+        """
+        self.buffer.append(line)
+        self.buffer.append('\n')
+        self.buffered += len(line) + 1
+
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def write_json(self, obj):
+        """
+        Buffer an object as a line of JSON.
+        :param obj: the object
+        """
+        self.write_line(self.json_encoder.encode(obj))
+
+    def flush(self):
+        """
+        Write buffered lines to the file.
+        """
+        if not self.buffer:
+            return
+
+        data = ''.join(self.buffer).encode('utf-8')
+        self.buffer = []
+        self.buffered = 0
+
+        if self.path.exists():
+            self._append(data)
+        else:
+            self._create(data)
+
+        self.written += len(data)
+        self.batches += 1
+
+    def close(self):
+        """
+        Write any buffered lines and apply the fsync policy.
+        """
+        self.flush()
+
+        if self.fsync == self.FSYNC_CLOSE and self.dirty:
+            fd = os.open(str(self.path), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        self.dirty = False
+
+    def _append(self, data):
+        fd = os.open(str(self.path), os.O_WRONLY | os.O_APPEND)
+        try:
+            self._write_all(fd, data)
+            self._sync(fd)
+        finally:
+            os.close(fd)
+
+    def _create(self, data):
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self.tmp_dir / '{0}.{1}.tmp'.format(self.path.name, os.getpid())
+
+        fd = os.open(str(temp_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            self._write_all(fd, data)
+            self._sync(fd)
+        finally:
+            os.close(fd)
+
+        temp_path.replace(self.path)
+
+    def _sync(self, fd):
+        if self.fsync == self.FSYNC_BATCH:
+            os.fsync(fd)
+        else:
+            self.dirty = True
+
+    @staticmethod
+    def _write_all(fd, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+
+class Profiler:
+    """
+    Records nested timing spans.
+
+    Each span records wall and CPU time and any event counts attached to it while it is the innermost open span.
+    Spans are aggregated by name for a per-phase summary and by stack for a flame graph. While disabled, span()
+    returns a shared no-op context manager, so instrumented code costs next to nothing.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.started = None
+        self.phases = {}  # span name -> calls, wall, cpu and counts
+        self.stacks = {}  # ';'-joined stack of span names -> exclusive wall time
+        self.cprofile = None
+        self._open_spans = []
+
+    def enable(self, cprofile=False):
+        """
+        Start recording spans.
+        :param cprofile: if True, also run cProfile until write() is called
+        """
+        self.enabled = True
+        self.started = time.time()
+
+        if cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def span(self, name):
+        """
+        Get a context manager timing a span.
+        :param name: name of the span, e.g. 'Archive.load'
+        :return: the context manager
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def count(self, **counts):
+        """
+        Add event counts to the innermost open span.
+        :param counts: counts by name, e.g. added=10
+        """
+        if not self._open_spans:
+            return
+
+        span_counts = self._open_spans[-1].counts
+        for name, value in counts.items():
+            span_counts[name] = span_counts.get(name, 0) + value
+
+    def _record(self, span, wall, cpu):
+        phase = self.phases.get(span.name)
+        if phase is None:
+            phase = self.phases[span.name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'counts': {}}
+
+        phase['calls'] += 1
+        phase['wall'] += wall
+        phase['cpu'] += cpu
+        for name, value in span.counts.items():
+            phase['counts'][name] = phase['counts'].get(name, 0) + value
+
+        stack = ';'.join(open_span.name for open_span in self._open_spans + [span])
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + wall - span.child_wall
+
+        if self._open_spans:
+            self._open_spans[-1].child_wall += wall
+
+    def summary(self):
+        """
+        Get the per-phase summary.
+        :return: dict with the start time and phases sorted by total wall time
+        """
+        phases = sorted(self.phases.items(), key=lambda item: item[1]['wall'], reverse=True)
+        return {
+            'started': datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat()
+            if self.started else None,
+            'phases': dict(phases)
+        }
+
+    def write(self, out_dir, title):
+        """
+        Write the per-phase JSON summary, the folded stacks and, if enabled, the cProfile stats.
+        Folded stacks ('a;b;c <microseconds>' per line) can be fed to flamegraph.pl or speedscope.
+        :param out_dir: directory to write to
+        :param title: file name prefix
+        :return: list of paths written
+        """
+        out_dir.mkdir(parents=True, exist_ok=True)
+        base = '{0}_profile_{1}'.format(title, time.strftime('%Y%m%d%H%M%S', time.gmtime(self.started)))
+        paths = []
+
+        summary_path = out_dir / (base + '.json')
+        with summary_path.open('w') as file:
+            json.dump(self.summary(), file, indent=2)
+        paths.append(summary_path)
+
+        folded_path = out_dir / (base + '.folded')
+        with folded_path.open('w') as file:
+            for stack, wall in sorted(self.stacks.items()):
+                file.write('{0} {1}\n'.format(stack, int(round(wall * 1000000))))
+        paths.append(folded_path)
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            pstats_path = out_dir / (base + '.pstats')
+            self.cprofile.dump_stats(str(pstats_path))
+            paths.append(pstats_path)
+
+        return paths
+
+
+class _Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.counts = {}
+        self.child_wall = 0.0
+        self.wall_start = None
+        self.cpu_start = None
+
+    def __enter__(self):
+        self.profiler._open_spans.append(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+
+        self.profiler._open_spans.pop()
+        self.profiler._record(self, wall, cpu)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
 class Constants:
     """Common constants"""
     SOLVED = 'solved'
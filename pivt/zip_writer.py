@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Zip writer that compresses members across a process pool
+"""
+
+import os
+import stat
+import struct
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+
+def _deflate(data, level, zdict, last):
+    """
+    Compress one chunk of a member as part of a raw deflate stream. Runs in a worker process.
+    :param data: the chunk
+    :param level: compression level
+    :param zdict: the last 32 KiB before the chunk, so matches can reach back into the previous chunk
+    :param last: True for the last chunk of the member
+    :return: the compressed chunk, ending on a byte boundary if it is not the last
+    """
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelZipWriter:
+    """
+    Writes a standard zip archive whose members are deflated across a process pool.
+
+    Like pigz, each member is split into chunks that are compressed independently, each primed with the last
+    32 KiB of the chunk before it, and joined into one deflate stream. The archive is readable by zipfile and
+    any other unzip. Members are written in order with a bounded number of chunks in flight, and Zip64
+    records are used for members, offsets and archives past 4 GiB.
+    """
+    COMPRESSION_METHODS = ('stored', 'deflate')
+    CHUNK_SIZE = 4 * 1024 * 1024
+    WINDOW_SIZE = 32 * 1024
+
+    _LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+    _CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+    _END_RECORD = struct.Struct('<IHHHHIIH')
+    _ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+    _ZIP64_END_LOCATOR = struct.Struct('<IIQI')
+    _MAX_32 = 0xFFFFFFFF
+    _MAX_16 = 0xFFFF
+
+    def __init__(self, path, compression=zipfile.ZIP_DEFLATED, level=zlib.Z_DEFAULT_COMPRESSION, workers=None,
+                 chunk_size=CHUNK_SIZE):
+        self.path = Path(path)
+        self.compression = compression
+        self.level = level
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count()
+        self.max_pending = self.workers * 2
+
+        self.fp = self.path.open('wb')
+        self.entries = []
+        self.pending = deque()
+        self.pending_chunks = 0
+        self.current = None
+        self.executor = ProcessPoolExecutor(self.workers) if compression == zipfile.ZIP_DEFLATED else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write_tree(self, root_dir):
+        """
+        Add the contents of a directory, with paths relative to it, like shutil.make_archive.
+        :param root_dir: the directory
+        """
+        root_dir = Path(root_dir)
+        for path in sorted(root_dir.rglob('*')):
+            self.write(path, path.relative_to(root_dir).as_posix())
+
+    def write(self, path, arcname):
+        """
+        Add a file or directory.
+        :param path: the file or directory
+        :param arcname: its name in the archive
+        """
+        info = self._zip_info(path, arcname)
+        is_dir = info.filename.endswith('/')
+        info.compress_type = zipfile.ZIP_STORED if is_dir else self.compression
+        info.CRC = 0
+
+        # decide on Zip64 before writing the local header; deflate can grow incompressible data slightly
+        zip64 = info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        self._queue(('start', info, zip64))
+
+        if not is_dir:
+            crc = 0
+            previous = b''
+            with path.open('rb') as file:
+                chunk = file.read(self.chunk_size)
+                while True:
+                    next_chunk = file.read(self.chunk_size) if len(chunk) == self.chunk_size else b''
+                    last = not next_chunk
+                    crc = zlib.crc32(chunk, crc)
+
+                    if self.executor is None:
+                        self._queue(('data', chunk))
+                    else:
+                        future = self.executor.submit(_deflate, chunk, self.level, previous[-self.WINDOW_SIZE:], last)
+                        self._queue(('future', future))
+
+                    if last:
+                        break
+                    previous = chunk
+                    chunk = next_chunk
+            info.CRC = crc
+
+        self._queue(('end', info, zip64))
+
+    def write_stream(self, info, chunks):
+        """
+        Add a member from its uncompressed data, compressing it in this process with its own compress_type. Only a
+        bounded number of chunks is held at a time. The member's CRC and size are set from the data as it is written.
+        :param info: the member's ZipInfo; its file_size is the expected size, used to decide on Zip64
+        :param chunks: iterable of bytes
+        """
+        is_dir = info.filename.endswith('/')
+        if is_dir:
+            info.compress_type = zipfile.ZIP_STORED
+        elif info.compress_type == zipfile.ZIP_BZIP2:
+            info.extract_version = max(info.extract_version, zipfile.BZIP2_VERSION)
+        elif info.compress_type == zipfile.ZIP_LZMA:
+            info.extract_version = max(info.extract_version, zipfile.LZMA_VERSION)
+            info.flag_bits |= 0x02  # end of stream marker present, as zipfile writes it
+
+        # the compressor ZipFile.writestr uses, so members come out the same as if they were written by it
+        compressor = None if is_dir else zipfile._get_compressor(info.compress_type)
+        info.CRC = 0
+
+        zip64 = info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        self._queue(('start', info, zip64))
+
+        crc = 0
+        size = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk) if compressor is not None else chunk
+            if data:
+                self._queue(('data', data))
+
+        if compressor is not None:
+            data = compressor.flush()
+            if data:
+                self._queue(('data', data))
+
+        info.CRC = crc
+        info.file_size = size
+        self._queue(('end', info, zip64))
+
+    @staticmethod
+    def _zip_info(path, arcname):
+        """
+        Make the ZipInfo of a file or directory, clamping modification times to the range zip can store.
+        :param path: the file or directory
+        :param arcname: its name in the archive
+        :return: the ZipInfo
+        """
+        st = path.stat()
+        date_time = time.localtime(st.st_mtime)[:6]
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
+        elif date_time[0] > 2107:
+            date_time = (2107, 12, 31, 23, 59, 59)
+
+        is_dir = stat.S_ISDIR(st.st_mode)
+        info = zipfile.ZipInfo(arcname + '/' if is_dir else arcname, date_time)
+        info.external_attr = (st.st_mode & 0xFFFF) << 16
+        if is_dir:
+            info.external_attr |= 0x10  # MS-DOS directory flag
+        else:
+            info.file_size = st.st_size
+        return info
+
+    def copy_archive(self, path):
+        """
+        Add every member of another archive, copying its compressed data as it is.
+        :param path: the archive
+        """
+        while self.pending:
+            self._write_next()
+
+        with zipfile.ZipFile(str(path)) as archive, Path(path).open('rb') as file:
+            for info in archive.infolist():
+                if info.flag_bits & 0x9:
+                    raise zipfile.BadZipFile('Cannot copy {0}: it is encrypted or has a data descriptor'.format(
+                        info.filename))
+
+                file.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack('<HH', file.read(4))
+                file.seek(info.header_offset + self._LOCAL_HEADER.size + name_length + extra_length)
+
+                zip64 = info.file_size > self._MAX_32 or info.compress_size > self._MAX_32
+                info.header_offset = self.fp.tell()
+                self.fp.write(self._local_header(info, zip64))
+
+                remaining = info.compress_size
+                while remaining:
+                    data = file.read(min(self.chunk_size, remaining))
+                    if not data:
+                        raise zipfile.BadZipFile('Truncated member {0} in {1}'.format(info.filename, path))
+                    self.fp.write(data)
+                    remaining -= len(data)
+
+                self.entries.append((info, zip64))
+
+    def _queue(self, item):
+        self.pending.append(item)
+        if item[0] in ('data', 'future'):
+            self.pending_chunks += 1
+
+        while self.pending_chunks > self.max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        item = self.pending.popleft()
+        kind = item[0]
+
+        if kind == 'start':
+            info, zip64 = item[1], item[2]
+            info.header_offset = self.fp.tell()
+            info.compress_size = 0
+            self.current = info
+            self.fp.write(self._local_header(info, zip64))
+        elif kind == 'end':
+            info, zip64 = item[1], item[2]
+            if (info.compress_size > self._MAX_32 or info.file_size > self._MAX_32) and not zip64:
+                raise zipfile.LargeZipFile('Member {0} grew past 4 GiB without Zip64'.format(info.filename))
+
+            # sizes and CRC are known now; fill them into the local header
+            end = self.fp.tell()
+            self.fp.seek(info.header_offset)
+            self.fp.write(self._local_header(info, zip64))
+            self.fp.seek(end)
+            self.entries.append((info, zip64))
+        else:
+            data = item[1] if kind == 'data' else item[1].result()
+            self.fp.write(data)
+            self.current.compress_size += len(data)
+            self.pending_chunks -= 1
+
+    @staticmethod
+    def _dos_time(info):
+        year, month, day, hour, minute, second = info.date_time
+        return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+    @staticmethod
+    def _flags(info):
+        # keep the compression option bits of a copied member
+        flags = info.flag_bits & 0x6
+        try:
+            info.filename.encode('ascii')
+        except UnicodeEncodeError:
+            flags |= 0x800
+        return flags
+
+    @staticmethod
+    def _version(info, zip64):
+        return max(info.extract_version, zipfile.ZIP64_VERSION if zip64 else zipfile.DEFAULT_VERSION)
+
+    def _local_header(self, info, zip64):
+        dos_time, dos_date = self._dos_time(info)
+        name = info.filename.encode('utf-8')
+        extra = b''
+        compress_size, file_size = info.compress_size, info.file_size
+        version = self._version(info, zip64)
+
+        if zip64:
+            extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size)
+            compress_size = file_size = self._MAX_32
+
+        return self._LOCAL_HEADER.pack(0x04034b50, version, self._flags(info), info.compress_type, dos_time, dos_date,
+                                       info.CRC, compress_size, file_size, len(name), len(extra)) + name + extra
+
+    def _central_header(self, info, zip64):
+        dos_time, dos_date = self._dos_time(info)
+        name = info.filename.encode('utf-8')
+        compress_size, file_size, offset = info.compress_size, info.file_size, info.header_offset
+
+        fields = []
+        if zip64:
+            fields.extend([file_size, compress_size])
+            compress_size = file_size = self._MAX_32
+        if offset > self._MAX_32:
+            fields.append(offset)
+            offset = self._MAX_32
+
+        extra = b''
+        version = self._version(info, bool(fields))
+        if fields:
+            extra = struct.pack('<HH{0}Q'.format(len(fields)), 1, 8 * len(fields), *fields)
+
+        return self._CENTRAL_HEADER.pack(0x02014b50, (3 << 8) | version, version, self._flags(info),
+                                         info.compress_type, dos_time, dos_date, info.CRC, compress_size, file_size,
+                                         len(name), len(extra), 0, 0, 0, info.external_attr, offset) + name + extra
+
+    def close(self):
+        """Write the remaining members and the central directory, and close the archive."""
+        try:
+            while self.pending:
+                self._write_next()
+
+            central_offset = self.fp.tell()
+            for info, zip64 in self.entries:
+                self.fp.write(self._central_header(info, zip64))
+            central_size = self.fp.tell() - central_offset
+            count = len(self.entries)
+
+            if count > self._MAX_16 or central_offset > self._MAX_32 or central_size > self._MAX_32:
+                zip64_offset = self.fp.tell()
+                self.fp.write(self._ZIP64_END_RECORD.pack(0x06064b50, 44, (3 << 8) | zipfile.ZIP64_VERSION,
+                                                          zipfile.ZIP64_VERSION, 0, 0, count, count, central_size,
+                                                          central_offset))
+                self.fp.write(self._ZIP64_END_LOCATOR.pack(0x07064b50, 0, zip64_offset, 1))
+                # readers take the real values from the Zip64 record
+                count = 0xFFFF
+                central_offset = central_size = 0xFFFFFFFF
+
+            self.fp.write(self._END_RECORD.pack(0x06054b50, 0, 0, count, count, central_size, central_offset, 0))
+        finally:
+            self._shutdown()
+
+    def abort(self):
+        """Stop writing and delete the incomplete archive."""
+        for item in self.pending:
+            if item[0] == 'future':
+                item[1].cancel()
+        self.pending.clear()
+
+        self._shutdown()
+        self.path.unlink()
+
+    def _shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.fp.close()
@@ -24,6 +24,7 @@ except ImportError:
     from ..ordereddict import OrderedDict
 from splunklib.six.moves import cStringIO as StringIO
 from itertools import chain
+from operator import itemgetter
 from splunklib.six.moves import map as imap
 from json import JSONDecoder, JSONEncoder
 from json.encoder import encode_basestring_ascii as json_encode_string
@@ -484,6 +485,9 @@ class RecordWriter(object):
         self._record_count = 0
         self._total_record_count = 0
 
+        self._pending_rows = []
+        self._row_encoders = {}
+
     @property
     def is_flushed(self):
         return self._flushed
@@ -506,6 +510,7 @@ class RecordWriter(object):
         assert not (finished is None and partial is None)
         assert finished is None or partial is None
         self._ensure_validity()
+        self._write_pending_rows()
 
     def write_message(self, message_type, message_text, *args, **kwargs):
         self._ensure_validity()
@@ -513,13 +518,88 @@ class RecordWriter(object):
 
     def write_record(self, record):
         self._ensure_validity()
+        self._write_pending_rows()
         self._write_record(record)
 
     def write_records(self, records):
         self._ensure_validity()
         write_record = self._write_record
+
+        if six.PY2:
+            for record in records:
+                write_record(record)
+            return
+
+        # Fast path: once the fieldnames of the chunk are known, records whose values are all strings, numbers, or
+        # None are encoded by a cached per-schema encoder and queued, then written with one writerows call per batch.
+        # Anything else goes through _write_record, after the queue is written, so records stay in order.
+
+        pending_rows = self._pending_rows
+        fieldnames = None
+        encode_row = None
+
         for record in records:
-            write_record(record)
+            if fieldnames is not self._fieldnames:
+                fieldnames = self._fieldnames
+                encode_row = None if fieldnames is None else self._get_row_encoder(fieldnames)
+
+            row = None if encode_row is None else encode_row(record)
+
+            if row is None:
+                self._write_pending_rows()
+                write_record(record)
+                continue
+
+            pending_rows.append(row)
+            self._record_count += 1
+
+            if self._record_count >= self._maxresultrows:
+                self.flush(partial=True)
+            elif len(pending_rows) >= self._pending_rows_limit:
+                self._write_pending_rows()
+
+    _pending_rows_limit = 1000
+    _simple_value_types = frozenset((six.text_type, int, float, type(None)))
+
+    def _get_row_encoder(self, fieldnames):
+        """ Get the fast path encoder for a list of fieldnames, building it on first use. """
+        key = tuple(fieldnames)
+        encode_row = self._row_encoders.get(key)
+
+        if encode_row is None:
+            if len(key) == 1:
+                fieldname = key[0]
+
+                def get_values(record):
+                    return record[fieldname],
+            else:
+                get_values = itemgetter(*key)
+
+            width = 2 * len(key)
+            simple_value_types = self._simple_value_types
+
+            def encode_row(record):
+                try:
+                    values = get_values(record)
+                except KeyError:
+                    return None
+
+                if not simple_value_types.issuperset(map(type, values)):
+                    return None
+
+                # every value is followed by an empty multivalue column
+                row = [None] * width
+                row[::2] = values
+                return row
+
+            self._row_encoders[key] = encode_row
+
+        return encode_row
+
+    def _write_pending_rows(self):
+        if self._pending_rows:
+            self._writer.writerows(self._pending_rows)
+            del self._pending_rows[:]
 
     def _clear(self):
         self._buffer.seek(0)
@@ -14,10 +14,72 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 from splunklib.searchcommands import dispatch, EventingCommand, Configuration, Option, validators
+from collections import OrderedDict
 import sys
 import operator
 
 
+class GroupStore(object):
+    """ Look-beyond state of the groups still waiting on an event from before the search window.
+
+    The store is bounded by the number of groups and the number of look-beyond events seen per group. When it is full,
+    the least recently seen group is evicted.
+    """
+    def __init__(self, max_groups=0, max_events=0):
+        self.max_groups = max_groups
+        self.max_events = max_events
+        self.groups = OrderedDict()
+        self.event_counts = {}
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __contains__(self, key):
+        return key in self.groups
+
+    def values(self):
+        return list(self.groups.values())
+
+    def get(self, key):
+        """ Get the state of a group, marking it as most recently seen. Returns None if the group is not stored. """
+        if key not in self.groups:
+            return None
+
+        state = self.groups.pop(key)
+        self.groups[key] = state
+        return state
+
+    def put(self, key, state):
+        """ Store the state of a group. Returns the states of any groups evicted to make room. """
+        self.groups[key] = state
+        self.event_counts[key] = 0
+
+        evicted = []
+        while self.max_groups and len(self.groups) > self.max_groups:
+            evicted_key, evicted_state = self.groups.popitem(last=False)
+            del self.event_counts[evicted_key]
+            self.evicted += 1
+            evicted.append(evicted_state)
+
+        return evicted
+
+    def pop(self, key):
+        del self.event_counts[key]
+        return self.groups.pop(key)
+
+    def count_event(self, key):
+        """ Count a look-beyond event for a group. Returns False and evicts the group if it is over its event cap. """
+        self.event_counts[key] += 1
+
+        if self.max_events and self.event_counts[key] > self.max_events:
+            self.pop(key)
+            self.evicted += 1
+            return False
+
+        return True
+
+
 @Configuration()
 class TtrCommand(EventingCommand):
     """ Computes the time-to-repair (TTR) of a set of fields.
@@ -25,7 +87,14 @@ class TtrCommand(EventingCommand):
     ##Syntax
 
     .. code-block::
-        ttr ttrfield=<field> resultfield=<field> passvalue=<value> <field-list>
+        ttr ttrfield=<field> resultfield=<field> passvalue=<value> [lookbeyondboundary=<bool>] [lookbeyondgroups=<int>]
+            [lookbeyondevents=<int>] [lookbeyondtime=<seconds>] [streaming=<bool>] <field-list>
+
+    ##Description
+
+    With streaming=true, TTR is computed in one pass and events are returned as soon as their TTR is known: failing
+    events right away and passing events once the event before them in their group is seen. The TTR values are the
+    same as without streaming, but the output is not in descending time order; sort it if the order matters.
 
     ##Example
 
@@ -63,44 +132,77 @@ class TtrCommand(EventingCommand):
         ''',
         default=False, require=False, validate=validators.Boolean())
 
+    streaming = Option(
+        doc='''
+        **Syntax:** **streaming=***<bool>*
+        **Description:** Compute TTR in a single pass over events in descending time order, keeping only per-group
+        state instead of sorting the full result set in memory
+        ''',
+        default=False, require=False, validate=validators.Boolean())
+
+    lookbeyondgroups = Option(
+        doc='''
+        **Syntax:** **lookbeyondgroups=***<int>*
+        **Description:** Maximum number of groups to keep looking beyond the boundary for. The least recently seen
+        group is dropped when there are more. 0 (the default) means no limit
+        ''',
+        default=0, require=False, validate=validators.Integer(0))
+
+    lookbeyondevents = Option(
+        doc='''
+        **Syntax:** **lookbeyondevents=***<int>*
+        **Description:** Maximum number of events before the boundary to look at for a group before dropping it.
+        0 (the default) means no limit
+        ''',
+        default=0, require=False, validate=validators.Integer(0))
+
+    lookbeyondtime = Option(
+        doc='''
+        **Syntax:** **lookbeyondtime=***<seconds>*
+        **Description:** How far before the boundary to look. 0 means no limit
+        ''',
+        default=0, require=False, validate=validators.Integer(0))
+
 
     def transform(self, records):
         earliest_time = self.metadata.searchinfo.earliest_time
         by_fieldnames = self.fieldnames
 
-        self.logger.debug('ttrfield: %s, resultfield: %s, passvalue: %s, timefield: %s, lookbeyondboundary: %s, fieldnames: %s, earliest: %s', self.ttrfield, self.resultfield, self.passvalue, self.timefield, self.lookbeyondboundary, by_fieldnames, earliest_time)
+        self.logger.debug('ttrfield: %s, resultfield: %s, passvalue: %s, timefield: %s, lookbeyondboundary: %s, streaming: %s, fieldnames: %s, earliest: %s', self.ttrfield, self.resultfield, self.passvalue, self.timefield, self.lookbeyondboundary, self.streaming, by_fieldnames, earliest_time)
+
+        get_key, get_timestamp = self.compile_accessors(by_fieldnames)
 
-        # get all events needed for TTR calculation
+        if self.streaming:
+            return self.stream_ttr(records, earliest_time, get_key, get_timestamp)
+
+        # get all events needed for TTR calculation, with the group key and timestamp of each
         if self.lookbeyondboundary:
-            events_for_ttr = self.get_events_for_ttr(records, earliest_time, by_fieldnames)
+            events_for_ttr = self.get_events_for_ttr(records, earliest_time, get_key, get_timestamp)
         else:
-            events_for_ttr = list(records)
+            events_for_ttr = [(get_key(record), get_timestamp(record), record) for record in records]
 
         # calculate TTR
-        sort_by_args = list(by_fieldnames)
-        sort_by_args.append(self.timefield)
-        events_for_ttr.sort(key = operator.itemgetter(*sort_by_args))
+        events_for_ttr.sort(key=operator.itemgetter(0, 1))
 
         metadata = {}
         self.init_metadata(metadata)
 
-        last_by_fields = []
+        resultfield = self.resultfield
+        ttrfield = self.ttrfield
+        last_key = None
 
-        for event in events_for_ttr:
-            by_fields = self.get_by_fields(by_fieldnames, event)
-            if by_fields != last_by_fields:
+        for key, timestamp, event in events_for_ttr:
+            if key != last_key:
                 self.init_metadata(metadata)
 
-            ttr = self.calc_single_ttr(float(event[self.timefield]), event[self.resultfield], metadata)
-            event[self.ttrfield] = ttr
+            event[ttrfield] = self.calc_single_ttr(timestamp, event[resultfield], metadata)
 
-            last_by_fields = by_fields
+            last_key = key
 
         final_events = []
-        events_for_ttr.sort(key = operator.itemgetter(self.timefield), reverse=True)
+        events_for_ttr.sort(key=operator.itemgetter(1), reverse=True)
 
-        for event in events_for_ttr:
-            timestamp = float(event[self.timefield])
+        for key, timestamp, event in events_for_ttr:
             if self.lookbeyondboundary and timestamp < earliest_time:
                 # throw away events before earliest_time
                 break
@@ -108,17 +210,147 @@ class TtrCommand(EventingCommand):
 
         return final_events
 
+    def compile_accessors(self, by_fieldnames):
+        """
+        Build the functions that extract the group key tuple and numeric timestamp of a record.
+        """
+        if len(by_fieldnames) == 1:
+            by_fieldname = by_fieldnames[0]
+
+            def get_key(record):
+                return record[by_fieldname],
+        elif by_fieldnames:
+            get_key = operator.itemgetter(*by_fieldnames)
+        else:
+            def get_key(record):
+                return ()
+
+        timefield = self.timefield
+
+        def get_timestamp(record):
+            return float(record[timefield])
+
+        return get_key, get_timestamp
+
+
+    def stream_ttr(self, records, earliest_time, get_key, get_timestamp):
+        """
+        Compute TTR walking backwards in time over events in descending time order.
+
+        A passing event is held until the previous event of its group is known. If that event is a failure, the TTR is
+        measured to the first failure of the streak, which is the last failure seen before the next passing event.
+        Everything else is emitted as soon as it arrives, so memory is bounded by the number of groups.
+        """
+        groups = {}
+        store = self.make_group_store()
+        lookbeyond_earliest_time = self.get_lookbeyond_earliest_time(earliest_time)
+        within_time_window = True
+
+        resultfield = self.resultfield
+        ttrfield = self.ttrfield
+        passvalue = self.passvalue
 
-    def get_events_for_ttr(self, records, earliest_time, by_fieldnames):
+        last_timestamp = -1
+
+        for record in records:
+            timestamp = get_timestamp(record)
+
+            # make sure timestamps are decreasing
+            if last_timestamp != -1 and timestamp > last_timestamp:
+                raise Exception('events aren\'t in decreasing time order!')
+
+            last_timestamp = timestamp
+
+            passed = record[resultfield] == passvalue
+            key = get_key(record)
+
+            if self.lookbeyondboundary and timestamp < earliest_time:
+                if within_time_window:
+                    # only groups waiting on a TTR need events from before earliest_time
+                    for group_key, state in groups.items():
+                        if state['pending'] is not None:
+                            for evicted_state in store.put(group_key, state):
+                                yield evicted_state['pending']
+                    groups = {}
+                    within_time_window = False
+
+                if not store or timestamp < lookbeyond_earliest_time:
+                    break
+
+                state = store.get(key)
+                if state is None:
+                    continue
+
+                if not store.count_event(key):
+                    yield state['pending']
+                elif passed:
+                    yield self.resolve_pending(state)
+                    store.pop(key)
+                else:
+                    state['first_failure_time'] = timestamp
+
+                continue
+
+            record[ttrfield] = None
+
+            state = groups.get(key)
+            if state is None:
+                state = groups[key] = {'pending': None, 'pending_time': None, 'first_failure_time': None}
+
+            if passed:
+                if state['pending'] is not None:
+                    yield self.resolve_pending(state)
+
+                state['pending'] = record
+                state['pending_time'] = timestamp
+                state['first_failure_time'] = None
+            else:
+                if state['pending'] is not None:
+                    state['first_failure_time'] = timestamp
+
+                yield record
+
+        self.log_evicted(store)
+
+        # no earlier passing event for these, so they have no TTR
+        states = groups.values() if within_time_window else store.values()
+        pending_states = [state for state in states if state['pending'] is not None]
+        pending_states.sort(key=operator.itemgetter('pending_time'), reverse=True)
+
+        for state in pending_states:
+            yield state['pending']
+
+    def resolve_pending(self, state):
+        """
+        Set the TTR of a group's held passing event now that the event before it has been seen.
+        """
+        event = state['pending']
+
+        if state['first_failure_time'] is not None:
+            event[self.ttrfield] = state['pending_time'] - state['first_failure_time']
+
+        state['pending'] = None
+        state['pending_time'] = None
+        state['first_failure_time'] = None
+
+        return event
+
+
+    def get_events_for_ttr(self, records, earliest_time, get_key, get_timestamp):
         events_for_ttr = []
 
         metadata = {}
+        store = self.make_group_store()
+        lookbeyond_earliest_time = self.get_lookbeyond_earliest_time(earliest_time)
         within_time_window = True
 
+        resultfield = self.resultfield
+        passvalue = self.passvalue
+
         last_timestamp = -1
 
         for record in records:
-            timestamp = float(record[self.timefield])
+            timestamp = get_timestamp(record)
 
             # make sure timestamps are decreasing
             if last_timestamp != -1 and timestamp > last_timestamp:
@@ -126,49 +358,58 @@ class TtrCommand(EventingCommand):
 
             last_timestamp = timestamp
 
-            result = record[self.resultfield]
-            by_fields = self.get_by_fields(by_fieldnames, record)
-            key = self.gen_ttr_prep_metadata_key(by_fields)
+            result = record[resultfield]
+            key = get_key(record)
 
             if timestamp >= earliest_time:
-                events_for_ttr.append(record)
+                events_for_ttr.append((key, timestamp, record))
 
-                if key not in metadata:
-                    metadata[key] = {'last_result': None, 'staged_events': [], 'has_success': False}
-
-                combo = metadata[key]
+                combo = metadata.get(key)
+                if combo is None:
+                    combo = metadata[key] = {'last_result': None, 'staged_events': [], 'has_success': False}
 
                 combo['last_result'] = result
-                if result == self.passvalue:
+                if result == passvalue:
                     combo['has_success'] = True
             else:
                 if within_time_window:
-                    for key in metadata.keys():
-                        combo = metadata[key]
-                        if not combo['has_success']:
-                            del metadata[key]
+                    # only groups with a success in the window can have a TTR that needs earlier events
+                    for group_key, combo in metadata.items():
+                        if combo['has_success']:
+                            store.put(group_key, combo)
 
+                    metadata = {}
                     within_time_window = False
 
-                if not metadata:
+                if not store or timestamp < lookbeyond_earliest_time:
                     break
 
-                if key in metadata:
-                    combo = metadata[key]
-                    combo['staged_events'].append(record)
-                    if result == self.passvalue:
-                        events_for_ttr += combo['staged_events']
-                        del metadata[key]
+                combo = store.get(key)
+                if combo is None or not store.count_event(key):
+                    continue
+
+                combo['staged_events'].append((key, timestamp, record))
+                if result == passvalue:
+                    events_for_ttr += combo['staged_events']
+                    store.pop(key)
+
+        self.log_evicted(store)
 
         return events_for_ttr
 
+    def make_group_store(self):
+        return GroupStore(self.lookbeyondgroups, self.lookbeyondevents)
 
-    @staticmethod
-    def gen_ttr_prep_metadata_key(by_fields):
-        key = ''
-        for by_field in by_fields:
-            key += by_field + ':'
-        return key[:-1]
+    def get_lookbeyond_earliest_time(self, earliest_time):
+        if self.lookbeyondtime:
+            return earliest_time - self.lookbeyondtime
+        return float('-inf')
+
+    def log_evicted(self, store):
+        if store.evicted:
+            self.logger.info('lookbeyond groups evicted: %s', store.evicted)
+            self.write_warning('ttr: stopped looking beyond the boundary for {0} groups at the lookbeyondgroups or '
+                               'lookbeyondevents limit; their TTR values may be missing', store.evicted)
 
 
     @staticmethod
@@ -199,8 +440,4 @@ class TtrCommand(EventingCommand):
     def passing(self, result):
         return result == self.passvalue
 
-    @staticmethod
-    def get_by_fields(by_fieldnames, event):
-        return [event[x] for x in by_fieldnames]
-
 dispatch(TtrCommand, sys.argv, sys.stdin, sys.stdout, __name__)
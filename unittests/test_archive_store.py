@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pivt import archive_store
+import unittest
+import os
+import json
+import tempfile
+import zipfile
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from pivt.util import util
+from pivt.conf_manager import ConfManager
+from pivt.zip_writer import ParallelZipWriter
+
+orig_conf_load = ConfManager.load
+
+
+def setUpModule():
+    os.environ['PIVT_HOME'] = tempfile.mkdtemp().replace('\\', '/')
+
+    ConfManager.load = MagicMock()
+
+    util.setup()
+
+
+def tearDownModule():
+    util.teardown()
+    util.rmtree(os.environ['PIVT_HOME'], no_exist_ok=True)
+    if 'PIVT_HOME' in os.environ:
+        del os.environ['PIVT_HOME']
+
+    ConfManager.load = orig_conf_load
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+PIPELINE = b'{"stages": ["build", "test", "deploy"]}\n' * 2000
+
+
+def make_archive(name, members):
+    path = util.collected_dir / name
+    util.collected_dir.mkdir(parents=True, exist_ok=True)
+
+    with zipfile.ZipFile(str(path), 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(zipfile.ZipInfo(name[:8] + '/', (2019, 5, 1, 12, 0, 0)), b'')
+        for member_name, data in members.items():
+            archive.writestr(zipfile.ZipInfo(member_name, (2019, 5, 1, 12, 0, 0)), data)
+
+    return path
+
+
+class TestArchiveStore(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+        self.store = archive_store.ArchiveStore(chunk_size=4096)
+
+        self.members_1 = {'p1/jenkins/pipeline.json': PIPELINE, 'p1/jenkins/log.txt': os.urandom(10000)}
+        self.members_2 = {'p2/jenkins/pipeline.json': PIPELINE, 'p2/jenkins/empty.txt': b''}
+        self.path_1 = make_archive('19-05-01T00-00-00_NewData.zip', self.members_1)
+        self.path_2 = make_archive('19-05-02T00-00-00_NewData.zip', self.members_2)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_ingest_dedups(self):
+        stats_1 = self.store.ingest(self.path_1)
+        stats_2 = self.store.ingest(self.path_2)
+
+        self.assertLess(stats_1['new_chunks'], stats_1['chunks'])  # pipeline.json repeats its own chunks
+        self.assertGreater(stats_2['chunks'], 0)
+        self.assertEqual(0, stats_2['new_chunks'])
+
+        self.assertEqual([self.path_1.name, self.path_2.name], self.store.names())
+        self.assertTrue(self.store.contains(self.path_1.name))
+
+        stats = self.store.stats()
+        self.assertEqual(2, stats['archives'])
+        self.assertEqual(stats_1['new_chunks'], stats['chunks'])
+
+    def test_restore(self):
+        self.store.ingest(self.path_1)
+        out_dir = util.data_dir / 'restored'
+
+        path = self.store.restore(self.path_1.name, out_dir)
+
+        self.assertEqual(out_dir / self.path_1.name, path)
+        with zipfile.ZipFile(str(path)) as restored, zipfile.ZipFile(str(self.path_1)) as original:
+            self.assertIsNone(restored.testzip())
+            self.assertEqual(original.namelist(), restored.namelist())
+            for info in original.infolist():
+                restored_info = restored.getinfo(info.filename)
+                self.assertEqual(info.date_time, restored_info.date_time)
+                self.assertEqual(info.compress_type, restored_info.compress_type)
+                self.assertEqual(original.read(info), restored.read(restored_info))
+
+    def test_restore_streams_members(self):
+        data = os.urandom(10 * 4096 + 100)
+        path = make_archive('19-05-03T00-00-00_NewData.zip', {'p3/jenkins/big.bin': data})
+        self.store.ingest(path)
+
+        written = []
+        orig_queue = ParallelZipWriter._queue
+
+        def queue(writer, item):
+            if item[0] == 'data':
+                written.append(len(item[1]))
+            orig_queue(writer, item)
+
+        with patch.object(ParallelZipWriter, '_queue', autospec=True, side_effect=queue):
+            restored_path = self.store.restore(path.name, util.data_dir / 'restored')
+
+        self.assertEqual(11, len(written))
+        self.assertEqual(4096, max(written))
+        with zipfile.ZipFile(str(restored_path)) as restored:
+            self.assertEqual(data, restored.read('p3/jenkins/big.bin'))
+
+    def test_restore_corrupt(self):
+        self.store.ingest(self.path_1)
+        blob_path = next(path for path in self.store.blobs_dir.glob('*/*'))
+        blob_path.write_bytes(b'garbage')
+
+        with self.assertRaises(Exception):
+            self.store.restore(self.path_1.name, util.data_dir / 'restored')
+        self.assertFalse(list((util.data_dir / 'restored').glob('*')))
+
+    def test_restore_crc_mismatch(self):
+        self.store.ingest(self.path_1)
+        manifest_path = self.store.manifests_dir / (self.path_1.name + '.json')
+        manifest = json.loads(manifest_path.read_text())
+        manifest['members'][1]['crc'] ^= 1
+        manifest_path.write_text(json.dumps(manifest))
+
+        with self.assertRaisesRegex(ValueError, 'original CRC'):
+            self.store.restore(self.path_1.name, util.data_dir / 'restored')
+        self.assertFalse(list((util.data_dir / 'restored').glob('*')))
+
+    def test_remove_and_gc(self):
+        self.store.ingest(self.path_1)
+        self.store.ingest(self.path_2)
+        chunks = self.store.stats()['chunks']
+
+        self.store.remove(self.path_2.name)
+        self.assertEqual(0, self.store.gc())
+
+        self.store.remove(self.path_1.name)
+        self.assertEqual(chunks, self.store.gc())
+        self.assertEqual(0, self.store.stats()['chunks'])
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_ingest_and_restore(self):
+        path = make_archive('19-05-01T00-00-00_NewData.zip', {'p1/jenkins/pipeline.json': PIPELINE})
+        archive_path = util.archive_dir / path.name
+        util.archive_dir.mkdir(parents=True)
+        path.replace(archive_path)
+
+        archive_store.main(['ingest', '--delete', str(archive_path)])
+        self.assertFalse(archive_path.exists())
+
+        archive_store.main(['restore', path.name])
+        with zipfile.ZipFile(str(util.collected_dir / path.name)) as archive:
+            self.assertEqual(PIPELINE, archive.read('p1/jenkins/pipeline.json'))
@@ -19,7 +19,9 @@ import unittest
 import os
 import tempfile
 import re
+import zipfile
 from unittest.mock import MagicMock
+from unittest.mock import patch
 
 from pivt.util import util
 from pivt.conf_manager import ConfManager
@@ -161,6 +163,26 @@ class TestZipData(unittest.TestCase):
         pattern = re.compile('(.*/)?' + str(util.collected_dir).replace('\\', '/') + r'/\d\d-\d\d-\d\dT\d\d-\d\d-\d\d_NewData\.zip')
         self.assertTrue(pattern.fullmatch(archive_path))
 
+        with zipfile.ZipFile(archive_path) as archive:
+            self.assertEqual({'dir1/', 'dir1/file.txt', 'dir2/', 'dir2/file.txt', 'dir3/', 'dir3/file.txt',
+                              'file.txt'}, set(archive.namelist()))
+
+    def test_compression(self):
+        make_files()
+
+        with patch.object(util, 'get_setting', side_effect=get_collect_setting({'compression': 'bzip2'})):
+            archive_path = self.collector.zip_data()
+
+        with zipfile.ZipFile(str(archive_path)) as archive:
+            self.assertEqual(zipfile.ZIP_BZIP2, archive.getinfo('dir1/file.txt').compress_type)
+
+    def test_level_needs_python_3_7(self):
+        with patch.object(collect.sys, 'version_info', (3, 5, 2)):
+            with self.assertLogs('Collector', 'WARNING'):
+                self.assertEqual({}, collect.get_zip_options(1, self.collector.logger))
+
+        self.assertEqual({}, collect.get_zip_options(None, self.collector.logger))
+
 
 class TestCleanup(unittest.TestCase):
     def setUp(self):
@@ -174,3 +196,218 @@ class TestCleanup(unittest.TestCase):
         make_files()
         self.collector.cleanup()
         self.assertFalse(os.listdir(str(util.new_data_dir)))
+
+
+def get_collect_setting(settings):
+    def get_setting(stanza, setting, fallback):
+        return settings.get(setting, fallback)
+    return get_setting
+
+
+class TestIncrementalMain(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+        with patch.object(util, 'get_boolean_setting', return_value=True):
+            self.collector = collect.Collector()
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_append_then_collect(self):
+        make_files()
+
+        appender = collect.Collector(['--append'])
+        appender.main()
+
+        rolling_path = util.tmp_dir / 'NewData.parts'
+        self.assertEqual(['dir1.zip', 'dir2.zip', 'dir3.zip'], sorted(os.listdir(str(rolling_path))))
+        self.assertEqual(['file.txt'], os.listdir(str(util.new_data_dir)))
+
+        self.collector.main()
+
+        self.assertFalse(rolling_path.exists())
+        self.assertFalse(os.listdir(str(util.new_data_dir)))
+
+        collected = list(util.collected_dir.glob('*'))
+        self.assertEqual(1, len(collected))
+        self.assertTrue(re.fullmatch(r'\d\d-\d\d-\d\dT\d\d-\d\d-\d\d_NewData\.zip', collected[0].name))
+
+        archived = util.archive_dir / collected[0].name
+        self.assertTrue(archived.exists())
+        self.assertTrue(os.path.samefile(str(collected[0]), str(archived)))
+
+        with zipfile.ZipFile(str(collected[0])) as archive:
+            names = set(archive.namelist())
+        self.assertEqual({'dir1/', 'dir1/file.txt', 'dir2/', 'dir2/file.txt', 'dir3/', 'dir3/file.txt', 'file.txt'},
+                         names)
+
+    def test_nothing_to_collect(self):
+        util.new_data_dir.mkdir(parents=True)
+        self.collector.main()
+        self.assertFalse(list(util.collected_dir.glob('*')))
+
+    def test_new_data_dir_dne(self):
+        with self.assertRaises(SystemExit):
+            self.collector.main()
+
+
+class TestArchiveStoreMain(unittest.TestCase):
+    def setUp(self):
+        self.collector = collect.Collector()
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test(self):
+        make_files()
+
+        def get_boolean_setting(stanza, setting, fallback):
+            return stanza == 'archive'
+
+        with patch.object(util, 'get_boolean_setting', side_effect=get_boolean_setting):
+            self.collector.main()
+
+        collected = list(util.collected_dir.glob('*'))
+        self.assertEqual(1, len(collected))
+        self.assertFalse(os.listdir(str(util.archive_dir)))
+        self.assertEqual([collected[0].name], collect.ArchiveStore().names())
+
+
+class TestRollingArchive(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_compression(self):
+        make_files()
+        (util.new_data_dir / 'dir1' / 'file.txt').write_text('a' * 1000)
+
+        settings = {'compression': 'stored'}
+        with patch.object(util, 'get_setting', side_effect=get_collect_setting(settings)):
+            rolling_archive = collect.RollingArchive()
+        rolling_archive.add(util.new_data_dir / 'dir1')
+
+        with zipfile.ZipFile(str(rolling_archive.parts_dir / 'dir1.zip')) as archive:
+            info = archive.getinfo('dir1/file.txt')
+        self.assertEqual(zipfile.ZIP_STORED, info.compress_type)
+        self.assertFalse((util.new_data_dir / 'dir1').exists())
+
+        settings = {'compression': 'deflate', 'compression_level': '1'}
+        with patch.object(util, 'get_setting', side_effect=get_collect_setting(settings)):
+            rolling_archive = collect.RollingArchive()
+        self.assertEqual(1, rolling_archive.compression_level)
+        rolling_archive.add(util.new_data_dir / 'dir2')
+
+        archive_path = rolling_archive.finish(util.tmp_dir / 'NewData.zip')
+        with zipfile.ZipFile(str(archive_path)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(['dir1/', 'dir1/file.txt', 'dir2/', 'dir2/file.txt'], archive.namelist())
+            self.assertEqual(zipfile.ZIP_STORED, archive.getinfo('dir1/file.txt').compress_type)
+            self.assertEqual(zipfile.ZIP_DEFLATED, archive.getinfo('dir2/file.txt').compress_type)
+            self.assertEqual('a' * 1000, archive.read('dir1/file.txt').decode())
+        self.assertFalse(rolling_archive.parts_dir.exists())
+
+    def test_failed_add(self):
+        make_files()
+        rolling_archive = collect.RollingArchive()
+        rolling_archive.add(util.new_data_dir / 'dir1')
+
+        with patch.object(zipfile.ZipFile, 'write', side_effect=OSError('No space left on device')):
+            with self.assertRaises(OSError):
+                rolling_archive.add(util.new_data_dir / 'dir2')
+
+        self.assertTrue((util.new_data_dir / 'dir2' / 'file.txt').exists())
+        self.assertEqual(['dir1.zip'], [path.name for path in rolling_archive.parts_dir.glob('*.zip')])
+
+        rolling_archive.add(util.new_data_dir / 'dir2')
+        archive_path = rolling_archive.finish(util.tmp_dir / 'NewData.zip')
+        with zipfile.ZipFile(str(archive_path)) as archive:
+            self.assertEqual(['dir1/', 'dir1/file.txt', 'dir2/', 'dir2/file.txt'], archive.namelist())
+
+    def test_unsupported_compression(self):
+        with patch.object(util, 'get_setting', side_effect=get_collect_setting({'compression': 'rar'})):
+            with self.assertRaises(ValueError):
+                collect.RollingArchive()
+
+    def test_finish_empty(self):
+        self.assertIsNone(collect.RollingArchive().finish(util.collected_dir / 'x.zip'))
+
+
+class TestAppendPull(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+        make_files()
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+        util.settings = {}
+
+    def test_incremental(self):
+        util.settings[('collect', 'incremental', True)] = True
+
+        self.assertTrue(collect.append_pull(util.new_data_dir / 'dir1'))
+
+        self.assertFalse((util.new_data_dir / 'dir1').exists())
+        self.assertTrue((util.new_data_dir / 'dir2').exists())
+        self.assertEqual(['dir1.zip'], os.listdir(str(util.tmp_dir / 'NewData.parts')))
+
+    def test_not_incremental(self):
+        util.settings[('collect', 'incremental', True)] = False
+
+        self.assertFalse(collect.append_pull(util.new_data_dir / 'dir1'))
+
+        self.assertTrue((util.new_data_dir / 'dir1').exists())
+        self.assertFalse((util.tmp_dir / 'NewData.parts').exists())
+
+    def test_no_pull_dir(self):
+        util.settings[('collect', 'incremental', True)] = True
+
+        self.assertFalse(collect.append_pull(util.new_data_dir / 'dir9'))
+
+
+class TestLinkOrCopy(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+        util.archive_dir.mkdir(parents=True)
+        util.collected_dir.mkdir(parents=True)
+        self.path = util.collected_dir / 'a.zip'
+        self.path.write_text('zip')
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_link(self):
+        target_path = collect.Collector.link_or_copy(self.path, util.archive_dir)
+        self.assertTrue(os.path.samefile(str(self.path), str(target_path)))
+
+    def test_copy(self):
+        with patch('os.link', side_effect=OSError('cross-device link')):
+            target_path = collect.Collector.link_or_copy(self.path, util.archive_dir)
+        self.assertFalse(os.path.samefile(str(self.path), str(target_path)))
+        self.assertEqual('zip', target_path.read_text())
+
+
+class TestParallelZipData(unittest.TestCase):
+    def setUp(self):
+        self.collector = collect.Collector()
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test(self):
+        make_files()
+        util.collected_dir.mkdir(parents=True)
+
+        settings = {'compression_workers': '2', 'compression_level': '1'}
+        with patch.object(util, 'get_setting', side_effect=get_collect_setting(settings)):
+            archive_path = self.collector.zip_data()
+
+        self.assertTrue(re.fullmatch(r'\d\d-\d\d-\d\dT\d\d-\d\d-\d\d_NewData\.zip', archive_path.name))
+        with zipfile.ZipFile(str(archive_path)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual({'dir1/', 'dir1/file.txt', 'dir2/', 'dir2/file.txt', 'dir3/', 'dir3/file.txt',
+                              'file.txt'}, set(archive.namelist()))
@@ -184,6 +184,56 @@ class TestGet(unittest.TestCase):
         self.assertEqual('test_value', self.conf_manager.get('test_file', 'test_stanza', 'test_setting'))
 
 
+    def test_fallback_no_file(self):
+        self.assertEqual('derp', self.conf_manager.get('test_file', 'test_stanza', 'test_setting', fallback='derp'))
+
+    def test_fallback_no_setting_in_stanza_in_file(self):
+        config = configparser.ConfigParser()
+        config['test_stanza'] = {}
+
+        self.conf_manager.configs['test_file'] = config
+
+        self.assertIsNone(self.conf_manager.get('test_file', 'test_stanza', 'test_setting', fallback=None))
+
+    def test_fallback_setting_exists(self):
+        config = configparser.ConfigParser()
+        config['test_stanza'] = {'test_setting': 'test_value'}
+
+        self.conf_manager.configs['test_file'] = config
+
+        self.assertEqual('test_value', self.conf_manager.get('test_file', 'test_stanza', 'test_setting', fallback='derp'))
+
+
+class TestGetBoolean(unittest.TestCase):
+    def setUp(self):
+        util.etc_dir.mkdir()
+        self.conf_manager = ConfManager(util.etc_dir)
+
+        config = configparser.ConfigParser()
+        config['test_stanza'] = {'yes_setting': 'yes', 'false_setting': 'False', 'bad_setting': 'derp'}
+
+        self.conf_manager.configs['test_file'] = config
+
+    def tearDown(self):
+        util.rmtree(util.etc_dir)
+
+    def test_true(self):
+        self.assertTrue(self.conf_manager.get_boolean('test_file', 'test_stanza', 'yes_setting'))
+
+    def test_false(self):
+        self.assertFalse(self.conf_manager.get_boolean('test_file', 'test_stanza', 'false_setting'))
+
+    def test_invalid(self):
+        with self.assertRaises(Exception):
+            self.conf_manager.get_boolean('test_file', 'test_stanza', 'bad_setting')
+
+    def test_fallback(self):
+        self.assertTrue(self.conf_manager.get_boolean('test_file', 'test_stanza', 'no_setting', fallback=True))
+
+    def test_no_fallback(self):
+        with self.assertRaises(Exception):
+            self.conf_manager.get_boolean('test_file', 'test_stanza', 'no_setting')
+
 class TestSet(unittest.TestCase):
     def setUp(self):
         util.etc_dir.mkdir()
@@ -59,6 +59,7 @@ if __name__ == '__main__':
 class TestMain(unittest.TestCase):
     def setUp(self):
         self.exporter = export.JenkinsExporter()
+        util.settings[('collect', 'incremental', True)] = False
 
         util.rmtree(util.data_dir, no_exist_ok=True)
 
@@ -69,6 +70,7 @@ class TestMain(unittest.TestCase):
             util.metadata_file.unlink()
 
     def tearDown(self):
+        util.settings = {}
         util.rmtree(util.data_dir, no_exist_ok=True)
         util.rmtree(util.etc_dir, no_exist_ok=True)
 
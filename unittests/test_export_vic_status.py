@@ -57,8 +57,10 @@ VicStatusPlugin
 class TestVicStatusPluginMain(unittest.TestCase):
     def setUp(self):
         self.plugin = export.VicStatusPlugin()
+        util.settings[('collect', 'incremental', True)] = False
 
     def tearDown(self):
+        util.settings = {}
         util.rmtree(util.data_dir, no_exist_ok=True)
 
     @patch('pivt.export_vic_status.VicStatusPlugin.write')
@@ -75,6 +77,18 @@ class TestVicStatusPluginMain(unittest.TestCase):
         self.assertTrue(self.plugin.data_dir.exists())
         mock_write.assert_called_once_with('parsed')
 
+    @patch('pivt.export_vic_status.append_pull')
+    @patch('pivt.export_vic_status.VicStatusParser.parse')
+    @patch('pivt.export_vic_status.VicStatusSensor.get_data')
+    def test_append_pull(self, mock_get_data, mock_parse, mock_append_pull):
+        mock_get_data.return_value = 'raw'
+        mock_parse.return_value = {'derp': 'herp'}
+
+        self.plugin.main()
+
+        mock_append_pull.assert_called_once_with(self.plugin.pull_dir)
+        self.assertTrue((self.plugin.pull_dir / 'vic_status' / 'vic_status.json').exists())
+
 class TestVicStatusPluginWrite(unittest.TestCase):
     def setUp(self):
         self.plugin = export.VicStatusPlugin()
@@ -0,0 +1,695 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pivt.pipeline import pipe_core as pc
+from pivt.pipeline import export_vic_status
+import unittest
+import tempfile
+import shutil
+import json
+import time
+import threading
+import http.server
+from pathlib import Path
+from collections import abc
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def double(data, context=None):
+    return data * 2
+
+
+def negate(data, context=None):
+    return -data
+
+
+def make_pipeline(*stages):
+    pipeline = pc.Pipeline(pc.Context())
+    pipeline.connect_transforms(list(stages))
+    return pipeline
+
+
+class TestReaders(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.path = self.tmp_dir / 'in.txt'
+        self.path.write_text('one\ntwo\r\n\nthree')
+
+    def tearDown(self):
+        shutil.rmtree(str(self.tmp_dir))
+
+    def test_file_line_reader(self):
+        reader, context = pc.create_file_line_reader(path=self.path, context=pc.Context())
+        self.assertEqual(['one', 'two', '', 'three'], list(reader(None, context)))
+
+    def test_file_line_reader_binary(self):
+        reader, context = pc.create_file_line_reader(path=self.path, mode='rb', context=pc.Context())
+        self.assertEqual([b'one', b'two', b'', b'three'], list(reader(None, context)))
+
+    def test_file_chunk_reader(self):
+        reader, context = pc.create_file_chunk_reader(path=self.path, chunk_size=4, context=pc.Context())
+        chunks = list(reader(None, context))
+        self.assertTrue(all(len(chunk) <= 4 for chunk in chunks))
+        self.assertEqual(self.path.read_text(), ''.join(chunks))
+
+    def test_reader_is_lazy(self):
+        reader, context = pc.create_file_line_reader(path=self.tmp_dir / 'missing.txt', context=pc.Context())
+        lines = reader(None, context)
+        with self.assertRaises(FileNotFoundError):
+            next(lines)
+
+
+class TestIterJsonArray(unittest.TestCase):
+    def setUp(self):
+        self.items = [1, -2.5e3, 'a, ]"b', {'x': [1, {'y': None}]}, [], True, False, None, 12345678]
+        self.text = ' [ ' + ', '.join(json.dumps(item) for item in self.items) + ' ]\n'
+
+    def test_every_chunk_size(self):
+        for size in range(1, len(self.text) + 1):
+            self.assertEqual(self.items, list(pc.iter_json_array(chunked(self.text, size))), size)
+
+    def test_string(self):
+        self.assertEqual(self.items, list(pc.iter_json_array(self.text)))
+
+    def test_empty(self):
+        self.assertEqual([], list(pc.iter_json_array(['[', ' ', ']'])))
+
+    def test_trailing_number(self):
+        self.assertEqual([123], list(pc.iter_json_array(['[1', '2', '3]'])))
+
+    def test_not_array(self):
+        with self.assertRaises(ValueError):
+            list(pc.iter_json_array('{"a": 1}'))
+
+    def test_unterminated(self):
+        with self.assertRaises(ValueError):
+            list(pc.iter_json_array(['[1, 2', ', 3']))
+
+    def test_missing_separator(self):
+        with self.assertRaises(ValueError):
+            list(pc.iter_json_array('[1 2]'))
+
+    def test_extra_data(self):
+        with self.assertRaises(ValueError):
+            list(pc.iter_json_array('[1] 2'))
+
+    def test_malformed_item(self):
+        with self.assertRaises(ValueError):
+            list(pc.iter_json_array('[1, tru]'))
+
+
+class TestSerializers(unittest.TestCase):
+    def test_json_array_round_trip(self):
+        items = [{'a': 1}, 'b', [2, 3]]
+        serializer, context = pc.create_json_array_serializer(context=pc.Context())
+        self.assertEqual(items, json.loads(''.join(serializer(iter(items), context))))
+
+    def test_json_array_empty(self):
+        serializer, context = pc.create_json_array_serializer(newline=True, context=pc.Context())
+        self.assertEqual('[]\n', ''.join(serializer(iter([]), context)))
+
+    def test_json_lines_round_trip(self):
+        items = [{'a': 1}, 'b', [2, 3]]
+        serializer, context = pc.create_json_lines_serializer(context=pc.Context())
+        parser, context = pc.create_json_lines_parser(context)
+        self.assertEqual(items, list(parser(serializer(items, context), context)))
+
+
+class TestStreamingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(str(self.tmp_dir))
+
+    def test_run_returns_count(self):
+        pipeline = pc.Pipeline(pc.Context(), streaming=True)
+        pipeline.connect_transforms([
+            lambda data, context: iter(data),
+            pc.streaming_version(lambda record: record * 2)
+        ])
+        self.assertEqual(3, pipeline.run([1, 2, 3]))
+
+    def test_run_not_streaming(self):
+        pipeline = pc.Pipeline(pc.Context())
+        pipeline.connect_transform(pc.streaming_version(lambda record: record * 2))
+        self.assertEqual([2, 4], list(pipeline.run([1, 2])))
+
+    def test_records_flow_one_at_a_time(self):
+        seen = []
+
+        def source(data, context):
+            for i in range(3):
+                seen.append(('read', i))
+                yield i
+
+        def sink(records, context):
+            for record in records:
+                seen.append(('write', record))
+                yield record
+
+        pipeline = pc.Pipeline(pc.Context(), streaming=True)
+        pipeline.connect_transforms([source, sink])
+        pipeline.run()
+
+        self.assertEqual([('read', 0), ('write', 0), ('read', 1), ('write', 1), ('read', 2), ('write', 2)], seen)
+
+    def test_errors_propagate(self):
+        def fail(record):
+            raise ValueError('bad record')
+
+        pipeline = pc.Pipeline(pc.Context(), streaming=True)
+        pipeline.connect_transforms([lambda data, context: iter(data), pc.streaming_version(fail)])
+        with self.assertRaises(ValueError):
+            pipeline.run([1])
+
+    def test_file_writer_writes_records(self):
+        path = self.tmp_dir / 'out.txt'
+        context = pc.Context()
+        writer, context = pc.create_file_writer(path=path, mode='w', newline=True, context=context)
+
+        pipeline = pc.Pipeline(context, streaming=True)
+        pipeline.connect_transforms([lambda data, context: iter(data), writer])
+
+        self.assertEqual(2, pipeline.run(['a', 'b']))
+        self.assertEqual('a\nb\n', path.read_text())
+
+    def test_file_writer_single_value(self):
+        path = self.tmp_dir / 'out.txt'
+        writer, context = pc.create_file_writer(path=path, mode='w', newline=True, context=pc.Context())
+        writer('abc', context)
+        self.assertEqual('abc\n', path.read_text())
+
+    def test_vic_status_pipeline(self):
+        items = [{'name': 'vic{}'.format(i), 'status': 'up'} for i in range(100)]
+        source = self.tmp_dir / 'in.json'
+        source.write_text(json.dumps(items))
+
+        json_path = self.tmp_dir / 'metrics.json'
+        pipeline = export_vic_status.create_vic_status_pipeline(source, self.tmp_dir / 'out',
+                                                                [pc.JsonMetricsHook(json_path)],
+                                                                cache_dir=self.tmp_dir / 'cache')
+        pipeline.run()
+
+        with json_path.open() as fd:
+            stages = json.load(fd)['stages']
+        self.assertEqual(len(items), stages['2:caching_stage']['output_size'])
+        self.assertEqual(len(items), stages['3:batching_stage']['output_size'])
+
+        paths = list((self.tmp_dir / 'out').glob('*/vic_status/vic_status.json'))
+        self.assertEqual(1, len(paths))
+
+        output = json.loads(paths[0].read_text())
+        self.assertEqual(len(items), len(output))
+        for item, out in zip(items, output):
+            timestamp = out.pop('timestamp')
+            self.assertIsInstance(timestamp, float)
+            self.assertEqual(item, out)
+
+        pipeline = export_vic_status.create_vic_status_pipeline(source, self.tmp_dir / 'out2',
+                                                                cache_dir=self.tmp_dir / 'cache')
+        pipeline.run()
+        self.assertEqual({'hits': 1, 'misses': 0}, pipeline.context.data['cache_stats'][1])
+
+
+class TestJunctions(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_branch_junction(self):
+        for executor in [None, self.executor]:
+            pipeline = pc.Pipeline(pc.Context())
+            pipeline.connect_branch_junction(
+                [lambda data: data > 0, lambda data: data > 10, lambda data: True],
+                [make_pipeline(double), make_pipeline(negate), make_pipeline(negate, double)],
+                executor=executor
+            )
+            self.assertEqual([6, False, -6], pipeline.run(3))
+
+    def test_branch_junction_runs_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def wait(data, context):
+            barrier.wait()
+            return data
+
+        pipeline = pc.Pipeline(pc.Context())
+        pipeline.connect_branch_junction([lambda data: True] * 3, [make_pipeline(wait) for _ in range(3)],
+                                         executor=self.executor)
+        self.assertEqual([1, 1, 1], pipeline.run(1))
+
+    def test_branch_junction_stream(self):
+        pipeline = pc.Pipeline(pc.Context())
+        pipeline.connect_transform(lambda data, context: iter(data))
+        pipelines = [make_pipeline(lambda data, context: sum(data)), make_pipeline(lambda data, context: len(data))]
+        pipeline.connect_branch_junction([lambda data: True] * 2, pipelines, executor=self.executor)
+        self.assertEqual([6, 3], pipeline.run([1, 2, 3]))
+
+    def test_branch_junction_process_pool(self):
+        with ProcessPoolExecutor(2) as executor:
+            pipeline = pc.Pipeline(pc.Context())
+            pipeline.connect_branch_junction([bool, bool], [make_pipeline(double), make_pipeline(negate)],
+                                             executor=executor)
+            self.assertEqual([4, -2], pipeline.run(2))
+
+    def test_select_junction(self):
+        for executor in [None, self.executor]:
+            pipeline = pc.Pipeline(pc.Context())
+            pipeline.connect_select_junction(
+                [lambda data: data > 10, lambda data: data > 0, lambda data: True],
+                [make_pipeline(negate), make_pipeline(double), make_pipeline(negate)],
+                executor=executor
+            )
+            self.assertEqual(6, pipeline.run(3))
+            self.assertEqual(-20, pipeline.run(20))
+            self.assertEqual(1, pipeline.run(-1))
+
+    def test_select_junction_no_match(self):
+        pipeline = pc.Pipeline(pc.Context())
+        pipeline.connect_select_junction([lambda data: False], [make_pipeline(double)])
+        self.assertFalse(pipeline.run(3))
+
+    def test_binary_junction(self):
+        for executor in [None, self.executor]:
+            pipeline = pc.Pipeline(pc.Context())
+            pipeline.connect_binary_junction(lambda data: data > 0, make_pipeline(double), make_pipeline(negate),
+                                             executor=executor)
+            self.assertEqual(6, pipeline.run(3))
+            self.assertEqual(3, pipeline.run(-3))
+
+    def test_parallel_version(self):
+        def slow_double(record):
+            time.sleep(0.001 * (record % 3))
+            return record * 2
+
+        pipeline = pc.Pipeline(pc.Context(), streaming=True)
+        pipeline.connect_transforms([
+            lambda data, context: iter(data),
+            pc.parallel_version(slow_double, self.executor, max_pending=4)
+        ])
+        records = list(pipeline.stages[1](pipeline.stages[0](range(20), None), None))
+        self.assertEqual([record * 2 for record in range(20)], records)
+        self.assertEqual(20, pipeline.run(range(20)))
+
+
+class TestBatching(unittest.TestCase):
+    def test_batched(self):
+        self.assertEqual([[0, 1, 2], [3, 4, 5], [6]], list(pc.batched(range(7), 3)))
+        self.assertEqual([], list(pc.batched([], 3)))
+
+    def test_batched_invalid_size(self):
+        with self.assertRaises(ValueError):
+            list(pc.batched(range(3), 0))
+
+    def test_batched_max_latency(self):
+        def slow_records():
+            for i in range(4):
+                time.sleep(0.02)
+                yield i
+
+        batches = list(pc.batched(slow_records(), 100, max_latency=0.01))
+        self.assertEqual([[0, 1], [2, 3]], batches)
+
+    def test_batching_stage(self):
+        calls = []
+
+        def stage(batch, context):
+            calls.append(list(batch))
+            return [record * 2 for record in batch]
+
+        stage, context = pc.create_batching_stage(stage, batch_size=4, context=pc.Context())
+        self.assertEqual([record * 2 for record in range(10)], list(stage(iter(range(10)), context)))
+        self.assertEqual([[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]], calls)
+
+        stats = context.data['batch_stats'][0]
+        self.assertEqual(3, stats['batches'])
+        self.assertEqual(10, stats['records'])
+        self.assertGreaterEqual(stats['seconds'], stats['max_seconds'])
+
+    def test_batching_stage_no_unbatch(self):
+        stage, context = pc.create_batching_stage(lambda batch, context: len(batch), batch_size=4, unbatch=False,
+                                                  context=pc.Context())
+        self.assertEqual([4, 4, 2], list(stage(range(10), context)))
+
+    def test_batching_stage_in_pipeline(self):
+        context = pc.Context()
+        stage, context = pc.create_batching_stage(lambda batch, context: batch, batch_size=3, context=context)
+        pipeline = pc.Pipeline(context, streaming=True)
+        pipeline.connect_transforms([lambda data, context: iter(data), stage])
+        self.assertEqual(7, pipeline.run(range(7)))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(str(self.tmp_dir))
+
+    def test_disabled(self):
+        context = pc.Context()
+        pipeline = pc.Pipeline(context)
+        pipeline.connect_transform(double)
+        self.assertEqual(4, pipeline.run(2))
+        self.assertIsNone(context.metrics)
+
+    def test_stage_metrics(self):
+        def split(data, context):
+            return data.split()
+
+        def fail(data, context):
+            raise ValueError('bad data')
+
+        context = pc.Context(metrics=True)
+        pipeline = pc.Pipeline(context)
+        pipeline.connect_transforms([split, fail, double])
+
+        self.assertEqual(['a', 'b', 'a', 'b'], pipeline.run('a b'))
+        pipeline.run('c d')
+
+        self.assertEqual(['0:split', '1:fail', '2:double'], list(context.metrics))
+
+        metrics = context.metrics['0:split']
+        self.assertEqual(2, metrics['calls'])
+        self.assertEqual(6, metrics['input_size'])
+        self.assertEqual(4, metrics['output_size'])
+        self.assertEqual(0, metrics['errors'])
+
+        metrics = context.metrics['1:fail']
+        self.assertEqual(2, metrics['errors'])
+        self.assertEqual("ValueError('bad data')", metrics['last_error'])
+
+    def test_streaming_metrics(self):
+        def source(data, context):
+            for i in range(5):
+                time.sleep(0.01)
+                yield i
+
+        def evens(records, context):
+            for record in records:
+                if record % 2 == 0:
+                    yield record
+
+        context = pc.Context(metrics=True)
+        pipeline = pc.Pipeline(context, streaming=True)
+        pipeline.connect_transforms([source, evens])
+        self.assertEqual(3, pipeline.run())
+
+        source_metrics = context.metrics['0:source']
+        evens_metrics = context.metrics['1:evens']
+        self.assertEqual(5, source_metrics['output_size'])
+        self.assertEqual(5, evens_metrics['input_size'])
+        self.assertEqual(3, evens_metrics['output_size'])
+
+        # the time source spends producing records is not charged to evens
+        self.assertGreaterEqual(source_metrics['seconds'], 0.05)
+        self.assertLess(evens_metrics['seconds'], 0.04)
+
+    def test_hooks(self):
+        class RecordingHook(pc.MetricsHook):
+            def __init__(self):
+                self.errors = []
+                self.runs = []
+
+            def stage_error(self, stage_name, error):
+                self.errors.append(stage_name)
+
+            def run_finished(self, metrics, seconds):
+                self.runs.append(dict(metrics))
+
+        def fail(record):
+            raise KeyError(record)
+
+        hook = RecordingHook()
+        json_path = self.tmp_dir / 'metrics.json'
+        context = pc.Context()
+        context.add_metrics_hook(hook).add_metrics_hook(pc.JsonMetricsHook(json_path))
+
+        pipeline = pc.Pipeline(context, streaming=True)
+        pipeline.connect_transforms([lambda data, context: iter(data), pc.streaming_version(fail)])
+        with self.assertRaises(KeyError):
+            pipeline.run([1])
+
+        self.assertEqual(['1:apply_func_to_stream'], hook.errors)
+        self.assertEqual(1, len(hook.runs))
+
+        with json_path.open() as fd:
+            report = json.load(fd)
+        self.assertEqual(1, report['stages']['1:apply_func_to_stream']['errors'])
+        self.assertEqual(1, report['stages']['0:<lambda>']['output_size'])
+
+    def test_logging_hook(self):
+        context = pc.Context()
+        context.add_metrics_hook(pc.LoggingMetricsHook())
+        pipeline = pc.Pipeline(context)
+        pipeline.connect_transform(double)
+
+        with self.assertLogs('pivt.pipeline.pipe_core', level='INFO') as logs:
+            pipeline.run(2)
+        self.assertIn('0:double: 1 calls', logs.output[-1])
+
+
+class TestBufferedFileWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.path = self.tmp_dir / 'out.txt'
+
+    def tearDown(self):
+        shutil.rmtree(str(self.tmp_dir))
+
+    def test_persistent_handle(self):
+        context = pc.Context()
+        writer, context = pc.create_buffered_file_writer(path=self.path, newline=True, context=context)
+        pipeline = pc.Pipeline(context, streaming=True)
+        pipeline.connect_transforms([lambda data, context: iter(data), writer])
+
+        with pipeline:
+            resource = context.resources[0]
+            fd = resource.fd
+            self.assertEqual(2, pipeline.run(['a', 'b']))
+            self.assertEqual(1, pipeline.run(['c']))
+            self.assertIs(fd, resource.fd)
+
+        self.assertIsNone(resource.fd)
+        self.assertEqual('a\nb\nc\n', self.path.read_text())
+
+    def test_pass_through(self):
+        context = pc.Context()
+        writer, context = pc.create_buffered_file_writer(path=self.path, context=context)
+        pipeline = pc.Pipeline(context)
+        pipeline.connect_transforms([writer, lambda data, context: data.upper()])
+
+        with pipeline:
+            self.assertEqual('ABC', pipeline.run('abc'))
+        self.assertEqual('abc', self.path.read_text())
+
+    def test_writes_records_eagerly(self):
+        context = pc.Context()
+        writer, context = pc.create_buffered_file_writer(path=self.path, newline=True, context=context)
+        pipeline = pc.Pipeline(context)
+        pipeline.connect_transforms([writer])
+
+        with pipeline:
+            self.assertEqual(['a', 'b'], pipeline.run(['a', 'b']))
+        self.assertEqual('a\nb\n', self.path.read_text())
+
+    def test_opens_lazily(self):
+        writer, context = pc.create_buffered_file_writer(path=self.path, mode='wb', context=pc.Context())
+        self.assertFalse(self.path.exists())
+
+        writer(b'abc', context)
+        context.resources[0].close()
+        self.assertEqual(b'abc', self.path.read_bytes())
+
+    def test_rotation(self):
+        resource = pc.FileWriterResource(self.path, newline=True, max_bytes=8, backup_count=2)
+        for record in ['aaa', 'bbb', 'ccc', 'ddd', 'eee', 'fff', 'ggg']:
+            resource.write(record)
+        resource.close()
+
+        self.assertEqual('ggg\n', self.path.read_text())
+        self.assertEqual('eee\nfff\n', (self.tmp_dir / 'out.txt.1').read_text())
+        self.assertEqual('ccc\nddd\n', (self.tmp_dir / 'out.txt.2').read_text())
+        self.assertFalse((self.tmp_dir / 'out.txt.3').exists())
+
+    def test_rotation_appends_to_existing(self):
+        self.path.write_text('0123456\n')
+        resource = pc.FileWriterResource(self.path, newline=True, max_bytes=10)
+        resource.write('abc')
+        resource.close()
+
+        self.assertEqual('abc\n', self.path.read_text())
+        self.assertEqual('0123456\n', (self.tmp_dir / 'out.txt.1').read_text())
+
+    def test_setup_and_teardown_hooks(self):
+        calls = []
+        context = pc.Context()
+        pipeline = pc.Pipeline(context)
+        pipeline.add_setup_hook(lambda context: calls.append('setup'))
+        pipeline.add_teardown_hook(lambda context: calls.append('first'))
+        pipeline.add_teardown_hook(lambda context: calls.append('second'))
+
+        with pipeline:
+            calls.append('run')
+        self.assertEqual(['setup', 'run', 'second', 'first'], calls)
+
+    def test_teardown_runs_every_hook(self):
+        calls = []
+
+        def fail(context):
+            raise OSError('disk full')
+
+        pipeline = pc.Pipeline(pc.Context())
+        pipeline.add_teardown_hook(lambda context: calls.append('first'))
+        pipeline.add_teardown_hook(fail)
+
+        with self.assertRaises(OSError):
+            pipeline.teardown()
+        self.assertEqual(['first'], calls)
+
+
+class TestCaching(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.cache = pc.StageCache(self.tmp_dir / 'cache')
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(str(self.tmp_dir))
+
+    def parse(self, data, context):
+        self.calls.append(data)
+        return json.loads(data)
+
+    def test_caching_stage(self):
+        stage, context = pc.create_caching_stage(self.parse, self.cache, context=pc.Context())
+
+        self.assertEqual([1, 2], stage('[1, 2]', context))
+        self.assertEqual([1, 2], stage('[1, 2]', context))
+        self.assertEqual([3], stage('[3]', context))
+
+        self.assertEqual(['[1, 2]', '[3]'], self.calls)
+        self.assertEqual({'hits': 1, 'misses': 2}, context.data['cache_stats'][0])
+
+    def test_persists(self):
+        stage, context = pc.create_caching_stage(self.parse, self.cache, context=pc.Context())
+        stage('[1, 2]', context)
+
+        cache = pc.StageCache(self.tmp_dir / 'cache')
+        stage, context = pc.create_caching_stage(self.parse, cache, context=pc.Context())
+        self.assertEqual([1, 2], stage('[1, 2]', context))
+        self.assertEqual(1, len(self.calls))
+
+    def test_namespaces(self):
+        first, context = pc.create_caching_stage(self.parse, self.cache, namespace='first', context=pc.Context())
+        second, context = pc.create_caching_stage(self.parse, self.cache, namespace='second', context=context)
+        first('[1]', context)
+        second('[1]', context)
+        self.assertEqual(2, len(self.calls))
+
+    def test_streams(self):
+        stage, context = pc.create_caching_stage(pc.create_json_array_parser(pc.Context())[0], self.cache,
+                                                 context=pc.Context())
+        for _ in range(2):
+            output = stage(iter(['[1, ', '2]']), context)
+            self.assertIsInstance(output, abc.Iterator)
+            self.assertEqual([1, 2], list(output))
+        self.assertEqual({'hits': 1, 'misses': 1}, context.data['cache_stats'][0])
+
+    def test_streams_records(self):
+        inputs = []
+
+        def double(records, context):
+            inputs.append(records)
+            return (record * 2 for record in records)
+
+        stage, context = pc.create_caching_stage(double, self.cache, context=pc.Context())
+
+        output = stage(iter([1, 2, 3]), context)
+        self.assertIsInstance(inputs[0], abc.Iterator)
+        self.assertEqual(2, next(output))
+        output.close()
+        self.assertEqual([], list((self.tmp_dir / 'cache').glob('*')))
+
+        for _ in range(2):
+            self.assertEqual([2, 4, 6], list(stage(iter([1, 2, 3]), context)))
+        self.assertEqual([6], list(stage(iter([3]), context)))
+
+        self.assertEqual(3, len(inputs))
+        self.assertEqual({'hits': 1, 'misses': 3}, context.data['cache_stats'][0])
+
+    def test_eviction(self):
+        cache = pc.StageCache(self.tmp_dir / 'small', max_bytes=2500)
+        keys = [cache.make_key('test', i) for i in range(3)]
+
+        cache.put(keys[0], b'0' * 1000)
+        time.sleep(0.01)
+        cache.put(keys[1], b'1' * 1000)
+        time.sleep(0.01)
+        self.assertTrue(cache.get(keys[0])[0])
+        cache.put(keys[2], b'2' * 1000)
+
+        self.assertTrue(cache.get(keys[0])[0])
+        self.assertFalse(cache.get(keys[1])[0])
+        self.assertTrue(cache.get(keys[2])[0])
+        self.assertLessEqual(cache.total_bytes, 2500)
+
+    def test_cached_url_reader(self):
+        requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append(self.headers.get('If-None-Match'))
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = b'[1, 2]'
+                self.send_response(200)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{}/status'.format(server.server_address[1])
+            reader, context = pc.create_cached_url_reader(url, self.cache, context=pc.Context())
+            self.assertEqual(b'[1, 2]', reader(None, context))
+            self.assertEqual(b'[1, 2]', reader(None, context))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.assertEqual([None, '"v1"'], requests)
+        self.assertEqual({'hits': 1, 'misses': 1}, context.data['cache_stats'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
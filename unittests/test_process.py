@@ -86,6 +86,13 @@ def find_file(filename):
     return ''
 
 
+def assert_key_set_equal(test_case, expected_keys, key_set):
+    """Asserts that a CompactKeySet or set holds exactly the expected keys."""
+    test_case.assertEqual(len(expected_keys), len(key_set))
+    for key in expected_keys:
+        test_case.assertIn(key, key_set)
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -109,6 +116,26 @@ class TestParseArgs(unittest.TestCase):
         args = self.processor.parse_args(['--reverse'])
         self.assertTrue(args.reverse)
 
+    def test_profile(self):
+        self.assertIsNone(self.processor.parse_args([]).profile)
+        self.assertEqual('spans', self.processor.parse_args(['--profile']).profile)
+        self.assertEqual('cprofile', self.processor.parse_args(['--profile', 'cprofile']).profile)
+
+
+class TestProcessorLogMemoryUsage(unittest.TestCase):
+    def test(self):
+        processor = process.Processor([])
+        processor.sources['jenkins'].event_keys['f1.json'] = {
+            'existing': process.make_key_set(['k1', 'k2']),
+            'new': process.make_key_set()
+        }
+
+        with self.assertLogs('Processor', 'INFO') as logger:
+            processor._log_memory_usage()
+
+        self.assertEqual(len(processor.sources) + 1, len(logger.output))
+        self.assertIn('jenkins    keys: 2, memory: ', logger.output[1])
+
 
 class TestProcessorDeleteIndex(unittest.TestCase):
     @patch('time.sleep')
@@ -144,6 +171,299 @@ class TestProcessorGetAppPath(unittest.TestCase):
         assert process.Processor._get_app_path('pivt') == '/servicesNS/nobody/pivt'
 
 
+"""
+CompactKeySet
+"""
+class TestCompactKeySet(unittest.TestCase):
+    def test_empty(self):
+        key_set = process.CompactKeySet()
+
+        self.assertEqual(0, len(key_set))
+        self.assertNotIn('ci1:Build:1:100', key_set)
+
+    def test_initial_keys(self):
+        key_set = process.CompactKeySet(['ci1:Build:1:100', 'ci1:Build:2:200', 'ci1:Build:1:100'])
+
+        self.assertEqual(2, len(key_set))
+        self.assertIn('ci1:Build:1:100', key_set)
+        self.assertIn('ci1:Build:2:200', key_set)
+        self.assertNotIn('ci1:Build:3:300', key_set)
+
+    def test_add(self):
+        key_set = process.CompactKeySet(['ci1:Build:1:100'])
+        key_set.add('ci1:Build:2:200')
+        key_set.add('ci1:Build:2:200')
+
+        self.assertEqual(2, len(key_set))
+        self.assertIn('ci1:Build:1:100', key_set)
+        self.assertIn('ci1:Build:2:200', key_set)
+
+    @patch('builtins.hash', return_value=7)
+    def test_added_collision(self, mock_hash):
+        key_set = process.CompactKeySet()
+        key_set.add('key1')
+
+        self.assertIn('key1', key_set)
+        self.assertNotIn('key2', key_set)
+
+        key_set.add('key2')
+
+        self.assertIn('key2', key_set)
+        self.assertEqual(2, len(key_set))
+
+    def test_from_db_file(self):
+        util.data_dir.mkdir(parents=True, exist_ok=True)
+        self.addCleanup(util.rmtree, util.data_dir, no_exist_ok=True)
+        db_file = util.data_dir / 'keys.json'
+        db_file.write_text('ci1:Build:1:100\nci1:Build:2:200\nci1:Build:1:100\n')
+
+        key_set = process.CompactKeySet.from_db_file(db_file, str.strip)
+
+        self.assertEqual(2, len(key_set))
+        self.assertIn('ci1:Build:1:100', key_set)
+        self.assertIn('ci1:Build:2:200', key_set)
+        self.assertNotIn('ci1:Build:3:300', key_set)
+
+    @patch('builtins.hash', return_value=7)
+    def test_db_file_collision(self, mock_hash):
+        util.data_dir.mkdir(parents=True, exist_ok=True)
+        self.addCleanup(util.rmtree, util.data_dir, no_exist_ok=True)
+        db_file = util.data_dir / 'keys.json'
+        db_file.write_text('key1\nkey2\n')
+
+        key_set = process.CompactKeySet.from_db_file(db_file, str.strip)
+
+        self.assertIn('key1', key_set)
+        self.assertIn('key2', key_set)
+
+        with self.assertLogs('CompactKeySet', 'WARNING'):
+            self.assertNotIn('key3', key_set)
+
+        self.assertEqual(1, key_set.stats['false_hits'])
+
+        key_set.add('key3')
+
+        self.assertIn('key3', key_set)
+
+    @patch('builtins.hash', return_value=7)
+    def test_unconfirmed_hit(self, mock_hash):
+        key_set = process.CompactKeySet(['key1'])
+
+        self.assertIn('key2', key_set)
+        self.assertEqual(1, key_set.stats['unconfirmed'])
+
+    def test_memory_usage(self):
+        keys = ['ci1:Build:{0}:{1}'.format(i, i * 1000) for i in range(1000)]
+
+        compact_usage = process.CompactKeySet(keys).get_memory_usage()
+        set_usage = process.get_key_set_memory_usage(set(keys))
+
+        self.assertLess(compact_usage, set_usage)
+
+
+class TestMakeKeySet(unittest.TestCase):
+    def tearDown(self):
+        util.settings = {}
+
+    def test_default(self):
+        self.assertIsInstance(process.make_key_set(['key']), process.CompactKeySet)
+
+    def test_exact(self):
+        util.settings[('process', 'compact_keys', True)] = False
+
+        self.assertEqual({'key'}, process.make_key_set(['key']))
+
+
+class TestLoadKeySet(unittest.TestCase):
+    def setUp(self):
+        util.data_dir.mkdir(parents=True, exist_ok=True)
+        self.db_file = util.data_dir / 'keys.json'
+        self.db_file.write_text('key1\nkey2\n')
+
+    def tearDown(self):
+        util.settings = {}
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_default(self):
+        key_set = process.load_key_set(self.db_file, str.strip)
+
+        self.assertIsInstance(key_set, process.CompactKeySet)
+        assert_key_set_equal(self, ['key1', 'key2'], key_set)
+
+    def test_exact(self):
+        util.settings[('process', 'compact_keys', True)] = False
+
+        self.assertEqual({'key1', 'key2'}, process.load_key_set(self.db_file, str.strip))
+
+
+class TestBloomFilter(unittest.TestCase):
+    def setUp(self):
+        self.bloom = process.BloomFilter(1000, 0.01)
+        self.path = util.data_dir / 'test.bloom'
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_contains(self):
+        keys = ['key{0}'.format(i) for i in range(1000)]
+        for key in keys:
+            self.bloom.add(key)
+
+        self.assertEqual(1000, self.bloom.count)
+        for key in keys:
+            self.assertIn(key, self.bloom)
+
+        false_positives = sum('other{0}'.format(i) in self.bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_save_load(self):
+        self.bloom.add('key1')
+        util.data_dir.mkdir(parents=True, exist_ok=True)
+        self.bloom.save(self.path, 123)
+
+        bloom, indexed_size = process.BloomFilter.load(self.path)
+
+        self.assertEqual(123, indexed_size)
+        self.assertEqual(self.bloom.num_bits, bloom.num_bits)
+        self.assertEqual(self.bloom.num_hashes, bloom.num_hashes)
+        self.assertEqual(1, bloom.count)
+        self.assertIn('key1', bloom)
+
+    def test_load_truncated(self):
+        util.data_dir.mkdir(parents=True, exist_ok=True)
+        self.bloom.save(self.path, 0)
+        with self.path.open('r+b') as file:
+            file.truncate(process.BloomFilter.HEADER.size + 1)
+
+        with self.assertRaises(ValueError):
+            process.BloomFilter.load(self.path)
+
+
+class TestEventKeyIndex(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = util.data_dir / 'index'
+        self.db_file = util.data_dir / 'test.json'
+        util.data_dir.mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def write_events(self, ids, mode='a'):
+        with self.db_file.open(mode) as file:
+            for event_id in ids:
+                file.write(json.dumps({'id': event_id}) + '\n')
+
+    def open_index(self):
+        connection = process.EventKeyIndex.connect(self.index_dir)
+        key_index = process.EventKeyIndex(self.db_file, self.index_dir, connection, lambda e: json.loads(e)['id'], 0.01)
+        key_index.load()
+        return key_index
+
+    def test_load(self):
+        self.write_events(['1', '2', '3'])
+
+        key_index = self.open_index()
+
+        self.assertEqual(3, len(key_index))
+        self.assertIn('2', key_index)
+        self.assertNotIn('4', key_index)
+        self.assertEqual(2, key_index.stats['lookups'])
+        self.assertEqual(1, key_index.stats['negatives'] + key_index.stats['false_positives'])
+        self.assertTrue((self.index_dir / 'test.json.bloom').exists())
+
+    def test_incremental(self):
+        self.write_events(['1', '2'])
+        key_index = self.open_index()
+        key_index.connection.close()
+
+        self.write_events(['3'])
+        with patch.object(process.EventKeyIndex, '_rebuild_bloom') as rebuild:
+            key_index = self.open_index()
+            rebuild.assert_not_called()
+
+        self.assertEqual(self.db_file.stat().st_size, key_index.indexed_size)
+        for key in ['1', '2', '3']:
+            self.assertIn(key, key_index)
+
+    def test_partial_line(self):
+        self.write_events(['1'])
+        with self.db_file.open('a') as file:
+            file.write('{"id": "2"')
+
+        key_index = self.open_index()
+
+        self.assertEqual(len(json.dumps({'id': '1'})) + 1, key_index.indexed_size)
+        self.assertEqual(1, len(key_index))
+
+    def test_file_shrank(self):
+        self.write_events(['1', '2'])
+        key_index = self.open_index()
+        key_index.connection.close()
+
+        self.write_events(['3'], mode='w')
+        key_index = self.open_index()
+
+        self.assertIn('3', key_index)
+        self.assertNotIn('1', key_index)
+
+    def test_sync(self):
+        key_index = self.open_index()
+        self.assertEqual(0, len(key_index))
+
+        self.write_events(['1'])
+        key_index.sync()
+
+        self.assertIn('1', key_index)
+
+    def test_false_positive(self):
+        self.write_events(['1'])
+        key_index = self.open_index()
+
+        with patch.object(process.BloomFilter, '__contains__', return_value=True):
+            self.assertNotIn('2', key_index)
+
+        self.assertEqual(1, key_index.stats['false_positives'])
+
+
+class TestJenkinsSourceKeyIndex(unittest.TestCase):
+    def setUp(self):
+        util.settings[('process', 'key_index', True)] = True
+
+        self.data_dir = util.data_dir / 'test_dir'
+        self.data_dir.mkdir(parents=True)
+        with (self.data_dir / 'test.json').open('w') as file:
+            file.write(json.dumps({'id': '1'}) + '\n')
+
+        self.source = process.JenkinsSource('name', self.data_dir)
+
+    def tearDown(self):
+        util.settings = {}
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test(self):
+        with patch.object(process.JenkinsSource, '_get_event_key', side_effect=lambda e: json.loads(e)['id']):
+            self.source.setup()
+
+            existing = self.source.event_keys['test.json']['existing']
+            self.assertIsInstance(existing, process.EventKeyIndex)
+            self.assertIn('1', existing)
+
+            with (self.data_dir / 'test.json').open('a') as file:
+                file.write(json.dumps({'id': '2'}) + '\n')
+            with (self.data_dir / 'other.json').open('w') as file:
+                file.write(json.dumps({'id': '3'}) + '\n')
+
+            self.source.finish()
+            self.assertIsNone(self.source.key_index_connection)
+
+            source = process.JenkinsSource('name', self.data_dir)
+            source.setup()
+
+        self.assertIn('2', source.event_keys['test.json']['existing'])
+        self.assertIn('3', source.event_keys['other.json']['existing'])
+        self.assertTrue((util.index_dir / 'name' / 'keys.sqlite').exists())
+
+
 """
 Source
 """
@@ -237,7 +557,10 @@ class TestJenkinsSourceLoadEventKeys(unittest.TestCase):
         mock_load_file_keys.side_effect = self.key_return_vals
 
     def make_asserts(self):
-        self.assertEqual(self.expected_event_keys, self.source.event_keys)
+        self.assertEqual(self.expected_event_keys.keys(), self.source.event_keys.keys())
+        for basename, key_sets in self.expected_event_keys.items():
+            self.assertEqual(key_sets['existing'], self.source.event_keys[basename]['existing'])
+            assert_key_set_equal(self, key_sets['new'], self.source.event_keys[basename]['new'])
 
     def test_no_files(self):
         self.do_it()
@@ -281,7 +604,7 @@ class TestJenkinsSourceLoadDbFileEventKeys(unittest.TestCase):
             self.make_asserts(keys)
 
     def make_asserts(self, keys):
-        self.assertEqual(self.expected_keys, keys)
+        assert_key_set_equal(self, self.expected_keys, keys)
 
     def test_no_file(self):
         self.do_it()
@@ -339,7 +662,7 @@ class TestJenkinsSourceLoadNewData(unittest.TestCase):
     def test(self):
         self.file_names = ['f1', 'f2', 'f3']
 
-        self.expected_file_process_calls = [call(self.data_dir, self.source.file_stats, self.source.event_keys) for _ in self.file_names]
+        self.expected_file_process_calls = [call(self.data_dir, self.source.file_stats, self.source.event_keys, event_hook=None) for _ in self.file_names]
         self.expected_added = len(self.file_names) * 2
         self.expected_skipped = len(self.file_names)
         self.expected_logger_statement = 'INFO:JenkinsSource:Added: {0}, skipped: {1}'.format(self.expected_added, self.expected_skipped)
@@ -421,6 +744,7 @@ class TestProductSourceSetup(unittest.TestCase):
         self.source = process.ProductSource()
 
     def tearDown(self):
+        util.settings = {}
         util.rmtree(util.data_dir, no_exist_ok=True)
 
     def test_dir_no_exist(self):
@@ -432,6 +756,104 @@ class TestProductSourceSetup(unittest.TestCase):
         self.source.setup()
         self.assertTrue(util.jenkins_ft_data_dir.exists())
 
+    def test_event_hook(self):
+        self.source.setup()
+
+        self.assertIsInstance(self.source.ttr_tracker, process.TtrTracker)
+        self.assertIsInstance(self.source.summary, process.JenkinsSummary)
+        self.assertIsNone(self.source.event_hook)
+        self.assertEqual(util.jenkins_ttr_pending_dir, self.source.get_write_dir())
+
+    def test_event_hook_summary(self):
+        util.settings[('process', 'jenkins_ttr', True)] = False
+        self.source.setup()
+
+        self.assertEqual(self.source.summary.add_event, self.source.event_hook)
+        self.assertEqual(util.jenkins_data_dir, self.source.get_write_dir())
+
+    def test_event_hook_disabled(self):
+        util.settings[('process', 'jenkins_ttr', True)] = False
+        util.settings[('process', 'summary', True)] = False
+        self.source.setup()
+
+        self.assertIsNone(self.source.ttr_tracker)
+        self.assertIsNone(self.source.summary)
+        self.assertIsNone(self.source.event_hook)
+
+def make_jenkins_event(number, timestamp, result):
+    return {'ci': 'ci2', 'stage': 'Build', 'instance': 'Production', 'release': '1.0', 'number': number,
+            'timestamp': timestamp, 'result': result, 'duration': 10}
+
+
+class TestProductSourceTtr(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+        self.source = process.ProductSource()
+        self.source.setup()
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def write_pull(self, name, events):
+        path = util.new_data_dir / name / 'jenkins'
+        path.mkdir(parents=True)
+        with (path / 'Production_ci2_Build.json').open('w') as file:
+            for event in events:
+                file.write(json.dumps(event) + '\n')
+        return path
+
+    def read_ttrs(self):
+        with (util.jenkins_data_dir / 'Production_ci2_Build.json').open() as file:
+            events = [json.loads(line) for line in file]
+        return [(event['number'], event.get('ttr')) for event in events]
+
+    def load(self, path):
+        self.source.load_new_data(path, default_instance='Production', ft_info={})
+
+    def test_shuffled(self):
+        self.load(self.write_pull('190501000000', [
+            make_jenkins_event(4, 4000, 'SUCCESS'),
+            make_jenkins_event(2, 2000, 'FAILURE'),
+            make_jenkins_event(1, 1000, 'SUCCESS'),
+            make_jenkins_event(3, 3000, 'FAILURE')
+        ]))
+        self.source.finish()
+
+        self.assertEqual([(1, None), (2, None), (3, None), (4, 2.0)], self.read_ttrs())
+        self.assertEqual(0, self.source.ttr_tracker.out_of_order)
+        self.assertFalse(util.jenkins_ttr_pending_dir.exists())
+
+        summary_path = next(util.summary_data_dir.glob(process.JenkinsSummary.STAGES + '_*.csv'))
+        with summary_path.open(newline='') as file:
+            row = next(csv.DictReader(file))
+        self.assertEqual('1', row['ttr_count'])
+        self.assertEqual(2.0, float(row['ttr_total']))
+
+    def test_reverse(self):
+        pulls = [self.write_pull('190501000000', [make_jenkins_event(1, 1000, 'SUCCESS'),
+                                                  make_jenkins_event(2, 2000, 'FAILURE')]),
+                 self.write_pull('190502000000', [make_jenkins_event(2, 2000, 'FAILURE'),
+                                                  make_jenkins_event(3, 5000, 'SUCCESS')])]
+
+        for path in reversed(pulls):
+            self.load(path)
+        self.source.finish()
+
+        self.assertEqual([(1, None), (2, None), (3, 3.0)], self.read_ttrs())
+
+    def test_interrupted(self):
+        self.load(self.write_pull('190501000000', [make_jenkins_event(1, 1000, 'SUCCESS'),
+                                                   make_jenkins_event(2, 2000, 'FAILURE'),
+                                                   make_jenkins_event(3, 3000, 'SUCCESS')]))
+        self.assertFalse((util.jenkins_data_dir / 'Production_ci2_Build.json').exists())
+
+        source = process.ProductSource()
+        with self.assertLogs('ProductSource', 'WARNING'):
+            source.setup()
+
+        self.assertEqual([(1, None), (2, None), (3, 1.0)], self.read_ttrs())
+        self.assertEqual(3, len(source.event_keys['Production_ci2_Build.json']['existing']))
+
 class TestProductSourceGetDataFile(unittest.TestCase):
     def setUp(self):
         self.source = process.ProductSource()
@@ -489,6 +911,193 @@ class TestVicSourceGetDataFile(unittest.TestCase):
         self.assertEqual(path, file.path)
 
 
+"""
+TtrTracker
+"""
+def make_stage_event(timestamp, result, stage='Build', ci='ci1'):
+    return {'instance': 'Production', 'ci': ci, 'stage': stage, 'release': '1.0', 'timestamp': timestamp,
+            'result': result}
+
+
+class TestTtrTracker(unittest.TestCase):
+    def setUp(self):
+        self.tracker = process.TtrTracker(util.jenkins_ttr_state_path)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def stamp(self, events):
+        for event in events:
+            self.tracker.stamp(event)
+        return [event.get('ttr') for event in events]
+
+    def test_repair(self):
+        events = [
+            make_stage_event(1000, 'SUCCESS'),
+            make_stage_event(2000, 'FAILURE'),
+            make_stage_event(5000, 'FAILURE'),
+            make_stage_event(9000, 'SUCCESS'),
+            make_stage_event(10000, 'SUCCESS')
+        ]
+
+        self.assertEqual([None, None, None, 7, None], self.stamp(events))
+        self.assertEqual(1, self.tracker.stamped)
+
+    def test_no_earlier_success(self):
+        events = [
+            make_stage_event(1000, 'FAILURE'),
+            make_stage_event(2000, 'SUCCESS')
+        ]
+
+        self.assertEqual([None, None], self.stamp(events))
+
+    def test_groups(self):
+        events = [
+            make_stage_event(1000, 'SUCCESS'),
+            make_stage_event(2000, 'SUCCESS', ci='ci2'),
+            make_stage_event(3000, 'FAILURE'),
+            make_stage_event(4000, 'FAILURE', ci='ci2'),
+            make_stage_event(6000, 'SUCCESS', ci='ci2'),
+            make_stage_event(7000, 'SUCCESS')
+        ]
+
+        self.assertEqual([None, None, None, None, 2, 4], self.stamp(events))
+
+    def test_ignored_stage(self):
+        events = [
+            make_stage_event(1000, 'SUCCESS', stage='Pipeline'),
+            make_stage_event(2000, 'FAILURE', stage='Pipeline'),
+            make_stage_event(3000, 'SUCCESS', stage='Pipeline')
+        ]
+
+        self.assertEqual([None, None, None], self.stamp(events))
+        self.assertEqual({}, self.tracker.groups)
+
+    def test_out_of_order(self):
+        events = [
+            make_stage_event(1000, 'SUCCESS'),
+            make_stage_event(3000, 'FAILURE'),
+            make_stage_event(2000, 'SUCCESS'),
+            make_stage_event(4000, 'SUCCESS')
+        ]
+
+        self.assertEqual([None, None, None, 1], self.stamp(events))
+        self.assertEqual(1, self.tracker.out_of_order)
+
+    def test_save_load(self):
+        self.stamp([make_stage_event(1000, 'SUCCESS'), make_stage_event(2000, 'FAILURE')])
+        self.tracker.save()
+
+        tracker = process.TtrTracker(util.jenkins_ttr_state_path)
+        tracker.load([])
+        event = make_stage_event(5000, 'SUCCESS')
+        tracker.stamp(event)
+
+        self.assertEqual(3, event['ttr'])
+
+    def test_load_from_db_files(self):
+        db_dir = util.data_dir / 'test_dir'
+        db_dir.mkdir(parents=True)
+
+        db_files = [db_dir / 'a.json', db_dir / 'b.json']
+        with db_files[0].open('w') as file:
+            file.write(json.dumps(make_stage_event(3000, 'FAILURE')) + '\n')
+        with db_files[1].open('w') as file:
+            file.write(json.dumps(make_stage_event(1000, 'SUCCESS')) + '\n')
+            file.write(json.dumps(make_stage_event(2000, 'SUCCESS', stage='Pipeline')) + '\n')
+
+        self.tracker.load(db_files)
+        event = make_stage_event(4000, 'SUCCESS')
+        self.tracker.stamp(event)
+
+        self.assertEqual(1, event['ttr'])
+
+    def test_load_before(self):
+        db_dir = util.data_dir / 'test_dir'
+        db_dir.mkdir(parents=True)
+
+        db_file = db_dir / 'a.json'
+        with db_file.open('w') as file:
+            file.write(json.dumps(make_stage_event(1000, 'SUCCESS')) + '\n')
+            file.write(json.dumps(make_stage_event(2000, 'FAILURE')) + '\n')
+            file.write(json.dumps(make_stage_event(3000, 'SUCCESS')) + '\n')
+
+        self.tracker.load([db_file], before=3000)
+        event = make_stage_event(3000, 'SUCCESS')
+        self.tracker.stamp(event)
+
+        self.assertEqual(1, event['ttr'])
+
+
+"""
+JenkinsSummary
+"""
+class TestJenkinsSummary(unittest.TestCase):
+    def setUp(self):
+        self.summary = process.JenkinsSummary()
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def load_rows(self, filename):
+        with (util.summary_data_dir / filename).open(newline='') as file:
+            return list(csv.DictReader(file))
+
+    def test_add_event(self):
+        day = 86400 * 1000
+        events = [
+            dict(make_stage_event(day, 'SUCCESS'), duration=10),
+            dict(make_stage_event(day + 1, 'FAILURE'), duration=20),
+            dict(make_stage_event(day + 2, 'SUCCESS'), duration=30, ttr=5),
+            make_stage_event(day, 'SUCCESS', ci='ci2'),
+            make_stage_event(2 * day, 'ABORTED'),
+            make_stage_event(day, 'SUCCESS', stage='Pipeline')
+        ]
+
+        for event in events:
+            self.summary.add_event(event)
+
+        rows = self.summary.rows[process.JenkinsSummary.STAGES]
+        self.assertEqual(3, len(rows))
+
+        row = rows[('1970-01-02', 'Production', 'ci1', 'Build', '1.0')]
+        self.assertEqual({'day': '1970-01-02', 'summary': 'jenkins_stages', 'instance': 'Production', 'ci': 'ci1',
+                          'stage': 'Build', 'release': '1.0', 'count': 3, 'passed': 2, 'failed': 1,
+                          'duration_total': 60, 'ttr_count': 1, 'ttr_total': 5}, row)
+
+        row = rows[('1970-01-03', 'Production', 'ci1', 'Build', '1.0')]
+        self.assertEqual((1, 0, 0), (row['count'], row['passed'], row['failed']))
+
+    def test_add_scenarios(self):
+        scenarios = [
+            {'result': 'passed', 'job_instance': 'Production', 'job_ci': 'ci1', 'job_release': '1.0', 'job_timestamp': '0'},
+            {'result': 'failed', 'job_instance': 'Production', 'job_ci': 'ci1', 'job_release': '1.0', 'job_timestamp': '1'},
+            {'result': 'skipped', 'job_instance': 'Production', 'job_ci': 'ci1', 'job_release': '1.0', 'job_timestamp': '2'}
+        ]
+
+        self.summary.add_scenarios(scenarios)
+
+        row = self.summary.rows[process.JenkinsSummary.FT_SCENARIOS][('1970-01-01', 'Production', 'ci1', '1.0')]
+        self.assertEqual((3, 1, 1, 1), (row['count'], row['passed'], row['failed'], row['skipped']))
+
+    def test_write(self):
+        self.summary.add_event(make_stage_event(0, 'SUCCESS'))
+
+        self.summary.write('run1')
+
+        self.assertEqual(['jenkins_stages_run1.csv'], util.listdir(util.summary_data_dir))
+        self.assertEqual([], util.listdir(util.tmp_dir))
+
+        rows = self.load_rows('jenkins_stages_run1.csv')
+        self.assertEqual(1, len(rows))
+        self.assertEqual('1', rows[0]['count'])
+        self.assertEqual({}, self.summary.rows[process.JenkinsSummary.STAGES])
+
+    def test_write_nothing(self):
+        self.summary.write('run1')
+        self.assertEqual([], util.listdir(util.summary_data_dir))
+
+
 """
 CqSource
 """
@@ -559,19 +1168,17 @@ class TestCqSourceLoadEventKeys(unittest.TestCase):
         util.rmtree(util.data_dir, no_exist_ok=True)
 
     def do_it(self):
-        keys = []
-
         if self.existing_events is not None:
             with util.cq_events_path.open('w') as file:
                 for event in self.existing_events:
                     file.write(json.dumps(event) + '\n')
-                    keys.append(event['key'])
 
-        with patch.object(process.CqCookedEvent, 'get_key') as mock_get_key:
-            mock_get_key.side_effect = keys
+        with patch.object(process.CqCookedEvent, 'get_key', autospec=True) as mock_get_key:
+            mock_get_key.side_effect = lambda event: event['key']
             self.source._load_event_keys()
 
-        self.assertEqual(self.source.event_keys, {'new': set(), 'existing': self.expected_existing_keys})
+            assert_key_set_equal(self, set(), self.source.event_keys['new'])
+            assert_key_set_equal(self, self.expected_existing_keys, self.source.event_keys['existing'])
 
     def test_no_data_path(self):
         self.do_it()
@@ -1330,7 +1937,12 @@ class TestCqSourceOldLoadExistingData(unittest.TestCase):
 
     def make_asserts(self):
         self.assertEqual(self.expected_orig_cq_data, self.source.orig_data)
-        self.assertEqual(self.expected_orig_cq_changed_files, self.source.orig_changed_files)
+
+        expected_pairs = [(dr_id, filename) for dr_id, filenames in self.expected_orig_cq_changed_files.items()
+                          for filename in filenames]
+        self.assertEqual(len(expected_pairs), len(self.source.changed_files_index))
+        for pair in expected_pairs:
+            self.assertIn(pair, self.source.changed_files_index)
 
     def test_no_data_files(self):
         self.do_it()
@@ -1425,10 +2037,17 @@ class TestCqSourceOldLoadNewData(unittest.TestCase):
 
         self.source.load_new_data(self.file_path)
 
+        self.make_asserts()
+
     def make_asserts(self):
         self.assertEqual(self.expected_new_data, self.source.new_data)
         self.assertEqual(self.expected_new_changed_files, self.source.new_changed_files)
 
+    def seed_changed_files(self):
+        for dr_id, filenames in self.source.new_changed_files.items():
+            for filename in filenames:
+                self.source.changed_files_index.add(dr_id, filename)
+
     def test_no_new_no_old(self):
         self.do_it()
 
@@ -1442,6 +2061,7 @@ class TestCqSourceOldLoadNewData(unittest.TestCase):
             'id0': ['f1', 'f2'],
             'id1': ['f3', 'f4']
         }
+        self.seed_changed_files()
 
         self.expected_new_data = copy.deepcopy(self.source.new_data)
         self.expected_new_changed_files = copy.deepcopy(self.source.new_changed_files)
@@ -1477,6 +2097,7 @@ class TestCqSourceOldLoadNewData(unittest.TestCase):
             'id0': ['f1', 'f2'],
             'id1': ['f3', 'f4']
         }
+        self.seed_changed_files()
 
         self.drs = [
             {'id': 'id1', 'RTCC_ChangeSet.FileList.Filename': 'f4'},
@@ -1502,9 +2123,213 @@ class TestCqSourceOldLoadNewData(unittest.TestCase):
 
         self.do_it()
 
+class TestCqChangedFilesIndex(unittest.TestCase):
+    def setUp(self):
+        util.cq_data_dir.mkdir(parents=True)
+        self.index = self.new_index()
+
+    def tearDown(self):
+        util.rmtree(util.data_dir)
+
+    @staticmethod
+    def new_index():
+        return process.CqChangedFilesIndex(util.cq_changed_files_path, util.cq_changed_files_index_path)
+
+    @staticmethod
+    def write_rows(rows, mode='a'):
+        with util.cq_changed_files_path.open(mode, newline='') as file:
+            writer = csv.writer(file)
+            writer.writerows(rows)
+
+    def test_no_files(self):
+        self.index.load()
+        self.assertEqual(0, len(self.index))
+
+        self.index.save()
+        self.assertTrue(util.cq_changed_files_index_path.exists())
+
+    def test_load_csv_without_index(self):
+        self.write_rows([['id', 'file'], ['id0', 'f1'], ['id0', 'f2'], ['id1', 'f1'], ['id1', 'f1']], mode='w')
+
+        self.index.load()
+
+        self.assertEqual(3, len(self.index))
+        self.assertIn(('id0', 'f2'), self.index)
+        self.assertNotIn(('id0', 'f3'), self.index)
+
+    def test_only_new_rows_read(self):
+        self.write_rows([['id', 'file'], ['id0', 'f1']], mode='w')
+        self.index.load()
+        self.index.save()
+
+        self.write_rows([['id1', 'f2']])
+
+        index = self.new_index()
+        with patch.object(process.CqChangedFilesIndex, 'add', wraps=index.add) as mock_add:
+            index.load()
+
+        mock_add.assert_called_once_with('id1', 'f2')
+        self.assertEqual(2, len(index))
+        self.assertIn(('id0', 'f1'), index)
+        self.assertIn(('id1', 'f2'), index)
+
+    def test_append_saved(self):
+        self.write_rows([['id', 'file'], ['id0', 'f1']], mode='w')
+        self.index.load()
+        self.index.save()
+
+        self.write_rows([['id1', 'f2']])
+        self.index.add('id1', 'f2')
+        self.index.save()
+
+        index = self.new_index()
+        with patch.object(process.CqChangedFilesIndex, '_load_csv') as mock_load_csv:
+            index.load()
+
+        mock_load_csv.assert_not_called()
+        self.assertEqual(2, len(index))
+        self.assertIn(('id1', 'f2'), index)
+
+    def test_stale_index_rebuilt(self):
+        self.write_rows([['id', 'file'], ['id0', 'f1'], ['id0', 'f2']], mode='w')
+        self.index.load()
+        self.index.save()
+
+        self.write_rows([['id', 'file'], ['id1', 'f3']], mode='w')
+
+        index = self.new_index()
+        index.load()
+
+        self.assertEqual(1, len(index))
+        self.assertIn(('id1', 'f3'), index)
+
 class TestCqSourceOldProcess(unittest.TestCase):
-    # TODO
-    pass
+    def setUp(self):
+        self.source = process.CqSourceOld()
+        self.source.data_dir.mkdir(parents=True)
+
+        self.source.orig_data = {
+            'id0': {'id': 'id0', 'greeting': 'hi'},
+            'id1': {'id': 'id1', 'greeting': 'hello'}
+        }
+
+        self.source.new_data = {
+            'id1': {'id': 'id1', 'greeting': 'derp'},
+            'id2': {'id': 'id2', 'greeting': 'herp'}
+        }
+
+    def tearDown(self):
+        util.rmtree(util.data_dir)
+
+    @patch.object(process.Processor, 'create_index')
+    @patch.object(process.Processor, 'delete_index')
+    def test_full(self, mock_delete_index, mock_create_index):
+        util.cq_data_delta_dir.mkdir()
+        (util.cq_data_delta_dir / 'CQ_Data_5.csv').touch()
+
+        self.source._process()
+
+        mock_delete_index.assert_called_once_with(process.CQ_INDEX, process.PIVT_APP)
+        mock_create_index.assert_called_once_with(process.CQ_INDEX, process.PIVT_APP)
+
+        with util.cq_data_path_old.open(newline='') as file:
+            rows = list(csv.DictReader(file))
+
+        self.assertEqual(3, len(rows))
+        self.assertEqual([], list(util.cq_data_delta_dir.glob('*')))
+
+    @patch.object(process.Processor, 'create_index')
+    @patch.object(process.Processor, 'delete_index')
+    def test_deferred_index_recreation(self, mock_delete_index, mock_create_index):
+        self.source.defer_index_recreation = True
+
+        self.source._process()
+
+        mock_delete_index.assert_not_called()
+        self.assertTrue(self.source.index_recreation_pending)
+        self.assertTrue(util.cq_data_path_old.exists())
+
+        self.source.recreate_index()
+
+        mock_delete_index.assert_called_once_with(process.CQ_INDEX, process.PIVT_APP)
+        mock_create_index.assert_called_once_with(process.CQ_INDEX, process.PIVT_APP)
+        self.assertFalse(self.source.index_recreation_pending)
+
+    @patch.object(process.Processor, 'create_index')
+    @patch.object(process.Processor, 'delete_index')
+    def test_incremental(self, mock_delete_index, mock_create_index):
+        self.source.incremental = True
+
+        self.source._process()
+
+        mock_delete_index.assert_not_called()
+        mock_create_index.assert_not_called()
+
+        self.assertFalse(util.cq_data_path_old.exists())
+
+        delta_paths = list(util.cq_data_delta_dir.glob('*'))
+        self.assertEqual(1, len(delta_paths))
+
+        with delta_paths[0].open(newline='') as file:
+            rows = list(csv.DictReader(file))
+
+        version = str(process.CqSourceOld._get_delta_version(delta_paths[0]))
+        self.assertEqual([
+            {'cq_version': version, 'id': 'id1', 'greeting': 'derp'},
+            {'cq_version': version, 'id': 'id2', 'greeting': 'herp'}
+        ], rows)
+
+    @patch.object(process.Processor, 'create_index')
+    @patch.object(process.Processor, 'delete_index')
+    def test_incremental_no_changes(self, mock_delete_index, mock_create_index):
+        self.source.incremental = True
+        self.source.new_data = {'id0': {'id': 'id0', 'greeting': 'hi'}}
+
+        self.source._process()
+
+        self.assertFalse(util.cq_data_delta_dir.exists())
+
+
+class TestCqSourceOldDeltaData(unittest.TestCase):
+    def setUp(self):
+        self.source = process.CqSourceOld(incremental=True)
+        self.source.data_dir.mkdir(parents=True)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir)
+
+    def test_round_trip(self):
+        with util.cq_data_path_old.open('w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=['id', 'greeting'])
+            writer.writeheader()
+            writer.writerows([{'id': 'id0', 'greeting': 'hi'}, {'id': 'id1', 'greeting': 'hello'}])
+
+        self.source._write_delta_data([{'id': 'id1', 'greeting': 'derp'}])
+        self.source._write_delta_data([{'id': 'id1', 'greeting': 'herp'}, {'id': 'id2', 'greeting': 'hola'}])
+
+        versions = [process.CqSourceOld._get_delta_version(path) for path in self.source._get_delta_paths()]
+        self.assertEqual(2, len(versions))
+        self.assertLess(versions[0], versions[1])
+
+        self.source.load_existing_data()
+
+        self.assertEqual({
+            'id0': {'id': 'id0', 'greeting': 'hi'},
+            'id1': {'id': 'id1', 'greeting': 'herp'},
+            'id2': {'id': 'id2', 'greeting': 'hola'}
+        }, self.source.orig_data)
+
+        self.source.new_data = {'id1': {'id': 'id1', 'greeting': 'herp'}}
+        self.assertEqual([], self.source._get_changed_rows())
+
+    def test_delta_paths_sorted_numerically(self):
+        util.cq_data_delta_dir.mkdir()
+        for version in [10, 9, 100]:
+            (util.cq_data_delta_dir / 'CQ_Data_{0}.csv'.format(version)).touch()
+        (util.cq_data_delta_dir / 'CQ_Data_11.tmp').touch()
+
+        actual = [path.name for path in self.source._get_delta_paths()]
+        self.assertEqual(['CQ_Data_9.csv', 'CQ_Data_10.csv', 'CQ_Data_100.csv'], actual)
 
 class TestCqSourceOldGetUpdatedData(unittest.TestCase):
     def setUp(self):
@@ -1597,6 +2422,28 @@ class TestCqSourceOldGetUpdatedData(unittest.TestCase):
 
         self.do_it()
 
+    def test_overlay_does_not_modify_orig_data(self):
+        self.source.orig_data = {
+            'id0': {'id': 'id0', 'greeting': 'hi'}
+        }
+
+        self.source.new_data = {
+            'id0': {'id': 'id0', 'greeting': 'derp'},
+            'id1': {'id': 'id1', 'greeting': 'herp'}
+        }
+
+        self.expected_added = 1
+        self.expected_updated = 1
+
+        self.expected_updated_data = {
+            'id0': {'id': 'id0', 'greeting': 'derp'},
+            'id1': {'id': 'id1', 'greeting': 'herp'}
+        }
+
+        self.do_it()
+
+        self.assertEqual({'id0': {'id': 'id0', 'greeting': 'hi'}}, self.source.orig_data)
+
     def test_one_updated_one_added(self):
         self.source.orig_data = {
             'id0': {'id': 'id0', 'greeting': 'hi'},
@@ -1666,6 +2513,19 @@ class TestCqSourceOldDictCompare(unittest.TestCase):
 
         self.assertFalse(process.CqSourceOld._dict_compare(dict1, dict2))
 
+class TestCqSourceOldRowHash(unittest.TestCase):
+    def test_different_order(self):
+        row1 = {'id': 'id0', 'greeting': 'hi'}
+        row2 = {'greeting': 'hi', 'id': 'id0'}
+
+        self.assertEqual(process.CqSourceOld._row_hash(row1), process.CqSourceOld._row_hash(row2))
+
+    def test_different_values(self):
+        row1 = {'id': 'id0', 'greeting': 'hi'}
+        row2 = {'id': 'id0', 'greeting': 'hello'}
+
+        self.assertNotEqual(process.CqSourceOld._row_hash(row1), process.CqSourceOld._row_hash(row2))
+
 class TestCqSourceOldWriteData(unittest.TestCase):
     def setUp(self):
         self.source = process.CqSourceOld()
@@ -1952,6 +2812,33 @@ class TestArchiveLoad(unittest.TestCase):
 
         self.do_it()
 
+class TestArchiveArchive(unittest.TestCase):
+    def setUp(self):
+        util.collected_dir.mkdir(parents=True)
+        util.archive_dir.mkdir(parents=True)
+
+        self.path = util.collected_dir / '19-05-01T00-00-00_NewData.zip'
+        with zipfile.ZipFile(str(self.path), 'w') as archive:
+            archive.writestr('p1/jenkins/pipeline.json', '{}')
+
+        self.archive = process.Archive(self.path, None)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir)
+
+    def test(self):
+        self.archive._archive()
+        self.assertFalse(self.path.exists())
+        self.assertTrue((util.archive_dir / self.path.name).exists())
+
+    def test_store(self):
+        with patch.object(util, 'get_boolean_setting', return_value=True):
+            self.archive._archive()
+
+        self.assertFalse(self.path.exists())
+        self.assertFalse((util.archive_dir / self.path.name).exists())
+        self.assertEqual([self.path.name], process.ArchiveStore().names())
+
 class TestArchiveGetComponents(unittest.TestCase):
     def setUp(self):
         self.path = Path('dummy_path')
@@ -2335,6 +3222,25 @@ class TestFtInfoProcessFile(unittest.TestCase):
         with self.assertRaises(Exception):
             self.ft_info._process_file(filename, table_name, content)
 
+    def test_scenarios_summary(self):
+        self.ft_info.summary = process.JenkinsSummary()
+
+        filename = 'Production_ci1_1.7.1.0'
+        table_name = 'scenarios'
+        content = {
+            '1': {'id': '1', 'result': 'passed', 'job_instance': 'Production', 'job_ci': 'ci1', 'job_release': '1.7.1.0', 'job_timestamp': '1'},
+            '2': {'id': '2', 'result': 'failed', 'job_instance': 'Production', 'job_ci': 'ci1', 'job_release': '1.7.1.0', 'job_timestamp': '1'}
+        }
+
+        with patch.object(process.FtInfo, '_gen_ft_scenario_key', side_effect=lambda row: row['id']):
+            self.ft_info._process_file(filename, table_name, content)
+            self.ft_info._process_file(filename, table_name, content)
+
+        rows = self.ft_info.summary.rows[process.JenkinsSummary.FT_SCENARIOS]
+        self.assertEqual((2, 1, 1), (rows[('1970-01-01', 'Production', 'ci1', '1.7.1.0')]['count'],
+                                     rows[('1970-01-01', 'Production', 'ci1', '1.7.1.0')]['passed'],
+                                     rows[('1970-01-01', 'Production', 'ci1', '1.7.1.0')]['failed']))
+
     def test_features_no_existing(self):
         filename = 'Production_ci1_1.7.1.0'
         table_name = 'features'
@@ -3415,6 +4321,7 @@ class TestJsonFileProcess(unittest.TestCase):
 
         self.file_stats = {}
         self.event_keys = {}
+        self.event_hook = None
 
         self.expected_file_stats = {}
         self.expected_events = {}
@@ -3446,7 +4353,8 @@ class TestJsonFileProcess(unittest.TestCase):
         self.make_db_files()
         self.set_mocks()
 
-        added, skipped = self.data_file.process(self.data_dir, self.file_stats, self.event_keys)
+        added, skipped = self.data_file.process(self.data_dir, self.file_stats, self.event_keys,
+                                                event_hook=self.event_hook)
 
         self.make_asserts(added, skipped)
 
@@ -3487,6 +4395,36 @@ class TestJsonFileProcess(unittest.TestCase):
 
         self.do_it()
 
+    def test_event_hook(self):
+        self.data_file.events = {
+            '1': {'id': '1'},
+            '2': {'id': '2'}
+        }
+
+        self.event_keys['test.json'] = {
+            'existing': {'1'},
+            'new': set()
+        }
+
+        self.event_hook = lambda event: event.update({'ttr': 5})
+
+        self.expected_file_stats = {
+            'test.json': {
+                'added': 1,
+                'skipped': 1
+            }
+        }
+
+        self.expected_events = [
+            {'id': '1'},
+            {'id': '2', 'ttr': 5}
+        ]
+
+        self.expected_added = 1
+        self.expected_skipped = 1
+
+        self.do_it()
+
     def test_no_new(self):
         self.data_file.events = {
             '1': {'id': '1'},
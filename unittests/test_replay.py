@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pivt import process
+from pivt import replay
+import unittest
+import os
+import csv
+import json
+import datetime
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+from unittest.mock import MagicMock
+
+from pivt.util import util
+from pivt.process import Archive, Processor
+from pivt.archive_store import ArchiveStore
+from pivt.conf_manager import ConfManager
+
+orig_conf_load = ConfManager.load
+
+
+def setUpModule():
+    os.environ['PIVT_HOME'] = tempfile.mkdtemp().replace('\\', '/')
+
+    ConfManager.load = MagicMock()
+
+    util.setup()
+
+
+def tearDownModule():
+    util.teardown()
+    util.rmtree(os.environ['PIVT_HOME'], no_exist_ok=True)
+    if 'PIVT_HOME' in os.environ:
+        del os.environ['PIVT_HOME']
+
+    ConfManager.load = orig_conf_load
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+def jenkins_event(number, timestamp, result):
+    return {'ci': 'ci2', 'ss': 'ss5', 'stage': 'Build', 'instance': 'Production', 'number': number,
+            'timestamp': timestamp, 'result': result, 'duration': 10}
+
+
+def ft_event(number, timestamp, report_names):
+    with (Path(__file__).parent / 'resources' / 'cucumber_reports' / 'simple.json').open() as file:
+        report = json.load(file)
+
+    return dict(jenkins_event(number, timestamp, 'SUCCESS'), stage='FunctionalTest',
+                reports={report_name: report for report_name in report_names})
+
+
+def make_archive(name, pulls, cq_rows=None):
+    """
+    Write a new data archive to the collected directory.
+    :param name: archive name
+    :param pulls: dict of pull directory name to dict of source to dict of file name to list of events
+    :param cq_rows: rows of the archive's CQ_Data.csv, if any
+    :return: path to the archive
+    """
+    util.collected_dir.mkdir(parents=True, exist_ok=True)
+    path = util.collected_dir / name
+
+    with zipfile.ZipFile(str(path), 'w') as archive:
+        for pull_name, sources in pulls.items():
+            for source, files in sources.items():
+                for filename, events in files.items():
+                    lines = ''.join(json.dumps(event) + '\n' for event in events)
+                    archive.writestr('{0}/{1}/{2}'.format(pull_name, source, filename), lines)
+
+        if cq_rows:
+            lines = ['id,state'] + ['{0},{1}'.format(dr_id, state) for dr_id, state in cq_rows]
+            archive.writestr('CQ_Data.csv', '\n'.join(lines) + '\n')
+
+    return path
+
+
+def make_archives():
+    make_archive('19-05-01T00-00-00_NewData.zip', {
+        '190501000000': {
+            'jenkins': {'Production_ci2_Build.json': [jenkins_event(1, 1556668800000, 'SUCCESS'),
+                                                      jenkins_event(2, 1556668900000, 'FAILURE')]},
+            'vic_status': {'status.json': [[{'ci_allocation': 'a', 'status': 'up'}]]}
+        }
+    }, cq_rows=[('DR1', 'open')])
+
+    make_archive('19-05-02T00-00-00_NewData.zip', {
+        '190502000000': {
+            'jenkins': {'Production_ci2_Build.json': [jenkins_event(2, 1556668900000, 'FAILURE'),
+                                                      jenkins_event(3, 1556755200000, 'SUCCESS')]},
+            'ins': {'ins_develop.json': [{'pipeline': 'p', 'id': '1', 'timestamp': 1556755200000}]}
+        },
+        '190502120000': {
+            'jenkins': {'Production_ci2_FunctionalTest.json': [ft_event(1, 1556755200000, ['a.json'])]}
+        }
+    }, cq_rows=[('DR1', 'closed'), ('DR2', 'open')])
+
+    make_archive('19-05-03T00-00-00_NewData.zip', {
+        '190503000000': {
+            'jenkins': {'Production_ci2_Build.json': [jenkins_event(3, 1556755200000, 'SUCCESS'),
+                                                      jenkins_event(4, 1556841600000, 'FAILURE')],
+                        'Production_ci2_Deploy.json': [dict(jenkins_event(1, 1556841600000, 'SUCCESS'),
+                                                            stage='Deploy')],
+                        'Production_ci2_FunctionalTest.json': [ft_event(1, 1556755200000, ['a.json']),
+                                                               ft_event(2, 1556841600000, ['a.json', 'b.json'])]},
+            'vic_status': {'status.json': [[{'ci_allocation': 'b', 'status': 'down'}]]}
+        }
+    })
+
+
+def process_archives():
+    """
+    Process the collected archives the way process.py does, moving them into the archive directory.
+    """
+    util.archive_dir.mkdir(parents=True, exist_ok=True)
+    archive_paths = sorted(util.collected_dir.glob('*'))
+
+    sources = replay.create_sources(replay.SOURCES)
+    for source in sources.values():
+        source.setup()
+    sources['cq_old'].load_existing_data()
+
+    for archive_path in archive_paths:
+        Archive(archive_path, sources).load(archive_paths, False)
+
+    for source in sources.values():
+        source.finish()
+
+
+def read_db():
+    """
+    Read every DB file. Summary files are named after the run that wrote them, so only their rows are compared.
+    :return: dict of path relative to the DB directory to contents
+    """
+    contents = {}
+    summary_rows = []
+
+    for path in sorted(util.db_dir.glob('**/*')):
+        if not path.is_file():
+            continue
+
+        if path.parent == util.summary_data_dir:
+            with path.open(newline='') as file:
+                summary_rows.extend(sorted(tuple(row.items()) for row in csv.DictReader(file)))
+        else:
+            contents[str(path.relative_to(util.db_dir))] = path.read_text()
+
+    contents['summary'] = sorted(summary_rows)
+    return contents
+
+
+@patch.object(Processor, 'create_index')
+@patch.object(Processor, 'delete_index')
+class TestReplayer(unittest.TestCase):
+    def setUp(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def tearDown(self):
+        util.rmtree(util.data_dir, no_exist_ok=True)
+
+    def test_get_archives(self, *_):
+        make_archives()
+        process_archives()
+
+        store = ArchiveStore()
+        store.ingest(util.archive_dir / '19-05-01T00-00-00_NewData.zip')
+        (util.archive_dir / '19-05-01T00-00-00_NewData.zip').unlink()
+        (util.archive_dir / 'notes_NewData.zip').write_bytes(b'')
+
+        with self.assertLogs('Replayer', 'WARNING'):
+            archives = replay.Replayer().get_archives()
+
+        self.assertEqual([('19-05-01T00-00-00_NewData.zip', None),
+                          ('19-05-02T00-00-00_NewData.zip', util.archive_dir / '19-05-02T00-00-00_NewData.zip'),
+                          ('19-05-03T00-00-00_NewData.zip', util.archive_dir / '19-05-03T00-00-00_NewData.zip')],
+                         archives)
+
+        replayer = replay.Replayer(start=datetime.datetime(2019, 5, 2), end=datetime.datetime(2019, 5, 3))
+        self.assertEqual(['19-05-02T00-00-00_NewData.zip', '19-05-03T00-00-00_NewData.zip'],
+                         [name for name, _ in replayer.get_archives()])
+
+    def test_matches_process(self, *_):
+        make_archives()
+        process_archives()
+        expected = read_db()
+
+        ttr_events = [json.loads(line) for line in expected['jenkins/Production_ci2_Build.json'].splitlines()]
+        self.assertEqual([None, None, 86300.0, None], [event.get('ttr') for event in ttr_events])
+
+        util.rmtree(util.db_dir)
+        self.assertEqual(3, replay.Replayer().run())
+        self.assertEqual(expected, read_db())
+        self.assertFalse(util.replay_dir.exists())
+        self.assertEqual(3, len(list(util.archive_dir.glob('*'))))
+
+    def test_matches_process_in_parallel(self, *_):
+        make_archives()
+        process_archives()
+        expected = read_db()
+
+        util.rmtree(util.db_dir)
+        self.assertEqual(3, replay.Replayer(workers=2).run())
+        self.assertEqual(expected, read_db())
+
+    def test_replaces_existing(self, *_):
+        make_archives()
+        process_archives()
+        expected = read_db()
+
+        (util.jenkins_data_dir / 'Production_ci2_Other.json').write_text('{}\n')
+        util.jenkins_ttr_state_path.write_text('[]')
+
+        replay.Replayer().run()
+
+        self.assertEqual(expected, read_db())
+        self.assertNotEqual('[]', util.jenkins_ttr_state_path.read_text())
+
+    def test_keep_existing(self, *_):
+        make_archives()
+        process_archives()
+        expected = read_db()
+
+        db_file = util.jenkins_data_dir / 'Production_ci2_Build.json'
+        lines = db_file.read_text().splitlines(keepends=True)
+        db_file.write_text(''.join(lines[:2] + lines[3:]))
+
+        replayer = replay.Replayer(sources=['jenkins'], start=datetime.datetime(2019, 5, 2), keep_existing=True)
+        replayer.run()
+
+        events = [json.loads(line) for line in db_file.read_text().splitlines()]
+        self.assertEqual([1, 2, 4, 3], [event['number'] for event in events])
+        self.assertEqual(expected['jenkins/Production_ci2_Deploy.json'],
+                         (util.jenkins_data_dir / 'Production_ci2_Deploy.json').read_text())
+
+    def test_range_replaces_events(self, *_):
+        make_archives()
+        process_archives()
+        expected = read_db()
+
+        db_file = util.jenkins_data_dir / 'Production_ci2_Build.json'
+        events = [json.loads(line) for line in db_file.read_text().splitlines()]
+        events[0]['duration'] = 99
+        events[2]['result'] = 'ABORTED'
+        del events[3]
+        db_file.write_text(''.join(json.dumps(event) + '\n' for event in events))
+
+        ft_file = util.jenkins_ft_data_dir / 'Production_ci2_Not Assigned_scenarios.csv'
+        ft_file.write_text(ft_file.read_text().splitlines(keepends=True)[0])
+        state = sorted(json.loads(util.jenkins_ttr_state_path.read_text()))
+
+        replayer = replay.Replayer(sources=['jenkins'], start=datetime.datetime(2019, 5, 2),
+                                   end=datetime.datetime(2019, 5, 3))
+        self.assertFalse(replayer.keep_existing)
+        replayer.run()
+
+        actual = read_db()
+        events = [json.loads(line) for line in actual.pop('jenkins/Production_ci2_Build.json').splitlines()]
+        self.assertEqual([(1, 99), (2, 10), (3, 10)], [(event['number'], event['duration']) for event in events])
+        self.assertEqual(['SUCCESS', 'FAILURE', 'SUCCESS'], [event['result'] for event in events])
+        self.assertEqual(86300.0, events[2]['ttr'])
+
+        # every group has events after the range, so the live TTR state still holds
+        self.assertEqual(state, sorted(json.loads(util.jenkins_ttr_state_path.read_text())))
+
+        del expected['jenkins/Production_ci2_Build.json']
+        ft_path = 'jenkins/ft/Production_ci2_Not Assigned_scenarios.csv'
+        expected[ft_path] = ''.join(line for line in expected[ft_path].splitlines(keepends=True)
+                                    if '1556841600000' not in line)
+
+        # replaced events and FT rows follow the kept ones
+        for path in ['jenkins/Production_ci2_FunctionalTest.json',
+                     'jenkins/ft/Production_ci2_Not Assigned_features.csv']:
+            self.assertEqual(sorted(expected.pop(path).splitlines()), sorted(actual.pop(path).splitlines()))
+        self.assertEqual(expected, actual)
+
+    def test_keep_existing_seeds_ttr_state(self, *_):
+        make_archives()
+        process_archives()
+
+        state = json.loads(util.jenkins_ttr_state_path.read_text())
+        group = [['Production', 'ci9', 'Build', None],
+                 {'timestamp': 1556668800000, 'last_result': 'FAILURE', 'first_failure_time': 1556668800000}]
+        util.jenkins_ttr_state_path.write_text(json.dumps(state + [group]))
+
+        replay.Replayer(sources=['jenkins'], keep_existing=True).run()
+
+        self.assertIn(group, json.loads(util.jenkins_ttr_state_path.read_text()))
+
+    def test_recreates_cq_index_after_swap(self, mock_delete_index, mock_create_index):
+        make_archives()
+        process_archives()
+        expected = read_db()
+
+        def delete_index(index, app):
+            self.assertEqual(expected['cq/CQ_Data.csv'], util.cq_data_path_old.read_text())
+
+        mock_delete_index.side_effect = delete_index
+        util.rmtree(util.cq_data_dir)
+
+        replay.Replayer(sources=['cq']).run()
+
+        mock_delete_index.assert_called_once_with(process.CQ_INDEX, process.PIVT_APP)
+        mock_create_index.assert_called_once_with(process.CQ_INDEX, process.PIVT_APP)
+
+    def test_failed_swap_rolls_back(self, mock_delete_index, mock_create_index):
+        make_archives()
+        process_archives()
+
+        (util.jenkins_data_dir / 'Production_ci2_Other.json').write_text('{}\n')
+        expected = read_db()
+        state_path = util.jenkins_ttr_state_path
+        expected_state = state_path.read_text()
+
+        orig_replace = Path.replace
+
+        def replace(path, target):
+            if Path(target) == state_path and Path(path).parent == util.replay_dir / 'index':
+                raise OSError('No space left on device')
+            return orig_replace(path, target)
+
+        with patch.object(Path, 'replace', autospec=True, side_effect=replace):
+            with self.assertRaises(OSError):
+                replay.Replayer().run()
+
+        self.assertEqual(expected, read_db())
+        self.assertEqual(expected_state, util.jenkins_ttr_state_path.read_text())
+        self.assertFalse(util.replay_dir.exists())
+        mock_delete_index.assert_not_called()
+        mock_create_index.assert_not_called()
+
+    def test_failed_roll_back_keeps_old(self, *_):
+        make_archives()
+        process_archives()
+
+        state_path = util.jenkins_ttr_state_path
+        old_ins_dir = util.replay_dir / 'old' / util.ins_data_dir.relative_to(util.db_dir)
+        orig_replace = Path.replace
+
+        def replace(path, target):
+            if (Path(target) == state_path and Path(path).parent == util.replay_dir / 'index') or \
+                    Path(path) == old_ins_dir:
+                raise OSError('No space left on device')
+            return orig_replace(path, target)
+
+        with patch.object(Path, 'replace', autospec=True, side_effect=replace):
+            with self.assertRaises(OSError), self.assertLogs('Replayer', 'ERROR'):
+                replay.Replayer().run()
+
+        self.assertTrue((old_ins_dir / 'ins_develop.json').exists())
+
+        old_dir = util.replay_dir / 'old'
+
+        with self.assertRaises(RuntimeError):
+            replay.Replayer().run()
+        self.assertTrue(old_dir.exists())
+
+    def test_sources(self, *_):
+        make_archives()
+        process_archives()
+        expected = read_db()
+
+        util.rmtree(util.vic_status_data_dir)
+        (util.jenkins_data_dir / 'Production_ci2_Other.json').write_text('{}\n')
+
+        replay.Replayer(sources=['vic_status']).run()
+
+        actual = read_db()
+        self.assertEqual(expected['vic_status/status.json'], actual['vic_status/status.json'])
+        self.assertEqual('{}\n', actual['jenkins/Production_ci2_Other.json'])
+
+    def test_no_archives(self, *_):
+        util.jenkins_data_dir.mkdir(parents=True)
+        (util.jenkins_data_dir / 'Production_ci2_Build.json').write_text('{}\n')
+
+        with self.assertLogs('Replayer', 'WARNING'):
+            self.assertEqual(0, replay.Replayer().run())
+
+        self.assertTrue((util.jenkins_data_dir / 'Production_ci2_Build.json').exists())
+
+
+class TestMain(unittest.TestCase):
+    def test(self):
+        with patch.object(replay, 'Replayer') as mock_replayer:
+            replay.main(['--start', '2019-05-01', '--end', '2019-05-02', '--sources', 'jenkins', 'cq',
+                         '--workers', '3'])
+
+        mock_replayer.assert_called_once_with(['jenkins', 'cq'], datetime.datetime(2019, 5, 1),
+                                              datetime.datetime(2019, 5, 3), 3, False)
+        mock_replayer.return_value.run.assert_called_once_with()
+
+    def test_default_workers(self):
+        with patch.object(replay, 'Replayer') as mock_replayer, patch.object(os, 'cpu_count', return_value=5):
+            replay.main(['--keep-existing'])
+
+        mock_replayer.assert_called_once_with(replay.SOURCES, None, None, 5, True)
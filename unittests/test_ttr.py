@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import random
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'splunk-app', 'bin'))
+
+import ttr
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+EARLIEST_TIME = 1000
+
+
+def make_command(streaming=False, lookbeyondboundary=False, **options):
+    command = ttr.TtrCommand()
+    command.options.reset()
+    command.ttrfield = 'ttr'
+    command.resultfield = 'result'
+    command.passvalue = 'SUCCESS'
+    command.fieldnames = ['ci', 'stage']
+    command.streaming = streaming
+    command.lookbeyondboundary = lookbeyondboundary
+    for name, value in options.items():
+        setattr(command, name, value)
+
+    command._metadata = MagicMock()
+    command._metadata.searchinfo.earliest_time = EARLIEST_TIME
+    command._record_writer = MagicMock()
+    return command
+
+
+def make_records(rng, count):
+    """
+    Make random events in descending time order, some of them before EARLIEST_TIME.
+    """
+    timestamps = rng.sample(range(EARLIEST_TIME - 500, EARLIEST_TIME + 1000), count)
+    timestamps.sort(reverse=True)
+
+    return [{'id': i, '_time': str(timestamp), 'ci': rng.choice(['ci1', 'ci2']),
+             'stage': rng.choice(['Build', 'Deploy']), 'result': rng.choice(['SUCCESS', 'FAILURE', 'ABORTED'])}
+            for i, timestamp in enumerate(timestamps)]
+
+
+def run(command, records):
+    """
+    Run the command over copies of the records.
+    :return: list of (id, ttr) in output order
+    """
+    return [(record['id'], record['ttr']) for record in command.transform([dict(record) for record in records])]
+
+
+class TestStreamTtr(unittest.TestCase):
+    def test_matches_batch(self):
+        rng = random.Random(0)
+
+        for trial in range(500):
+            records = make_records(rng, rng.randint(0, 60))
+
+            batch = run(make_command(), records)
+            stream = run(make_command(streaming=True), records)
+
+            self.assertEqual(sorted(batch), sorted(stream), 'trial {0}'.format(trial))
+
+    def test_matches_batch_lookbeyondboundary(self):
+        rng = random.Random(1)
+
+        for trial in range(500):
+            records = make_records(rng, rng.randint(0, 60))
+            options = {'lookbeyondtime': rng.choice([0, 100, 300])}
+
+            batch = run(make_command(lookbeyondboundary=True, **options), records)
+            stream = run(make_command(streaming=True, lookbeyondboundary=True, **options), records)
+
+            self.assertEqual(sorted(batch), sorted(stream), 'trial {0}'.format(trial))
+            for record_id, _ in stream:
+                self.assertGreaterEqual(float(records[record_id]['_time']), EARLIEST_TIME)
+
+    def test_ttr(self):
+        records = [
+            {'id': 0, '_time': '1400', 'ci': 'ci1', 'stage': 'Build', 'result': 'SUCCESS'},
+            {'id': 1, '_time': '1300', 'ci': 'ci1', 'stage': 'Build', 'result': 'FAILURE'},
+            {'id': 2, '_time': '1200', 'ci': 'ci1', 'stage': 'Build', 'result': 'FAILURE'},
+            {'id': 3, '_time': '1100', 'ci': 'ci1', 'stage': 'Build', 'result': 'SUCCESS'},
+            {'id': 4, '_time': '900', 'ci': 'ci1', 'stage': 'Build', 'result': 'FAILURE'},
+            {'id': 5, '_time': '800', 'ci': 'ci1', 'stage': 'Build', 'result': 'SUCCESS'}
+        ]
+
+        expected = [(0, 200.0), (1, None), (2, None), (3, 200.0)]
+
+        self.assertEqual(expected, sorted(run(make_command(streaming=True, lookbeyondboundary=True), records)))
+        self.assertEqual(expected, sorted(run(make_command(lookbeyondboundary=True), records)))
+
+        # without looking beyond the boundary, events before it are returned too
+        expected = [(0, 200.0), (1, None), (2, None), (3, 200.0), (4, None), (5, None)]
+        self.assertEqual(expected, sorted(run(make_command(streaming=True), records)))
+
+    def test_out_of_order(self):
+        rng = random.Random(2)
+        records = make_records(rng, 40)
+        shuffled = list(records)
+        rng.shuffle(shuffled)
+
+        # the first two events are both within the time window
+        swapped = [records[1], records[0]] + records[2:]
+
+        # the batch mode sorts the events itself when it doesn't look beyond the boundary
+        self.assertEqual(sorted(run(make_command(), records)), sorted(run(make_command(), shuffled)))
+
+        for command in (make_command(streaming=True), make_command(streaming=True, lookbeyondboundary=True),
+                        make_command(lookbeyondboundary=True)):
+            with self.assertRaises(Exception):
+                run(command, swapped)
+
+
+class TestLookBeyondLimits(unittest.TestCase):
+    records = [
+        {'id': 0, '_time': '1400', 'ci': 'ci1', 'stage': 'Build', 'result': 'SUCCESS'},
+        {'id': 1, '_time': '1300', 'ci': 'ci2', 'stage': 'Build', 'result': 'SUCCESS'},
+        {'id': 2, '_time': '1200', 'ci': 'ci1', 'stage': 'Build', 'result': 'FAILURE'},
+        {'id': 3, '_time': '1100', 'ci': 'ci2', 'stage': 'Build', 'result': 'FAILURE'},
+        {'id': 4, '_time': '900', 'ci': 'ci1', 'stage': 'Build', 'result': 'SUCCESS'},
+        {'id': 5, '_time': '800', 'ci': 'ci2', 'stage': 'Build', 'result': 'SUCCESS'}
+    ]
+
+    def test_unbounded_by_default(self):
+        for streaming in (False, True):
+            command = make_command(streaming=streaming, lookbeyondboundary=True)
+            self.assertEqual([(0, 200.0), (1, 200.0), (2, None), (3, None)], sorted(run(command, self.records)))
+            command._record_writer.write_message.assert_not_called()
+
+    def test_evicted(self):
+        for streaming in (False, True):
+            command = make_command(streaming=streaming, lookbeyondboundary=True, lookbeyondgroups=1)
+            run(command, self.records)
+            command._record_writer.write_message.assert_called_once_with(
+                'WARN', 'ttr: stopped looking beyond the boundary for {0} groups at the lookbeyondgroups or '
+                        'lookbeyondevents limit; their TTR values may be missing', 1)
@@ -15,11 +15,14 @@
 # limitations under the License.
 
 from pivt.util import util
+from pivt.util import BatchWriter
+from pivt.util import Profiler
 import unittest
 from unittest.mock import patch
 from unittest.mock import MagicMock
 import os
 import re
+import json
 import tempfile
 from pathlib import Path
 from pivt.conf_manager import ConfManager
@@ -105,6 +108,9 @@ class TestSetup(unittest.TestCase):
         assert util.collected_dir ==            pivt_home / 'var/data/collected'
         assert util.db_dir ==                   pivt_home / 'var/data/data'
         assert util.new_data_dir ==             pivt_home / 'var/data/newdata'
+        assert util.tmp_dir ==                  pivt_home / 'var/data/tmp'
+        assert util.index_dir ==                pivt_home / 'var/data/index'
+        assert util.jenkins_ttr_state_path ==   pivt_home / 'var/data/index/jenkins_ttr.json'
 
         assert util.jenkins_data_dir ==         pivt_home / 'var/data/data/jenkins'
         assert util.jenkins_ft_data_dir ==      pivt_home / 'var/data/data/jenkins/ft'
@@ -114,10 +120,14 @@ class TestSetup(unittest.TestCase):
         assert util.cq_data_dir ==              pivt_home / 'var/data/data/cq'
         assert util.cq_data_path_old ==         pivt_home / 'var/data/data/cq/CQ_Data.csv'
         assert util.cq_changed_files_path ==    pivt_home / 'var/data/data/cq/CQ_Changed_Files.csv'
+        assert util.cq_changed_files_index_path == pivt_home / 'var/data/data/cq/CQ_Changed_Files.idx'
+        assert util.cq_data_delta_dir ==        pivt_home / 'var/data/data/cq/delta'
 
         assert util.cq_data_path ==             pivt_home / 'var/data/data/cq/drs.csv'
         assert util.cq_events_path ==           pivt_home / 'var/data/data/cq/events.json'
 
+        assert util.summary_data_dir ==         pivt_home / 'var/data/data/summary'
+
         self.assertTrue(util.log_dir.exists())
         self.assertEqual(['pivt.log'], util.listdir(util.log_dir))
 
@@ -475,3 +485,167 @@ class TestInnerStringify(unittest.TestCase):
         }
 
         self.assertEqual(expected, util.inner_stringify(value))
+
+
+class TestBatchWriter(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.tmp_dir = self.dir / 'tmp'
+        self.path = self.dir / 'data' / 'test.json'
+        self.path.parent.mkdir()
+
+    def tearDown(self):
+        util.rmtree(self.dir, no_exist_ok=True)
+
+    def read_lines(self):
+        with self.path.open() as file:
+            return file.read().splitlines()
+
+    def test_bad_fsync_policy(self):
+        with self.assertRaises(Exception):
+            BatchWriter(self.path, fsync='sometimes')
+
+    def test_nothing_written(self):
+        with BatchWriter(self.path, tmp_dir=self.tmp_dir):
+            pass
+
+        self.assertFalse(self.path.exists())
+
+    def test_new_file(self):
+        with BatchWriter(self.path, tmp_dir=self.tmp_dir) as writer:
+            writer.write_json({'id': '1'})
+            writer.write_line('hello')
+            self.assertFalse(self.path.exists())
+
+        self.assertEqual(['{"id": "1"}', 'hello'], self.read_lines())
+        self.assertEqual([], util.listdir(self.tmp_dir))
+
+    def test_existing_file(self):
+        with self.path.open('w') as file:
+            file.write('existing\n')
+
+        with BatchWriter(self.path, tmp_dir=self.tmp_dir) as writer:
+            writer.write_line('new')
+
+        self.assertEqual(['existing', 'new'], self.read_lines())
+
+    def test_batches(self):
+        with BatchWriter(self.path, buffer_size=10, tmp_dir=self.tmp_dir) as writer:
+            for i in range(5):
+                writer.write_line('line{0}'.format(i))
+
+                if i == 1:
+                    self.assertEqual(['line0', 'line1'], self.read_lines())
+
+        self.assertEqual(3, writer.batches)
+        self.assertEqual(['line0', 'line1', 'line2', 'line3', 'line4'], self.read_lines())
+
+    @patch('os.fsync')
+    def test_fsync_never(self, mock_fsync):
+        with BatchWriter(self.path, buffer_size=1, fsync=BatchWriter.FSYNC_NEVER) as writer:
+            writer.write_line('a')
+            writer.write_line('b')
+
+        mock_fsync.assert_not_called()
+
+    @patch('os.fsync')
+    def test_fsync_batch(self, mock_fsync):
+        with BatchWriter(self.path, buffer_size=1, fsync=BatchWriter.FSYNC_BATCH) as writer:
+            writer.write_line('a')
+            writer.write_line('b')
+
+        self.assertEqual(2, mock_fsync.call_count)
+
+    @patch('os.fsync')
+    def test_fsync_close(self, mock_fsync):
+        with BatchWriter(self.path, buffer_size=1, fsync=BatchWriter.FSYNC_CLOSE) as writer:
+            writer.write_line('a')
+            writer.write_line('b')
+
+        self.assertEqual(1, mock_fsync.call_count)
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.profiler = Profiler()
+
+    def tearDown(self):
+        if self.profiler.cprofile is not None:
+            self.profiler.cprofile.disable()
+        util.rmtree(self.dir, no_exist_ok=True)
+
+    def test_disabled(self):
+        with self.profiler.span('a'):
+            self.profiler.count(added=1)
+
+        self.assertEqual({}, self.profiler.phases)
+        self.assertEqual({}, self.profiler.stacks)
+
+    def test_nested_spans(self):
+        self.profiler.enable()
+
+        with self.profiler.span('a'):
+            with self.profiler.span('b'):
+                self.profiler.count(added=2, skipped=1)
+            with self.profiler.span('b'):
+                self.profiler.count(added=3)
+            self.profiler.count(rows=4)
+
+        self.assertEqual(['a', 'b'], sorted(self.profiler.phases))
+        self.assertEqual(1, self.profiler.phases['a']['calls'])
+        self.assertEqual(2, self.profiler.phases['b']['calls'])
+        self.assertEqual({'rows': 4}, self.profiler.phases['a']['counts'])
+        self.assertEqual({'added': 5, 'skipped': 1}, self.profiler.phases['b']['counts'])
+        self.assertGreaterEqual(self.profiler.phases['a']['wall'], self.profiler.phases['b']['wall'])
+
+        self.assertEqual(['a', 'a;b'], sorted(self.profiler.stacks))
+        a_wall = self.profiler.phases['a']['wall']
+        self.assertAlmostEqual(a_wall, self.profiler.stacks['a'] + self.profiler.stacks['a;b'])
+
+    def test_span_exception(self):
+        self.profiler.enable()
+
+        with self.assertRaises(ValueError):
+            with self.profiler.span('a'):
+                raise ValueError()
+
+        self.assertEqual(1, self.profiler.phases['a']['calls'])
+        self.assertEqual([], self.profiler._open_spans)
+
+    def test_count_no_span(self):
+        self.profiler.enable()
+        self.profiler.count(added=1)
+        self.assertEqual({}, self.profiler.phases)
+
+    def test_write(self):
+        self.profiler.enable()
+
+        with self.profiler.span('a'):
+            with self.profiler.span('b'):
+                self.profiler.count(added=2)
+
+        paths = self.profiler.write(self.dir / 'log', 'test')
+
+        self.assertEqual(['.json', '.folded'], [path.suffix for path in paths])
+
+        with paths[0].open() as file:
+            summary = json.load(file)
+        self.assertEqual(['a', 'b'], list(summary['phases']))
+        self.assertEqual({'added': 2}, summary['phases']['b']['counts'])
+
+        with paths[1].open() as file:
+            lines = file.read().splitlines()
+        self.assertEqual(['a', 'a;b'], [line.split(' ')[0] for line in lines])
+        self.assertTrue(all(line.split(' ')[1].isdigit() for line in lines))
+
+    def test_write_cprofile(self):
+        self.profiler.enable(cprofile=True)
+
+        with self.profiler.span('a'):
+            pass
+
+        paths = self.profiler.write(self.dir, 'test')
+
+        self.assertEqual(['.json', '.folded', '.pstats'], [path.suffix for path in paths])
+        self.assertTrue(paths[2].exists())
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 The Aerospace Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pivt import zip_writer
+import unittest
+import os
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+
+from pivt.util import util
+
+
+class TestParallelZipWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.src_dir = self.tmp_dir / 'src'
+        (self.src_dir / 'pull' / 'jenkins').mkdir(parents=True)
+        (self.src_dir / 'pull' / 'empty').mkdir()
+        (self.src_dir / 'pull' / 'jenkins' / 'text.json').write_bytes(b'{"result": "SUCCESS"}\n' * 20000)
+        (self.src_dir / 'pull' / 'jenkins' / 'random.bin').write_bytes(os.urandom(100000))
+        (self.src_dir / 'pull' / 'empty.txt').write_bytes(b'')
+        (self.src_dir / 'CQ_Data.csv').write_text('id,state\n')
+        self.path = self.tmp_dir / 'out.zip'
+
+    def tearDown(self):
+        util.rmtree(self.tmp_dir)
+
+    def assert_archive_matches(self):
+        with zipfile.ZipFile(str(self.path)) as archive:
+            self.assertIsNone(archive.testzip())
+            names = set(archive.namelist())
+            for path in self.src_dir.rglob('*'):
+                arcname = path.relative_to(self.src_dir).as_posix()
+                if path.is_dir():
+                    self.assertIn(arcname + '/', names)
+                else:
+                    self.assertEqual(path.read_bytes(), archive.read(arcname))
+        return names
+
+    def test_deflate(self):
+        with zip_writer.ParallelZipWriter(self.path, workers=2, chunk_size=16384) as writer:
+            writer.write_tree(self.src_dir)
+
+        names = self.assert_archive_matches()
+        self.assertEqual(7, len(names))
+        self.assertLess(self.path.stat().st_size, 150000)
+
+    def test_stored(self):
+        with zip_writer.ParallelZipWriter(self.path, compression=zipfile.ZIP_STORED, chunk_size=16384) as writer:
+            writer.write_tree(self.src_dir)
+
+        self.assert_archive_matches()
+        with zipfile.ZipFile(str(self.path)) as archive:
+            self.assertEqual(zipfile.ZIP_STORED, archive.getinfo('CQ_Data.csv').compress_type)
+
+    def test_old_timestamp(self):
+        os.utime(str(self.src_dir / 'CQ_Data.csv'), (0, 0))
+
+        with zip_writer.ParallelZipWriter(self.path, workers=2) as writer:
+            writer.write_tree(self.src_dir)
+
+        self.assert_archive_matches()
+        with zipfile.ZipFile(str(self.path)) as archive:
+            self.assertEqual((1980, 1, 1, 0, 0, 0), archive.getinfo('CQ_Data.csv').date_time)
+
+    def test_abort(self):
+        with self.assertRaises(RuntimeError):
+            with zip_writer.ParallelZipWriter(self.path, workers=2) as writer:
+                writer.write_tree(self.src_dir)
+                raise RuntimeError()
+        self.assertFalse(self.path.exists())
+
+    def test_write_stream(self):
+        data = b'{"result": "SUCCESS"}\n' * 5000
+        methods = [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA]
+
+        with zip_writer.ParallelZipWriter(self.path, compression=zipfile.ZIP_STORED, workers=1) as writer:
+            for method in methods:
+                info = zipfile.ZipInfo('member{0}.json'.format(method), (2019, 5, 1, 12, 0, 0))
+                info.compress_type = method
+                info.file_size = len(data)
+                writer.write_stream(info, (data[i:i + 4096] for i in range(0, len(data), 4096)))
+                self.assertEqual(zlib.crc32(data), info.CRC)
+
+        with zipfile.ZipFile(str(self.path)) as archive:
+            self.assertIsNone(archive.testzip())
+            for method in methods:
+                info = archive.getinfo('member{0}.json'.format(method))
+                self.assertEqual(method, info.compress_type)
+                self.assertEqual(data, archive.read(info))